@@ -0,0 +1,159 @@
+'''
+Benchmarks the download pipeline end to end against a local stand-in for the CDS API
+(see: fake_server.FakeCDSServer): CMIP6Request.download, CMIP6Request.unzip_file
+and download_requests, with a configurable queue latency, bandwidth and failure rate.
+
+Usage:
+    python -m benchmarks.bench_pipeline --requests 32 --workers 8 --latency 0.5 --bandwidth-mb 50
+
+Prints one JSON record per stage and run: throughput, latency percentiles (seconds per request,
+with the p50 and p95 of each pipeline stage for download_requests) and peak memory,
+both python allocations (tracemalloc, unless --no-trace) and the process's maximum
+resident set size. The server runs in the same process, so both include its share.
+'''
+import io
+import json
+import time
+import resource
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.fake_server import FakeCDSServer
+from climate_data.copernicus.metrics import Events
+from climate_data.copernicus.request import CMIP6Request, Status, download_requests
+
+from benchmarks.bench_unzip import build_zip
+
+PERCENTILES = (50, 90, 95, 99)
+
+def build_requests(n: int, years: int) -> list[CMIP6Request]:
+    '''Builds n distinct monthly requests of a number of years, over one model after another.'''
+    models = list(cmip6.Models)
+    return [CMIP6Request(models[i % len(models)], cmip6.Experiments.HISTORICAL,
+                         cmip6.HISTORY_YEARS[(i // len(models)) * years:
+                                             (i // len(models) + 1) * years],
+                         (23, 100, 13, 108)) for i in range(n)]
+
+@contextlib.contextmanager
+def measured(trace: bool):
+    '''Measures the wall time and peak memory of a block, into the dictionary yielded.'''
+    record = {}
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield record
+    finally:
+        record['seconds'] = round(time.perf_counter() - start, 4)
+        if trace:
+            record['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+        # kilobytes on linux.
+        record['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, 1)
+
+def summary(stage: str, record: dict[str, any], count: int, latencies: list[float], size: int,
+            succeeded: int, settings: dict[str, any]) -> dict[str, any]:
+    '''Returns a stage's JSON record, latency percentiles are None if no latencies are given.'''
+    seconds = record.pop('seconds')
+    percentiles = np.percentile(latencies, PERCENTILES) if latencies else [None] * len(PERCENTILES)
+    return {'benchmark': 'pipeline', 'stage': stage, **settings,
+            'succeeded': succeeded, 'seconds': seconds,
+            'requests_per_s': round(count / seconds, 2),
+            'mb_per_s': round(size / 2**20 / seconds, 2),
+            **{f'p{p}_s': None if v is None else round(float(v), 4)
+               for p, v in zip(PERCENTILES, percentiles)},
+            **record}
+
+def bench_download(server: FakeCDSServer, directory: Path,
+                   args) -> tuple[dict, list[float], int, list[CMIP6Request]]:
+    '''Downloads requests one at a time with CMIP6Request.download.'''
+    requests = build_requests(args.requests, args.years)
+    directory.mkdir()
+    provider = server.provider()
+    latencies = []
+    with measured(not args.no_trace) as record:
+        for r in requests:
+            start = time.perf_counter()
+            r.download(r.create_directories(directory), provider=provider)
+            latencies.append(time.perf_counter() - start)
+    provider.close()
+    zips = [r.file_chain[0] for r in requests if r.status == Status.SUCCESS]
+    size = sum(Path(z).stat().st_size for z in zips)
+    return record, latencies, size, requests
+
+def bench_unzip(requests: list[CMIP6Request], args) -> tuple[dict, list[float], int]:
+    '''Unzips each downloaded zip again with CMIP6Request.unzip_file.'''
+    done = [r for r in requests if r.status == Status.SUCCESS]
+    latencies = []
+    with measured(not args.no_trace) as record:
+        for r in done:
+            start = time.perf_counter()
+            r.unzip_file(r.file_chain[0], overwrite=True)
+            latencies.append(time.perf_counter() - start)
+    size = sum(Path(r.file_chain[-1]).stat().st_size for r in done)
+    return record, latencies, size
+
+def bench_batch(server: FakeCDSServer, directory: Path, args) -> tuple[dict, list[float], int, int]:
+    '''Downloads requests as one batch with download_requests, latencies are from its events.'''
+    requests = build_requests(args.requests, args.years)
+    directory.mkdir()
+    provider = server.provider()
+    events = Events()
+    with measured(not args.no_trace) as record:
+        paths = download_requests(requests, directory, max_workers=args.workers,
+                                  provider=provider, events=events)
+    provider.close()
+    record['stages'] = events.summary.report()['stages']
+    batch = events.summary
+    return record, batch.durations('total'), batch.transferred(), sum(map(bool, paths))
+
+def main():
+    '''Runs the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=16)
+    parser.add_argument('--years', type=int, default=10, help='years per request.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each job runs.')
+    parser.add_argument('--bandwidth-mb', type=float, default=None, help='MB/s per transfer.')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--max-active', type=int, default=None, help='jobs running at once.')
+    parser.add_argument('--payload-mb', type=int, default=0,
+                        help='serve a fixed zip of this size, instead of synthetic NetCDF.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-trace', action='store_true', help='skip tracemalloc.')
+    parser.add_argument('--directory', default=None)
+    args = parser.parse_args()
+    settings = {'requests': args.requests, 'workers': args.workers, 'latency': args.latency,
+                'bandwidth_mb': args.bandwidth_mb, 'failure_rate': args.failure_rate,
+                'drop_rate': args.drop_rate, 'max_active': args.max_active}
+    payload = None
+    if args.payload_mb:
+        with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+            build_zip(Path(tmp) / 'payload.zip', args.payload_mb * 2**20, deflate=False)
+            payload = (Path(tmp) / 'payload.zip').read_bytes()
+    for run in range(args.repeat):
+        server = FakeCDSServer(args.latency, args.bandwidth_mb and args.bandwidth_mb * 2**20,
+                               args.failure_rate, args.drop_rate, args.max_active,
+                               payload=payload, seed=run)
+        with server, tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+            record, latencies, size, requests = bench_download(server, Path(tmp) / 'serial', args)
+            succeeded = sum(r.status == Status.SUCCESS for r in requests)
+            print(json.dumps(summary('download', record, args.requests, latencies, size,
+                                     succeeded, settings)))
+            record, latencies, size = bench_unzip(requests, args)
+            print(json.dumps(summary('unzip_file', record, len(latencies), latencies, size,
+                                     len(latencies), settings)))
+            record, latencies, size, succeeded = bench_batch(server, Path(tmp) / 'batch', args)
+            print(json.dumps(summary('download_requests', record, args.requests, latencies, size,
+                                     succeeded, settings)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Benchmarks building a large sweep of requests: a list of CMIP6Requests (as build_CMIP6Requests
+builds), a list of CompactRequests, and streaming them from iter_CMIP6Requests,
+expanded to CMIP6Requests a batch at a time (as download_compact sends them).
+
+Usage:
+    python -m benchmarks.bench_requests --requests 100000
+
+Prints one JSON record per method and run, with the seconds taken and the peak memory
+traced (tracemalloc), in total and per request.
+'''
+import json
+import time
+import argparse
+import itertools
+import tracemalloc
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.compact import BATCH_SIZE, CompactRequest, iter_CMIP6Requests
+
+def locations(n: int):
+    '''Yields n distinct one degree high bounding boxes, like a sweep over countries.'''
+    for i in range(n):
+        north = -89 + i % 179
+        west = -180 + (i // 179) % 359
+        yield (north + 1, west, north, west + 1)
+
+def sweep(n: int, compact: bool):
+    '''Yields n monthly requests, over every model and experiment for each location.'''
+    models, experiments = list(cmip6.Models), list(cmip6.Experiments)
+    per_location = len(models) * len(experiments)
+    requests = iter_CMIP6Requests(locations(-(-n // per_location)), [cmip6.Variables.TEMP],
+                                  [cmip6.TemporalResolutions.MONTHLY], models, experiments,
+                                  compact=compact)
+    return itertools.islice(requests, n)
+
+def run(method: str, n: int, batch_size: int) -> tuple[float, int]:
+    '''Returns the seconds taken and the peak bytes traced by a method.'''
+    tracemalloc.start()
+    start = time.perf_counter()
+    if method == 'list':
+        requests = list(sweep(n, compact=False))
+    elif method == 'compact_list':
+        requests = list(sweep(n, compact=True))
+    else: # stream
+        requests = sweep(n, compact=True)
+        while [r.expand() for r in itertools.islice(requests, batch_size)]:
+            pass # each batch is released before the next is expanded.
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del requests
+    return seconds, peak
+
+def main():
+    '''Runs the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    CompactRequest() # import and cache warm up, outside of the measurements.
+    for _ in range(args.repeat):
+        for method in ('list', 'compact_list', 'stream'):
+            seconds, peak = run(method, args.requests, args.batch_size)
+            print(json.dumps({
+                'benchmark': 'requests', 'method': method, 'requests': args.requests,
+                'batch_size': args.batch_size if method == 'stream' else None,
+                'seconds': round(seconds, 4),
+                'requests_per_s': round(args.requests / seconds, 1),
+                'peak_traced_mb': round(peak / 2**20, 2),
+                'bytes_per_request': round(peak / args.requests, 1)}))
+
+if __name__ == '__main__':
+    main()
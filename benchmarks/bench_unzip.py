@@ -0,0 +1,59 @@
+'''
+Benchmarks CMIP6Request.unzip_file: streaming vs. extract-and-rename.
+
+Usage:
+    python -m benchmarks.bench_unzip --size-mb 4096 --directory /mnt/share/tmp
+
+Prints one JSON record per run, use --directory to measure a network filesystem.
+'''
+import os
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+from pathlib import Path
+
+from climate_data.copernicus.request import CMIP6Request, Status
+
+def build_zip(path: Path, size: int, deflate: bool) -> None:
+    '''Writes a zip holding a single .nc member of size bytes.'''
+    block = os.urandom(2**20)
+    compression = zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED
+    with zipfile.ZipFile(path, 'w', compression) as zip_ref:
+        with zip_ref.open('data.nc', 'w', force_zip64=True) as member:
+            for _ in range(size // len(block)):
+                member.write(block)
+
+def run(zippath: Path, stream: bool) -> float:
+    '''Returns the seconds taken to unzip, the extracted file is removed.'''
+    request = CMIP6Request()
+    request.status = Status.DOWNLOADED
+    start = time.perf_counter()
+    extracted = request.unzip_file(zippath, f'stream_{stream}', stream=stream)
+    elapsed = time.perf_counter() - start
+    Path(extracted).unlink()
+    return elapsed
+
+def main():
+    '''Runs the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=2048)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--deflate', action='store_true')
+    parser.add_argument('--directory', default=None)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        zippath = Path(tmp) / 'archive.zip'
+        build_zip(zippath, args.size_mb * 2**20, args.deflate)
+        for _ in range(args.repeat):
+            for stream in (False, True):
+                seconds = run(zippath, stream)
+                print(json.dumps({
+                    'benchmark': 'unzip', 'path': 'stream' if stream else 'extract_rename',
+                    'size_mb': args.size_mb, 'deflate': args.deflate,
+                    'seconds': round(seconds, 4),
+                    'mb_per_s': round(args.size_mb / seconds, 1)}))
+
+if __name__ == '__main__':
+    main()
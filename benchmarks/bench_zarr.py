@@ -0,0 +1,85 @@
+'''
+Benchmarks reads of a converted Zarr store against the CDS NetCDF layout:
+the full time series of single grid cells, and single time step maps.
+
+Usage:
+    python -m benchmarks.bench_zarr --years 165 --lat 180 --lon 360 --directory /mnt/share/tmp
+
+Prints one JSON record per run, use --directory to measure a network filesystem.
+'''
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from climate_data.copernicus.convert import ZarrConverter, open_store
+
+def build_netcdf(path: Path, years: int, lat: int, lon: int) -> None:
+    '''Writes a monthly dataset chunked one time step at a time, like the CDS files.'''
+    time_index = pd.date_range('1850-01-01', periods=years * 12, freq='MS')
+    data = np.random.default_rng(0).random((time_index.size, lat, lon), dtype='float32')
+    ds = xr.Dataset({'tas': (('time', 'lat', 'lon'), data)},
+                    coords={'time': time_index, 'lat': np.linspace(-89.5, 89.5, lat),
+                            'lon': np.linspace(-179.5, 179.5, lon)})
+    ds.to_netcdf(path, encoding={'tas': {'zlib': True, 'chunksizes': (1, lat, lon)}},
+                 unlimited_dims=['time'])
+
+def read_points(ds: xr.Dataset, points: np.ndarray) -> None:
+    '''Reads the full series of each grid cell.'''
+    for i, j in points:
+        ds['tas'].isel(lat=i, lon=j).values # pylint: disable=expression-not-assigned
+
+def read_maps(ds: xr.Dataset, steps: np.ndarray) -> None:
+    '''Reads the map at each time step.'''
+    for t in steps:
+        ds['tas'].isel(time=t).values # pylint: disable=expression-not-assigned
+
+def timed(read, open_dataset, selection) -> float:
+    '''Returns the seconds taken to open a dataset and read a selection.'''
+    start = time.perf_counter()
+    with open_dataset() as ds:
+        read(ds, selection)
+    return time.perf_counter() - start
+
+def main():
+    '''Runs the benchmark.'''
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--years', type=int, default=165)
+    parser.add_argument('--lat', type=int, default=90)
+    parser.add_argument('--lon', type=int, default=180)
+    parser.add_argument('--tile', type=int, default=16)
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--directory', default=None)
+    args = parser.parse_args()
+    rng = np.random.default_rng(1)
+    points = np.column_stack([rng.integers(0, args.lat, args.reads),
+                              rng.integers(0, args.lon, args.reads)])
+    steps = rng.integers(0, args.years * 12, args.reads)
+    with tempfile.TemporaryDirectory(dir=args.directory) as tmp:
+        path = Path(tmp) / 'cmip6' / 'tas' / 'monthly' / 'bench_historical_185001-201412.nc'
+        path.parent.mkdir(parents=True)
+        build_netcdf(path, args.years, args.lat, args.lon)
+        start = time.perf_counter()
+        store = ZarrConverter(Path(tmp) / 'zarr', {'time': args.years * 12, 'lat': args.tile,
+                                                   'lon': args.tile}).convert(path)
+        print(json.dumps({'benchmark': 'zarr', 'read': 'convert',
+                          'seconds': round(time.perf_counter() - start, 4)}))
+        layouts = {'netcdf': lambda: xr.open_dataset(path),
+                   'zarr': lambda: open_store(store)}
+        for _ in range(args.repeat):
+            for read, selection in ((read_points, points), (read_maps, steps)):
+                for layout, open_dataset in layouts.items():
+                    seconds = timed(read, open_dataset, selection)
+                    print(json.dumps({
+                        'benchmark': 'zarr', 'read': read.__name__, 'layout': layout,
+                        'reads': args.reads, 'seconds': round(seconds, 4),
+                        'ms_per_read': round(1000 * seconds / args.reads, 2)}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+'''
+Area weighted country aggregation of gridded files into country time series.
+
+Countries are their bounding boxes (see: countries.CountryIndex), each grid cell is weighted
+by its area (cos-latitude) inside the box, so partly covered cells count in proportion.
+'''
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from climate_data.countries import INDEX
+
+def grid_fingerprint(lat: np.ndarray, lon: np.ndarray) -> str:
+    '''Returns a short hash identifying a lat/lon grid.'''
+    digest = hashlib.sha256()
+    for values in (lat, lon):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        digest.update(b'|')
+    return digest.hexdigest()[:16]
+
+def cell_edges(centers: np.ndarray) -> np.ndarray:
+    '''Returns the n + 1 edges of cells with the given (sorted) centers.'''
+    if centers.size == 1:
+        return np.array([centers[0] - 0.5, centers[0] + 0.5])
+    middle = (centers[1:] + centers[:-1]) / 2
+    return np.concatenate([[2 * centers[0] - middle[0]], middle, [2 * centers[-1] - middle[-1]]])
+
+def overlap(edges: np.ndarray, low: float, high: float) -> tuple[np.ndarray, np.ndarray]:
+    '''Returns the lower and upper bounds of each cell clipped to [low, high] (equal if outside).'''
+    lower = np.clip(np.minimum(edges[:-1], edges[1:]), low, high)
+    upper = np.clip(np.maximum(edges[:-1], edges[1:]), low, high)
+    return lower, upper
+
+def country_weights(country: str, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    '''
+    Returns the (lat, lon) area weights of a country's bounding box on a grid:
+    the spherical area of each cell inside the box, in units of the earth's radius squared.
+
+    Note:
+        Countries are names or ISO codes, longitudes may be -180 to 180 or 0 to 360, in any order.
+    '''
+    w, s, e, n = INDEX.bounds(country)
+    south, north = overlap(np.clip(cell_edges(np.asarray(lat, dtype=float)), -90, 90), s, n)
+    lon = (np.asarray(lon, dtype=float) + 180) % 360 - 180
+    order = np.argsort(lon)
+    west, east = overlap(cell_edges(lon[order]), w, e)
+    widths = np.empty_like(lon)
+    widths[order] = np.radians(east - west)
+    heights = np.sin(np.radians(north)) - np.sin(np.radians(south))
+    return np.outer(heights, widths)
+
+class MaskCache:
+    '''
+    Country weight arrays for each model grid, computed once and persisted as .npz files
+    (one per grid fingerprint and country), so repeat aggregations skip building them.
+
+    Note:
+        [1] Arrays are also held in memory, hits and misses count lookups served or built.
+        [2] Countries are keyed by their name (see: CountryIndex.lookup),
+            so names in any case and ISO codes share one entry.
+    '''
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._arrays: dict[tuple[str, str], np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, fingerprint: str, country: str) -> Path:
+        '''Returns the .npz path of a grid and country's weights.'''
+        name = ''.join(c if c.isalnum() else '_' for c in country)
+        return self.directory / f'{fingerprint}_{name}.npz'
+
+    def weights(self, country: str, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        '''Returns a country's weights on a grid (see: country_weights), from the cache if held.'''
+        country = INDEX.lookup(country) # one entry per country, whatever its case or ISO code.
+        fingerprint = grid_fingerprint(lat, lon)
+        key = (fingerprint, country)
+        with self._lock:
+            if key in self._arrays:
+                self.hits += 1
+                return self._arrays[key]
+        path = self.path(fingerprint, country)
+        if path.exists():
+            with np.load(path) as data:
+                weights = data['weights']
+            hit = True
+        else:
+            weights = country_weights(country, lat, lon)
+            partial = path.with_suffix(f'.{threading.get_ident()}.part.npz')
+            np.savez_compressed(partial, weights=weights)
+            partial.replace(path)
+            hit = False
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._arrays[key] = weights
+        return weights
+
+def aggregate(ds: xr.Dataset, countries: list[str], variable: None|str = None,
+              cache: None|MaskCache = None) -> xr.DataArray:
+    '''
+    Returns the area weighted mean of a gridded variable over each country,
+    with the dimensions other than lat and lon (e.g. time) and a country dimension.
+
+    Note:
+        [1] variable defaults to the dataset's only data variable with lat and lon dimensions.
+        [2] Missing values are skipped, the mean is weighted by the remaining cells.
+    '''
+    lat_name = next(n for n in ('lat', 'latitude') if n in ds.dims)
+    lon_name = next(n for n in ('lon', 'longitude') if n in ds.dims)
+    if variable is None:
+        names = [n for n, v in ds.data_vars.items()
+                 if lat_name in v.dims and lon_name in v.dims]
+        if len(names) != 1:
+            raise ValueError(f'Expected one gridded variable, found {names}, choose a variable.')
+        variable = names[0]
+    lat, lon = ds[lat_name].values, ds[lon_name].values
+    weights = np.stack([cache.weights(c, lat, lon) if cache is not None else
+                        country_weights(c, lat, lon) for c in countries])
+    da = ds[variable].transpose(..., lat_name, lon_name)
+    values = da.values
+    valid = ~np.isnan(values)
+    totals = np.tensordot(np.where(valid, values, 0.0), weights, axes=([-2, -1], [1, 2]))
+    norms = np.tensordot(valid.astype(weights.dtype), weights, axes=([-2, -1], [1, 2]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(norms > 0, totals / norms, np.nan)
+    dims = [d for d in da.dims if d not in (lat_name, lon_name)]
+    return xr.DataArray(means, dims=[*dims, 'country'],
+                        coords={**{d: da[d] for d in dims if d in da.coords},
+                                'country': list(countries)},
+                        name=variable, attrs=da.attrs)
+
+def aggregate_file(path: str, countries: list[str], variable: None|str = None,
+                   cache: None|MaskCache = None, target: None|str = None) -> xr.DataArray:
+    '''Aggregates a downloaded NetCDF file (see: aggregate), written to a target if provided.'''
+    with xr.open_dataset(path) as ds:
+        result = aggregate(ds, countries, variable, cache)
+    if target is not None:
+        result.to_netcdf(target)
+    return result
@@ -0,0 +1,117 @@
+'''
+Locally stored matrix of the model, experiment, variable and temporal resolution
+combinations the CDS holds, so impossible requests are dropped before they are queued.
+'''
+import json
+import time
+import itertools
+import threading
+from pathlib import Path
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.client import ClientProvider, default_provider
+
+FILE_NAME = 'availability.json'
+'''Availability file name, in the base directory.'''
+
+KEYS = ('model', 'experiment', 'variable', 'temporal_resolution')
+'''CDS request fields that identify a combination.'''
+
+ALL_VALUES: dict[str, list[str]] = {
+    'model': cmip6.Models.to_list(), 'experiment': cmip6.Experiments.to_list(),
+    'variable': [v.value for v in cmip6.Variables],
+    'temporal_resolution': [t.value for t in cmip6.TemporalResolutions]}
+'''Values a constraint without one of the KEYS allows.'''
+
+UNAVAILABLE_ERRORS: tuple[str, ...] = ('no data available', 'no data matching', 'no matching data',
+                                       'data not available', 'data is not available',
+                                       'not produced a valid combination')
+'''
+Lower case fragments of CDS errors that mean a combination does not exist,
+generic invalid request errors (e.g. a wrong field) are not recorded (see: retry.INVALID_ERRORS).
+'''
+
+def combination(request: dict[str, any]) -> tuple[str, str, str, str]:
+    '''Returns the (model, experiment, variable, temporal resolution) of a CDS request dictionary.'''
+    return tuple(request[k] for k in KEYS)
+
+def is_unavailable_error(error: None|Exception) -> bool:
+    '''Returns True if a request error means the CDS does not hold its data (i.e. not transient).'''
+    return error is not None and any(e in str(error).lower() for e in UNAVAILABLE_ERRORS)
+
+class Availability:
+    '''
+    The combinations the CDS holds, from its published constraints (see: refresh),
+    corrected by what downloads observe (see: record).
+
+    Note:
+        [1] Lookups are set memberships: True if held, False if not, None if unknown
+            (no constraints loaded and nothing observed), unknown combinations are allowed.
+        [2] Observations take precedence over the constraints, refresh() clears them.
+        [3] The matrix is stored as JSON in the base directory, call save() to write it.
+    '''
+    def __init__(self, base_directory: str, file_name: str = FILE_NAME):
+        self.path = Path(base_directory) / file_name
+        self._lock = threading.Lock()
+        self.constraints: list[dict[str, list[str]]] = []
+        self.refreshed: None|float = None
+        self.held: set[tuple[str, ...]] = set()
+        self.observed: dict[tuple[str, ...], bool] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            self.set_constraints(data.get('constraints', []), data.get('refreshed'))
+            self.observed = {tuple(k): True for k in data.get('available', [])}
+            self.observed.update({tuple(k): False for k in data.get('unavailable', [])})
+
+    def set_constraints(self, constraints: list[dict[str, list[str]]],
+                        refreshed: None|float = None) -> None:
+        '''Replaces the constraints (CDS constraints.json format) and rebuilds the lookup set.'''
+        held = set()
+        for constraint in constraints:
+            held.update(itertools.product(*(constraint.get(k, ALL_VALUES[k]) for k in KEYS)))
+        with self._lock:
+            self.constraints = constraints
+            self.refreshed = refreshed
+            self.held = held
+
+    def refresh(self, provider: None|ClientProvider = None) -> int:
+        '''
+        Downloads the dataset's constraints from the CDS, clears observations and saves,
+        returns the number of held combinations.
+        '''
+        client = (provider or default_provider()).get()
+        constraints = client.client.get_collection(cmip6.DATASET).constraints
+        self.set_constraints(constraints, time.time())
+        with self._lock:
+            self.observed = {}
+        self.save()
+        return len(self.held)
+
+    def status(self, request: dict[str, any]) -> None|bool:
+        '''Returns True if the CDS holds a CDS request's combination, False if not, None if unknown.'''
+        key = combination(request)
+        with self._lock:
+            if key in self.observed:
+                return self.observed[key]
+            if self.constraints:
+                return key in self.held
+        return None
+
+    def available(self, request: dict[str, any]) -> bool:
+        '''Returns False only if the combination is known not to be held.'''
+        return self.status(request) is not False
+
+    def record(self, request: dict[str, any], available: bool) -> None:
+        '''Records an observed success or (non transient) failure of a combination.'''
+        with self._lock:
+            self.observed[combination(request)] = available
+
+    def save(self) -> None:
+        '''Writes the matrix to its JSON file.'''
+        with self._lock:
+            data = {'refreshed': self.refreshed, 'constraints': self.constraints,
+                    'available': sorted(k for k, v in self.observed.items() if v),
+                    'unavailable': sorted(k for k, v in self.observed.items() if not v)}
+        partial = self.path.with_suffix('.part')
+        partial.write_text(json.dumps(data))
+        partial.replace(self.path)
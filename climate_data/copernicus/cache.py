@@ -0,0 +1,191 @@
+'''
+Local cache of Copernicus CDS responses.
+
+Responses are stored under a hash of the request payload, dataset, and file format,
+so repeated requests are served from disk instead of the CDS.
+Requests covered by a larger cached response are served by subsetting it locally.
+'''
+import os
+import json
+import shutil
+import hashlib
+import threading
+from enum import Enum
+from pathlib import Path
+
+from climate_data.copernicus.subset import subset_zip
+
+DEFAULT_MAX_BYTES = 50 * 2**30
+'''Default cache size limit (50 GB).'''
+
+class Source(Enum):
+    '''Where a request's data came from.'''
+    REMOTE = 'remote'   # downloaded from the CDS.
+    CACHE = 'cache'     # identical cached response.
+    SUBSET = 'subset'   # cut from a larger cached response.
+    MANIFEST = 'manifest' # completed by an earlier run of the batch (see: manifest).
+    INDEX = 'index'     # held by an already downloaded file (see: index).
+    EXTENDED = 'extended' # missing years added to an already downloaded file (see: extend).
+    MERGED = 'merged'   # cut from a request merged with others in its batch (see: merging).
+
+def request_payload(request: dict[str, any], dataset: str, file_format: str) -> dict[str, any]:
+    '''Returns a JSON serializable description of a CDS request.'''
+    return {'dataset': dataset, 'format': file_format,
+            'request': {k: list(v) if isinstance(v, (tuple, list)) else v
+                        for k, v in request.items()}}
+
+def request_key(request: dict[str, any], dataset: str, file_format: str) -> str:
+    '''Returns a canonical hash of a CDS request payload, dataset, and file format.'''
+    payload = request_payload(request, dataset, file_format)
+    text = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def covers(cached: dict[str, any], wanted: dict[str, any]) -> bool:
+    '''
+    Returns True if the data for the wanted request payload is contained in the
+    cached payload (see: request_payload), i.e. the same dataset, format, variable,
+    model, experiment and temporal resolution, an enclosing area,
+    and a superset of years, months and days.
+    '''
+    if cached['dataset'] != wanted['dataset'] or cached['format'] != wanted['format']:
+        return False
+    a, b = cached['request'], wanted['request']
+    for k in ('variable', 'temporal_resolution', 'model', 'experiment'):
+        if a.get(k) != b.get(k):
+            return False
+    for k in ('year', 'month', 'day'):
+        if not set(b.get(k) or ()) <= set(a.get(k) or ()):
+            return False
+    n, w, s, e = a['area']
+    n2, w2, s2, e2 = b['area']
+    return n >= n2 and w <= w2 and s <= s2 and e >= e2
+
+def link_or_copy(source: Path, target: Path) -> None:
+    '''Hardlinks source to target, copies it if the filesystem does not allow links.'''
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+class ResponseCache:
+    '''
+    Size-bounded, least recently used store of downloaded CDS responses.
+
+    Note:
+        [1] Entries are served into the create_directories layout by hardlink (or copy).
+        [2] Recency is tracked with file modification times, so it survives restarts.
+        [3] hits and misses count exact lookups since the cache was opened,
+            subset_hits counts the misses that were served by subsetting a larger entry.
+        [4] Each entry has a .json sidecar holding its request payload (see: request_payload).
+    '''
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.subset_hits = 0
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        '''Returns the store path of a cache entry.'''
+        return self.directory / f'{key}.zip'
+
+    def payload_path(self, key: str) -> Path:
+        '''Returns the path of a cache entry's request payload sidecar.'''
+        return self.directory / f'{key}.json'
+
+    def entries(self) -> list[Path]:
+        '''Returns cache entries, least recently used first.'''
+        return sorted(self.directory.glob('*.zip'), key=lambda p: p.stat().st_mtime)
+
+    @property
+    def size(self) -> int:
+        '''Total bytes held in the cache.'''
+        return sum(p.stat().st_size for p in self.entries())
+
+    def get(self, key: str, target: str) -> bool:
+        '''Copies a cached response to target, returns False on a cache miss.'''
+        with self._lock:
+            entry = self.path(key)
+            if not entry.exists():
+                self.misses += 1
+                return False
+            os.utime(entry) # mark as most recently used.
+            link_or_copy(entry, Path(target))
+            self.hits += 1
+            return True
+
+    def find_superset(self, payload: dict[str, any]) -> None|str:
+        '''
+        Returns the key of the smallest cached entry covering the request payload,
+        or None if there is none.
+        '''
+        best, best_area = None, float('inf')
+        for sidecar in self.directory.glob('*.json'):
+            key = sidecar.stem
+            if not self.path(key).exists():
+                continue
+            try:
+                cached = json.loads(sidecar.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if covers(cached, payload):
+                n, w, s, e = cached['request']['area']
+                if (n - s) * (e - w) < best_area:
+                    best, best_area = key, (n - s) * (e - w)
+        return best
+
+    def get_subset(self, payload: dict[str, any], target: str) -> bool:
+        '''
+        Writes the subset of a larger cached response covering the request payload
+        to target, returns False if no cached response covers it.
+        '''
+        with self._lock:
+            key = self.find_superset(payload)
+            if key is None:
+                return False
+            os.utime(self.path(key)) # mark as most recently used.
+            # link under the lock, so the entry cannot be evicted while it is subset.
+            tmp = Path(target).with_suffix('.source.tmp')
+            link_or_copy(self.path(key), tmp)
+        try:
+            subset_zip(tmp, target, payload['request'], payload['format'])
+        finally:
+            tmp.unlink()
+        with self._lock:
+            self.subset_hits += 1
+        return True
+
+    def put(self, key: str, source: str, payload: None|dict[str, any] = None) -> None:
+        '''
+        Adds a downloaded response (and its request payload, if provided) to the cache,
+        then evicts entries over the size limit.
+        '''
+        with self._lock:
+            tmp = self.directory / f'{key}.tmp'
+            if tmp.exists():
+                tmp.unlink()
+            link_or_copy(Path(source), tmp)
+            os.replace(tmp, self.path(key))
+            os.utime(self.path(key))
+            if payload is not None:
+                self.payload_path(key).write_text(json.dumps(payload), encoding='utf-8')
+            self._evict()
+
+    def remove(self, key: str) -> None:
+        '''Removes a response (e.g. one found corrupt) and its request payload from the cache.'''
+        with self._lock:
+            self.path(key).unlink(missing_ok=True)
+            self.payload_path(key).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        '''Removes least recently used entries until the cache fits in max_bytes.'''
+        entries = self.entries()
+        total = sum(p.stat().st_size for p in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            entry.unlink()
+            self.payload_path(entry.stem).unlink(missing_ok=True)
@@ -0,0 +1,154 @@
+'''
+Catalog of the CMIP6 files downloaded under a base directory,
+following the create_directories and name_file layout:
+    base_directory/cmip6/<variable>/<time_step>/<model>_<experiment>_<start>-<end>.nc
+
+Selections open lazily as dask chunked xarray objects
+(requires dask: pip install "climate-data[dask]"), no data is read until it is computed.
+'''
+import os
+import re
+from pathlib import Path
+from dataclasses import dataclass
+
+import numpy as np
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.subset import grid
+
+FILE_PATTERN = re.compile(
+    rf'^(?P<model>\w+?)_(?P<experiment>{"|".join(cmip6.Experiments.to_list())})'
+    rf'_(?P<start>\d{{6,8}})-(?P<end>\d{{6,8}}){re.escape(cmip6.FileFormats.NETCDF.value)}$')
+'''Matches file names created by CMIP6Request.name_file.'''
+
+DEFAULT_CHUNKS: dict[str, int] = {'time': 120}
+'''Default dask chunks, i.e. 10 years of a monthly time series.'''
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    '''A downloaded CMIP6 file.'''
+    path: Path
+    variable: str
+    time_step: str
+    model: str
+    experiment: str
+    start: str
+    end: str
+
+def parse_path(path: Path) -> None|CatalogEntry:
+    '''Returns the catalog entry for a file in the download layout, None if it is not one.'''
+    match = FILE_PATTERN.match(path.name)
+    if match is None:
+        return None
+    return CatalogEntry(path, path.parent.parent.name, path.parent.name, **match.groupdict())
+
+def covering(entries: list[CatalogEntry]) -> list[CatalogEntry]:
+    '''
+    Returns the entries (of one series, sorted by start) needed to cover their time span,
+    dropping files whose span another file already holds (e.g. one later extended).
+    '''
+    kept: list[CatalogEntry] = []
+    for e in sorted(entries, key=lambda e: (e.start, -int(e.end))):
+        if kept and e.end <= kept[-1].end:
+            continue
+        kept.append(e)
+    return kept
+
+def _values(items: None|list) -> None|set[str]:
+    '''Returns enum members or strings as a set of strings, None selects everything.'''
+    if items is None:
+        return None
+    if not isinstance(items, (list, tuple, set)):
+        items = [items]
+    return {i.value if hasattr(i, 'value') else i for i in items}
+
+class Catalog:
+    '''
+    Index of the CMIP6 files under a base directory.
+
+    Note:
+        [1] The tree is scanned once, when the catalog is created (see: refresh).
+        [2] Only the cmip6/<variable>/<time_step> folders are listed,
+            sub-folders (e.g. zip, chunks) are not walked.
+    '''
+    def __init__(self, base_directory: str):
+        self.root = Path(base_directory) / 'cmip6'
+        self.entries: list[CatalogEntry] = []
+        self.refresh()
+
+    def refresh(self) -> None:
+        '''Rescans the directory tree.'''
+        entries = []
+        if self.root.exists():
+            for variable in os.scandir(self.root):
+                if not variable.is_dir():
+                    continue
+                for time_step in os.scandir(variable.path):
+                    if not time_step.is_dir():
+                        continue
+                    for file in os.scandir(time_step.path):
+                        entry = parse_path(Path(file.path)) if file.is_file() else None
+                        if entry is not None:
+                            entries.append(entry)
+        self.entries = sorted(entries, key=lambda e: (e.variable, e.time_step, e.model,
+                                                      e.experiment, e.start))
+
+    def search(self, variables=None, time_steps=None, models=None,
+               experiments=None) -> list[CatalogEntry]:
+        '''
+        Returns the entries matching a selection,
+        each argument is a member, value, or list of either (None selects all).
+        '''
+        selection = [(_values(variables), 'variable'), (_values(time_steps), 'time_step'),
+                     (_values(models), 'model'), (_values(experiments), 'experiment')]
+        return [e for e in self.entries
+                if all(values is None or getattr(e, name) in values
+                       for values, name in selection)]
+
+    def open_dataset(self, variable, time_step, model, experiment,
+                     chunks: None|dict[str, int] = None) -> xr.Dataset:
+        '''
+        Opens the files of one model and experiment as a single lazy dataset, along time.
+
+        Note:
+            [1] Files held by a longer file are skipped (see: covering), and time steps
+                overlapping files share are kept once.
+            [2] The files must share one grid, a ValueError is raised for files of other areas
+                (rather than concatenating them under the first file's coordinates).
+        '''
+        entries = self.search(variable, time_step, model, experiment)
+        if not entries:
+            raise FileNotFoundError(
+                f'No files for {_values(model)} {_values(experiment)} '
+                f'{_values(variable)} {_values(time_step)} under {self.root}.')
+        lat, lon = grid(entries[0].path)
+        for e in entries[1:]:
+            other_lat, other_lon = grid(e.path)
+            if not (np.array_equal(lat, other_lat) and np.array_equal(lon, other_lon)):
+                raise ValueError(
+                    f'{e.path.name} and {entries[0].path.name} have different grids, '
+                    'files for other areas cannot be opened as one dataset.')
+        ds = xr.open_mfdataset(
+            [e.path for e in covering(entries)], combine='nested', concat_dim='time',
+            chunks=chunks or DEFAULT_CHUNKS, data_vars='minimal', coords='minimal',
+            compat='override', join='override')
+        duplicated = ds.indexes['time'].duplicated()
+        return ds.isel(time=~duplicated) if duplicated.any() else ds
+
+    def open(self, variable, time_step=cmip6.TemporalResolutions.MONTHLY,
+             models=None, experiments=None,
+             chunks: None|dict[str, int] = None) -> xr.DataTree:
+        '''
+        Opens a model x experiment selection of a variable as a lazy tree of datasets,
+        one node per model/experiment (model grids differ, so they are not merged).
+        '''
+        pairs = sorted({(e.model, e.experiment) for e in self.search(
+            variable, time_step, models, experiments)})
+        if not pairs:
+            raise FileNotFoundError(
+                f'No {_values(variable)} {_values(time_step)} files under {self.root}.')
+        return xr.DataTree.from_dict({
+            f'{model}/{experiment}': self.open_dataset(variable, time_step, model,
+                                                       experiment, chunks)
+            for model, experiment in pairs})
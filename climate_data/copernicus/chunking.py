@@ -0,0 +1,107 @@
+'''
+Splits oversized CMIP6 requests into blocks of years,
+downloads the blocks in parallel, and stitches them back together along time.
+'''
+import dataclasses
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.cache import ResponseCache
+from climate_data.copernicus.client import ClientProvider
+from climate_data.copernicus.estimate import estimate_bytes
+from climate_data.copernicus.request import CMIP6Request, Status, MAX_WORKERS
+from climate_data.copernicus.subset import concat_time
+
+DEFAULT_MAX_BYTES = 500 * 2**20
+'''Default estimated size limit (500 MB) of a single sub-request.'''
+
+def plan_chunks(request: CMIP6Request, max_bytes: int = DEFAULT_MAX_BYTES,
+                max_years: None|int = None) -> list[CMIP6Request]:
+    '''
+    Splits a request into consecutive blocks of years,
+    each estimated to be under max_bytes (and at most max_years long).
+    
+    Note:
+        A request that fits is returned as the only item in the list.
+    '''
+    per_year = estimate_bytes(request) / len(request.years)
+    size = max(1, int(max_bytes // per_year))
+    if max_years is not None:
+        size = max(1, min(size, max_years))
+    if size >= len(request.years):
+        return [request]
+    return [dataclasses.replace(request, years=request.years[i:i + size])
+            for i in range(0, len(request.years), size)]
+
+def download_chunked(request: CMIP6Request, directory: str, file_name: str = '',
+                     overwrite: bool = False,
+                     file_format: str = cmip6.FileFormats.NETCDF.value,
+                     max_bytes: int = DEFAULT_MAX_BYTES, max_years: None|int = None,
+                     max_workers: int = 2, cache: None|ResponseCache = None,
+                     provider: None|ClientProvider = None) -> str:
+    '''
+    Downloads a request in blocks of years (see: plan_chunks),
+    then stitches the blocks into the file the single request would have produced.
+
+    Note:
+        [1] Blocks are downloaded to directory/chunks, at most max_workers at a time.
+        [2] The extracted block files are removed once they are stitched together.
+    '''
+    chunks = plan_chunks(request, max_bytes, max_years)
+    if len(chunks) == 1:
+        return request.download(directory, file_name, overwrite, file_format, cache, provider)
+
+    target = Path(directory) / request.create_or_name_file(file_name, file_format)
+    if target.exists() and not overwrite:
+        request.status = Status.ERROR
+        raise FileExistsError(
+            f'''File at: {str(target)} already exists,
+            choose overwrite=True to replace existing file.''')
+    chunk_directory = Path(directory) / 'chunks'
+    chunk_directory.mkdir(exist_ok=True)
+    print(f'Downloading {request.name_file()} in {len(chunks)} blocks of years.')
+
+    def process(chunk: CMIP6Request) -> None:
+        chunk.download(chunk_directory, overwrite=overwrite,
+                       file_format=file_format, cache=cache, provider=provider)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, MAX_WORKERS))) as pool:
+        list(pool.map(process, chunks))
+    failed = [c for c in chunks if c.status != Status.SUCCESS]
+    if failed:
+        request.status = Status.ERROR
+        request.error = failed[0].error
+        return f'Error: {len(failed)} of {len(chunks)} blocks failed, first: {failed[0].error}'
+
+    if target.exists():
+        target.unlink()
+    concat_time([c.file_chain[-1] for c in chunks], target)
+    for c in chunks:
+        request.file_chain.append(c.file_chain[0]) # zip of each block.
+        Path(c.file_chain[-1]).unlink()
+    request.file_chain.append(target)
+    request.status = Status.SUCCESS
+    return str(target)
+
+def download_chunked_requests(requests: list[CMIP6Request], base_directory: str,
+                              overwrite: bool = False,
+                              file_format: str = cmip6.FileFormats.NETCDF.value,
+                              max_bytes: int = DEFAULT_MAX_BYTES,
+                              max_workers: int = 2,
+                              cache: None|ResponseCache = None,
+                              provider: None|ClientProvider = None) -> list[str]:
+    '''
+    Batch process a list of CMIP6 requests (e.g. from build_CMIP6Requests),
+    splitting oversized requests with download_chunked.
+    Returns the downloaded file paths ('' for requests that failed).
+    '''
+    print(f'Downloading {len(requests)} requests to: {base_directory}')
+    for i, r in enumerate(requests):
+        download_chunked(r, r.create_directories(base_directory), overwrite=overwrite,
+                         file_format=file_format, max_bytes=max_bytes,
+                         max_workers=max_workers, cache=cache, provider=provider)
+        print(f'''    {[i]} {r.status}: {Path(r.file_chain[-1]).name if r.file_chain else ''}''')
+    success_count = sum(1 for r in requests if r.status == Status.SUCCESS)
+    print(f'Successfully processed {success_count} of {len(requests)} requests.')
+    return [str(r.file_chain[-1]) if r.file_chain else '' for r in requests]
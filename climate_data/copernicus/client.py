@@ -0,0 +1,73 @@
+'''
+Shared Copernicus CDS API clients.
+
+A ClientProvider builds CDS clients once, on top of a single pooled HTTP session,
+so ~/.cdsapirc is read once and connections are kept alive across a batch of requests.
+'''
+import threading
+from collections.abc import Callable
+
+import cdsapi
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 16
+'''Default number of pooled connections per host, at least the number of worker threads.'''
+
+class ClientProvider:
+    '''
+    Provides CDS clients sharing one pooled, keep-alive HTTP session.
+
+    Note:
+        [1] One client is built for each wait_until_complete setting, then reused.
+        [2] Safe to use from multiple worker threads.
+        [3] factory replaces cdsapi.Client (e.g. with a local fake in tests),
+            it is called with wait_until_complete, session and client_kwargs.
+        [4] created counts the clients built, for measuring per-request overhead.
+    '''
+    def __init__(self, pool_size: int = POOL_SIZE, factory: None|Callable = None,
+                 **client_kwargs: any):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.factory = factory
+        self.client_kwargs = client_kwargs
+        self.created = 0
+        self._clients: dict[bool, any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, wait_until_complete: bool = True):
+        '''Returns the shared client, built on first use.'''
+        with self._lock:
+            if wait_until_complete not in self._clients:
+                factory = self.factory or cdsapi.Client
+                self._clients[wait_until_complete] = factory(
+                    wait_until_complete=wait_until_complete, session=self.session,
+                    **self.client_kwargs)
+                self.created += 1
+            return self._clients[wait_until_complete]
+
+    def close(self) -> None:
+        '''Closes the pooled connections, the provider builds new clients if used again.'''
+        with self._lock:
+            self._clients.clear()
+            self.session.close()
+
+_DEFAULT: None|ClientProvider = None
+_DEFAULT_LOCK = threading.Lock()
+
+def default_provider() -> ClientProvider:
+    '''Returns the process wide provider, used when no provider is passed.'''
+    global _DEFAULT # pylint: disable=global-statement
+    with _DEFAULT_LOCK:
+        if _DEFAULT is None:
+            _DEFAULT = ClientProvider()
+        return _DEFAULT
+
+def set_default_provider(provider: None|ClientProvider) -> None|ClientProvider:
+    '''Replaces the process wide provider (None resets it), returns the previous one.'''
+    global _DEFAULT # pylint: disable=global-statement
+    with _DEFAULT_LOCK:
+        previous, _DEFAULT = _DEFAULT, provider
+        return previous
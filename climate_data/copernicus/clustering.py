@@ -0,0 +1,148 @@
+'''
+Merges the bounding boxes of many locations (e.g. neighbouring countries) into fewer,
+larger CDS requests, then cuts each location's files out of the merged downloads.
+'''
+import dataclasses
+from pathlib import Path
+from dataclasses import dataclass, field
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.cache import ResponseCache
+from climate_data.copernicus.client import ClientProvider
+from climate_data.copernicus.chunking import DEFAULT_MAX_BYTES
+from climate_data.copernicus.estimate import estimate_bytes, estimate_seconds
+from climate_data.copernicus.request import (CMIP6Request, Status, build_CMIP6Requests,
+                                             download_requests)
+from climate_data.copernicus.subset import subset_file
+
+def union(a: tuple[float, float, float, float],
+          b: tuple[float, float, float, float]) -> tuple[float, float, float, float]:
+    '''Returns the [N, W, S, E] bounding box enclosing two boxes (W <= E, no antimeridian).'''
+    return (max(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3]))
+
+@dataclass
+class Cluster:
+    '''A merged request area and the locations it covers.'''
+    location: tuple[float, float, float, float] # [N, W, S, E]
+    names: list[str]
+    bytes: int = 0
+
+@dataclass
+class ClusterPlan:
+    '''Merged request areas for a set of locations, and their estimated savings.'''
+    clusters: list[Cluster] = field(default_factory=list)
+    naive_requests: int = 0
+    naive_bytes: int = 0
+    naive_seconds: float = 0.0
+    requests: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        lines = [f'Clusters: {self.naive_requests} requests -> {self.requests} '
+                 f'({1 - self.requests / max(self.naive_requests, 1):.0%} fewer), '
+                 f'{self.naive_bytes / 2**20:,.1f} MB -> {self.bytes / 2**20:,.1f} MB, '
+                 f'~{self.naive_seconds / 3600:.1f} -> ~{self.seconds / 3600:.1f} hours (serial).']
+        for c in self.clusters:
+            lines.append(f'    {c.location}: {", ".join(c.names)}')
+        return '\n'.join(lines)
+
+def plan_clusters(locations: dict[str, tuple[float, float, float, float]],
+                  template: CMIP6Request, max_bytes: int = DEFAULT_MAX_BYTES,
+                  count: int = 1) -> ClusterPlan:
+    '''
+    Greedily merges location bounding boxes while a merge is estimated to save time,
+    i.e. the queue time of a request saved outweighs the extra area downloaded,
+    and the merged request stays under max_bytes.
+
+    Note:
+        [1] template sets the model, years, variable etc. the estimates are made for,
+            count is the number of requests (models x experiments x variables) per location.
+        [2] The pair saving the most time is merged first, until no merge saves time.
+    '''
+    def size(location) -> int:
+        return estimate_bytes(dataclasses.replace(template, location=location))
+
+    clusters = [Cluster(tuple(box), [name], size(box)) for name, box in locations.items()]
+    naive_bytes = sum(c.bytes for c in clusters)
+    naive_seconds = sum(estimate_seconds(c.bytes) for c in clusters)
+    while len(clusters) > 1:
+        best, best_saving = None, 0.0
+        for i, a in enumerate(clusters):
+            for j in range(i + 1, len(clusters)):
+                b = clusters[j]
+                box = union(a.location, b.location)
+                merged = size(box)
+                if merged > max_bytes:
+                    continue
+                saving = estimate_seconds(a.bytes) + estimate_seconds(b.bytes) - estimate_seconds(merged)
+                if saving > best_saving:
+                    best, best_saving = (i, j, box, merged), saving
+        if best is None:
+            break
+        i, j, box, merged = best
+        clusters[i] = Cluster(box, clusters[i].names + clusters[j].names, merged)
+        clusters.pop(j)
+    total = sum(c.bytes for c in clusters)
+    return ClusterPlan(clusters, len(locations) * count, naive_bytes * count,
+                       naive_seconds * count, len(clusters) * count, total * count,
+                       sum(estimate_seconds(c.bytes) for c in clusters) * count)
+
+def download_clustered(locations: dict[str, tuple[float, float, float, float]],
+                       base_directory: str,
+                       variables: list[cmip6.Variables],
+                       timesteps: list[cmip6.TemporalResolutions],
+                       models: list[cmip6.Models],
+                       experiments: list[cmip6.Experiments],
+                       years: None|tuple[str,...] = None,
+                       max_bytes: int = DEFAULT_MAX_BYTES,
+                       overwrite: bool = False,
+                       max_workers: int = 1,
+                       cache: None|ResponseCache = None,
+                       provider: None|ClientProvider = None,
+                       keep_clusters: bool = False) -> dict[str, list[str]]:
+    '''
+    Downloads the requests build_CMIP6Requests would make for each location
+    as fewer requests over merged areas (see: plan_clusters),
+    then cuts each location's files from the merged files.
+    Returns each location's file paths ('' for requests that failed).
+
+    Note:
+        [1] Each location's files are written to the usual layout under
+            base_directory/<location name>, merged files under base_directory/clusters/<i>.
+        [2] Merged files are removed once they are cut, unless keep_clusters is True.
+    '''
+    requests = build_CMIP6Requests(next(iter(locations.values())), variables, timesteps,
+                                   models, experiments, years)
+    template = max(requests, key=estimate_bytes) # the cap holds for the finest grid.
+    plan = plan_clusters(locations, template, max_bytes, len(requests))
+    print(plan)
+
+    results: dict[str, list[str]] = {name: [] for name in locations}
+    for i, cluster in enumerate(plan.clusters):
+        directory = Path(base_directory) / 'clusters' / str(i)
+        directory.mkdir(parents=True, exist_ok=True)
+        merged = build_CMIP6Requests(cluster.location, variables, timesteps, models,
+                                     experiments, years)
+        download_requests(merged, directory, overwrite=overwrite, max_workers=max_workers,
+                          cache=cache, provider=provider)
+        for name in cluster.names:
+            country = Path(base_directory) / name
+            country.mkdir(exist_ok=True)
+            for request in merged:
+                if request.status != Status.SUCCESS:
+                    results[name].append('')
+                    continue
+                part = dataclasses.replace(request, location=tuple(locations[name]))
+                target = Path(part.create_directories(country)) / f'{part.name_file()}.nc'
+                if target.exists() and not overwrite:
+                    raise FileExistsError(
+                        f'''File at: {str(target)} already exists,
+                        choose overwrite=True to replace existing file.''')
+                results[name].append(subset_file(request.file_chain[-1], target,
+                                                 location=locations[name]))
+        if not keep_clusters:
+            for request in merged:
+                for path in request.file_chain:
+                    Path(path).unlink(missing_ok=True)
+    return results
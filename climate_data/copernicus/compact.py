@@ -0,0 +1,202 @@
+'''
+Builds CMIP6 requests lazily, as compact requests that hold their year, month and day
+selections as bitmasks, and expands them to CMIP6Requests a batch at a time as they are sent,
+so sweeps of many locations, models and experiments do not hold every request in memory.
+'''
+import functools
+import itertools
+from pathlib import Path
+from collections.abc import Iterable, Iterator
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.availability import Availability
+from climate_data.copernicus.cache import ResponseCache
+from climate_data.copernicus.client import ClientProvider
+from climate_data.copernicus.convert import ZarrConverter
+from climate_data.copernicus.index import FileIndex
+from climate_data.copernicus.manifest import Manifest
+from climate_data.copernicus.metrics import Events
+from climate_data.copernicus.request import CMIP6Request, ZipAction, download_requests
+from climate_data.copernicus.retry import Retry
+
+BATCH_SIZE = 1000
+'''Default number of compact requests expanded (and downloaded) at once.'''
+
+@functools.lru_cache(maxsize=1024)
+def to_mask(values: tuple[str, ...], first: int) -> int:
+    '''Returns a bitmask of values (e.g. years), bit i set for the value first + i.'''
+    mask = 0
+    for value in values:
+        if int(value) < first:
+            raise ValueError(f'Invalid value: {value}, expected at least {first}.')
+        mask |= 1 << (int(value) - first)
+    return mask
+
+@functools.lru_cache(maxsize=1024)
+def from_mask(mask: int, first: int, width: int = 2) -> tuple[str, ...]:
+    '''Returns the values of a bitmask (see: to_mask), as zero padded strings.'''
+    return tuple(f'{first + i:0{width}d}' for i in range(mask.bit_length()) if mask >> i & 1)
+
+class CompactRequest:
+    '''
+    A CMIP6 request in a fraction of the memory of a CMIP6Request, e.g. for large sweeps.
+        single: experiment, model, location, variable, time_step, months, days.
+
+    Note:
+        [1] Years, months and days are stored as bitmasks, years from the experiment's
+            first year, and are expanded to tuples of strings when read.
+        [2] There is no per-instance dictionary, status or file chain:
+            expand() returns the CMIP6Request to send, see download_compact.
+        [3] Equal selections (and locations) share one object across requests,
+            and requests are validated like CMIP6Requests.
+    '''
+    __slots__ = ('model', 'experiment', 'location', 'variable', 'time_step',
+                 'year_mask', 'month_mask', 'day_mask', 'priority')
+
+    def __init__(self, model: cmip6.Models = cmip6.Models.ACCESS_CM2,
+                 experiment: cmip6.Experiments = cmip6.Experiments.HISTORICAL,
+                 years: None|tuple[str,...] = None,
+                 location: tuple[int, int, int, int] = (1, 0, 0, 1), # [N, W, S, E]
+                 variable: cmip6.Variables = cmip6.Variables.TEMP,
+                 time_step: str = cmip6.TemporalResolutions.MONTHLY,
+                 months: tuple[str, ...] = cmip6.MONTHS,
+                 days: None|tuple[str, ...] = None):
+        if time_step == cmip6.TemporalResolutions.FIXED:
+            raise NotImplementedError('Fixed resolution not yet implemented.')
+        if days is not None and time_step != cmip6.TemporalResolutions.DAILY:
+            raise ValueError('Days are only valid for daily resolution.')
+        possible_years = cmip6.default_years(experiment)
+        if years is None:
+            years = possible_years
+        elif not set(years).issubset(possible_years):
+            raise ValueError(f'Invalid years: {years}')
+        self.model = model
+        self.experiment = experiment
+        self.location = location
+        self.variable = variable
+        self.time_step = time_step
+        self.year_mask = to_mask(tuple(years), int(possible_years[0]))
+        self.month_mask = to_mask(tuple(months), 1)
+        self.day_mask = None if days is None else to_mask(tuple(days), 1)
+        self.priority = 0
+
+    @property
+    def years(self) -> tuple[str, ...]:
+        '''Returns the selected years.'''
+        return from_mask(self.year_mask, int(cmip6.default_years(self.experiment)[0]), 4)
+
+    @property
+    def months(self) -> tuple[str, ...]:
+        '''Returns the selected months.'''
+        return from_mask(self.month_mask, 1)
+
+    @property
+    def days(self) -> None|tuple[str, ...]:
+        '''Returns the selected days, None if not set.'''
+        return None if self.day_mask is None else from_mask(self.day_mask, 1)
+
+    def expand(self) -> CMIP6Request:
+        '''Returns the CMIP6Request for this request.'''
+        request = CMIP6Request(self.model, self.experiment, self.years, self.location,
+                               self.variable, self.time_step, self.months, self.days)
+        request.priority = self.priority
+        return request
+
+    @property
+    def request(self) -> dict[str, any]:
+        '''Returns a dictionary request (see: CMIP6Request.request).'''
+        return self.expand().request
+
+    def name_file(self) -> str:
+        '''Creates a file name stem (see: CMIP6Request.name_file).'''
+        return self.expand().name_file()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactRequest):
+            return NotImplemented
+        return all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
+
+    def __repr__(self) -> str:
+        return (f'CompactRequest({self.model.value}, {self.experiment.value}, '
+                f'{self.variable.value}, {self.time_step.value}, {self.location}, '
+                f'{self.name_file()})')
+
+def iter_CMIP6Requests(locations: Iterable[tuple[int, int, int, int]], # pylint: disable=invalid-name
+                       variables: list[cmip6.Variables],
+                       timesteps: list[cmip6.TemporalResolutions],
+                       models: list[cmip6.Models],
+                       experiments: list[cmip6.Experiments],
+                       years: None|tuple[str,...] = None,
+                       availability: None|Availability = None,
+                       compact: bool = True) -> Iterator[CompactRequest|CMIP6Request]:
+    '''
+    Yields the requests build_CMIP6Requests would build for each location, one at a time.
+
+    Note:
+        [1] locations may itself be a generator, e.g. of country bounding boxes.
+        [2] Requests are CompactRequests, or CMIP6Requests if compact is False.
+        [3] If an availability matrix is provided, combinations the CDS is known
+            not to hold are skipped.
+    '''
+    if len(variables) != len(timesteps):
+        raise ValueError('Variables and timesteps must have the same length.')
+    build = CompactRequest if compact else CMIP6Request
+    checked: dict[tuple, bool] = {}
+    for location in locations:
+        location = tuple(location)
+        for (var, ts), model, ssp in itertools.product(zip(variables, timesteps), models,
+                                                       experiments):
+            if availability is not None:
+                key = (model, ssp, var, ts)
+                if key not in checked:
+                    checked[key] = availability.available(
+                        {'model': model.value, 'experiment': ssp.value,
+                         'variable': var.value, 'temporal_resolution': ts.value})
+                if not checked[key]:
+                    continue
+            yield build(model, ssp, years, location, var, ts)
+
+def download_compact(requests: Iterable[CompactRequest|CMIP6Request], base_directory: str,
+                     batch_size: int = BATCH_SIZE, overwrite: bool = False,
+                     file_format: str = cmip6.FileFormats.NETCDF.value,
+                     max_workers: int = 1,
+                     cache: None|ResponseCache = None,
+                     manifest: None|Manifest = None,
+                     provider: None|ClientProvider = None,
+                     zip_action: ZipAction = ZipAction.KEEP,
+                     index: None|FileIndex = None,
+                     converter: None|ZarrConverter = None,
+                     availability: None|Availability = None,
+                     events: None|Events = None,
+                     scheduler=None,
+                     retry: None|Retry = None) -> list[str]:
+    '''
+    Downloads requests (e.g. from iter_CMIP6Requests) with download_requests,
+    expanding batch_size compact requests to CMIP6Requests at a time.
+    Returns the downloaded file paths ('' for requests that failed).
+
+    Note:
+        Each location's files are written to the usual layout under
+        base_directory/<area> (see: CMIP6Request.name_area), as file names do not record it.
+    '''
+    paths = []
+    requests = iter(requests)
+    while batch := [r.expand() if isinstance(r, CompactRequest) else r
+                    for r in itertools.islice(requests, batch_size)]:
+        areas: dict[str, list[int]] = {}
+        for i, r in enumerate(batch):
+            areas.setdefault(r.name_area(), []).append(i)
+        batch_paths = [''] * len(batch)
+        for area, members in areas.items():
+            directory = Path(base_directory) / area
+            directory.mkdir(exist_ok=True)
+            area_paths = download_requests(
+                [batch[i] for i in members], directory, overwrite=overwrite,
+                file_format=file_format, max_workers=max_workers, cache=cache,
+                manifest=manifest, provider=provider, zip_action=zip_action, index=index,
+                converter=converter, availability=availability, events=events,
+                scheduler=scheduler, retry=retry)
+            for i, path in zip(members, area_paths):
+                batch_paths[i] = path
+        paths.extend(batch_paths)
+    return paths
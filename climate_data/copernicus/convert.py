@@ -0,0 +1,159 @@
+'''
+Conversion of downloaded CMIP6 NetCDF files into Zarr stores chunked for time series access
+(requires zarr 3).
+
+The CDS NetCDF files are laid out for maps, one time step at a time,
+so reading the full series of one grid cell touches nearly every block of the file.
+The stores hold the whole time axis of a small spatial tile in each chunk instead.
+'''
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+try:
+    import zarr
+except ImportError:
+    zarr = None
+
+from climate_data.copernicus.catalog import Catalog, parse_path
+from climate_data.copernicus.subset import coordinate_name
+
+DEFAULT_CHUNKS: dict[str, int] = {'time': 1980, 'lat': 16, 'lon': 16}
+'''Chunk lengths along time, lat and lon: 165 years of monthly data for a 16 x 16 cell tile.'''
+
+TIME_CODER = xr.coders.CFDatetimeCoder(use_cftime=True)
+'''Decodes times as cftime dates, model calendars (e.g. noleap) are kept.'''
+
+DEFAULT_CODEC: dict[str, any] = {'cname': 'zstd', 'clevel': 5, 'shuffle': 'shuffle'}
+'''Blosc compressor settings.'''
+
+def encoding(ds: xr.Dataset, chunks: dict[str, int],
+             codec: dict[str, any]) -> dict[str, dict[str, any]]:
+    '''
+    Returns the zarr encoding of each data variable, chunks are given along
+    time, lat and lon (lengths of -1 or None use the whole dimension).
+    '''
+    names = {'time': 'time', 'lat': coordinate_name(ds, 'lat', 'latitude'),
+             'lon': coordinate_name(ds, 'lon', 'longitude')}
+    lengths = {names[k]: v for k, v in chunks.items() if k in names}
+    compressor = zarr.codecs.BloscCodec(**codec)
+    def length(dim: str) -> int:
+        if lengths.get(dim) in (None, -1):
+            return ds.sizes[dim]
+        # time chunks may be longer than the data, so later appends fill them.
+        return lengths[dim] if dim == 'time' else min(lengths[dim], ds.sizes[dim])
+    return {name: {'chunks': tuple(length(d) for d in variable.dims),
+                   'compressors': (compressor,)}
+            for name, variable in ds.data_vars.items()}
+
+class ZarrConverter:
+    '''
+    Converts NetCDF files into Zarr stores, one per model and experiment,
+    at directory/<variable>/<time_step>/<model>_<experiment>.zarr.
+
+    Note:
+        [1] Files of the same model and experiment are appended along time,
+            time steps already in the store are skipped, so conversions are incremental.
+            Files may arrive in any order, earlier time steps are merged in by a rewrite.
+        [2] A store holds one grid, appending a file with a different area raises a ValueError
+            (use a converter directory per area).
+        [3] Passed to CMIP6Request.download, unzip_file or download_requests,
+            each extracted file is converted after it is unzipped.
+        [4] Writes to a store are serialized, so worker threads may share a converter.
+    '''
+    def __init__(self, directory: str, chunks: None|dict[str, int] = None,
+                 codec: None|dict[str, any] = None):
+        if zarr is None or int(zarr.__version__.split('.')[0]) < 3:
+            raise ImportError(
+                'Zarr conversion requires zarr 3, e.g. pip install "climate-data[zarr]".')
+        self.directory = Path(directory)
+        self.chunks = {**DEFAULT_CHUNKS, **(chunks or {})}
+        self.codec = {**DEFAULT_CODEC, **(codec or {})}
+        self._lock = threading.Lock()
+        self._locks: dict[Path, threading.Lock] = {}
+
+    def store_path(self, path: str) -> Path:
+        '''Returns the store a NetCDF file in the download layout is converted into.'''
+        entry = parse_path(Path(path))
+        if entry is None:
+            raise ValueError(f'Cannot convert {path}, it does not follow the cmip6 file layout.')
+        return (self.directory / entry.variable / entry.time_step /
+                f'{entry.model}_{entry.experiment}.zarr')
+
+    def convert(self, path: str, store: None|str = None) -> Path:
+        '''
+        Writes (or appends) a NetCDF file to a store, returns the store path
+        (default: see store_path).
+
+        Note:
+            Time steps after the store's last are appended. A file holding earlier
+            time steps (e.g. converted out of order) is merged by time,
+            which rewrites the store.
+        '''
+        store = Path(store) if store else self.store_path(path)
+        with self.store_lock(store), xr.open_dataset(path, decode_times=TIME_CODER) as ds:
+            if not store.exists():
+                store.parent.mkdir(parents=True, exist_ok=True)
+                ds.to_zarr(store, mode='w-', encoding=encoding(ds, self.chunks, self.codec),
+                           zarr_format=3, consolidated=False)
+                return store
+            with open_store(store) as existing:
+                for name in ds.dims:
+                    if name != 'time' and not np.array_equal(existing[name].values,
+                                                              ds[name].values):
+                        raise ValueError(
+                            f'{path} {name} coordinates do not match the store at: {store}.')
+                stored = set(existing['time'].values)
+                last = existing['time'].values[-1]
+                ds = ds.isel(time=[i for i, t in enumerate(ds['time'].values)
+                                   if t not in stored])
+                if ds.sizes['time'] and ds['time'].values[0] < last:
+                    self.rewrite(store, existing, ds)
+                    return store
+            if ds.sizes['time']:
+                ds.to_zarr(store, append_dim='time', zarr_format=3, consolidated=False)
+        return store
+
+    def store_lock(self, store: Path) -> threading.Lock:
+        '''Returns the lock serializing writes to a store.'''
+        with self._lock:
+            return self._locks.setdefault(store.resolve(), threading.Lock())
+
+    def rewrite(self, store: Path, existing: xr.Dataset, ds: xr.Dataset) -> None:
+        '''Replaces a store with its time steps and the dataset's, in time order.'''
+        combined = xr.concat([existing, ds], 'time').sortby('time').drop_encoding()
+        partial = store.with_name(f'{store.name}.part')
+        if partial.exists():
+            shutil.rmtree(partial)
+        combined.to_zarr(partial, mode='w-', encoding=encoding(combined, self.chunks, self.codec),
+                         zarr_format=3, consolidated=False)
+        shutil.rmtree(store)
+        partial.rename(store)
+
+    def convert_catalog(self, catalog: Catalog, variables=None, time_steps=None,
+                        models=None, experiments=None) -> list[Path]:
+        '''
+        Converts a catalog selection (see: Catalog.search), file by file in time order,
+        returns the stores written.
+        '''
+        stores = []
+        for entry in catalog.search(variables, time_steps, models, experiments):
+            store = self.convert(entry.path)
+            if store not in stores:
+                stores.append(store)
+        return stores
+
+def open_store(store: str) -> xr.Dataset:
+    '''Opens a converted store lazily, chunks are read as they are selected (dask is not needed).'''
+    return xr.open_dataset(store, engine='zarr', chunks=None, decode_times=TIME_CODER,
+                           consolidated=False)
+
+def series(store: str, variable: str, lat: float, lon: float) -> xr.DataArray:
+    '''Reads the full time series of the grid cell nearest a point.'''
+    with open_store(store) as ds:
+        return ds[variable].sel({coordinate_name(ds, 'lat', 'latitude'): lat,
+                                 coordinate_name(ds, 'lon', 'longitude'): lon},
+                                method='nearest').load()
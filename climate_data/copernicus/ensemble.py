@@ -0,0 +1,270 @@
+'''
+Out-of-core multi-model ensemble statistics (mean, spread and quantiles across models)
+of the CMIP6 files in a catalog, computed one block of time steps and one model at a time.
+'''
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.catalog import Catalog
+from climate_data.copernicus.subset import coordinate_name, append_time
+
+DEFAULT_TIME_BLOCK = 12
+'''Time steps held in memory at once.'''
+DEFAULT_BINS = 128
+'''Histogram bins per grid cell and time step used for quantiles.'''
+DEFAULT_QUANTILES: tuple[float,...] = (0.05, 0.5, 0.95)
+
+class RunningStats:
+    '''
+    Element wise running count, mean, sum of squared deviations, minimum and maximum
+    of a stream of equally shaped arrays (Welford), NaNs are skipped.
+    Partial statistics (e.g. from worker processes) are combined with merge().
+    '''
+    def __init__(self, shape: tuple[int,...]):
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+
+    def update(self, values: np.ndarray) -> 'RunningStats':
+        '''Adds an array of values.'''
+        valid = ~np.isnan(values)
+        x = np.where(valid, values, 0.0)
+        self.count += valid
+        delta = np.where(valid, x - self.mean, 0.0)
+        self.mean += delta / np.maximum(self.count, 1)
+        self.m2 += delta * np.where(valid, x - self.mean, 0.0)
+        self.minimum = np.fmin(self.minimum, values)
+        self.maximum = np.fmax(self.maximum, values)
+        return self
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        '''Combines the statistics of another stream (Chan et al. parallel update).'''
+        count = self.count + other.count
+        n = np.maximum(count, 1)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / n
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / n
+        self.count = count
+        self.minimum = np.fmin(self.minimum, other.minimum)
+        self.maximum = np.fmax(self.maximum, other.maximum)
+        return self
+
+    def variance(self, ddof: int = 1) -> np.ndarray:
+        '''Returns the variance, NaN where there are ddof values or fewer.'''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+class Histogram:
+    '''
+    Element wise histograms of a stream of equally shaped arrays, between known
+    lower and upper bounds (e.g. RunningStats minimum and maximum), used for quantiles.
+    Histograms are combined with merge().
+
+    Note:
+        Quantiles are interpolated within a bin, so their error is at most (upper - lower) / bins.
+    '''
+    def __init__(self, lower: np.ndarray, upper: np.ndarray, bins: int = DEFAULT_BINS):
+        self.lower = lower
+        self.width = np.where(upper > lower, (upper - lower) / bins, 1.0)
+        self.bins = bins
+        self.counts = np.zeros((bins, lower.size), dtype=np.int32)
+
+    def update(self, values: np.ndarray) -> 'Histogram':
+        '''Adds an array of values.'''
+        values = values.reshape(-1)
+        valid = np.flatnonzero(~np.isnan(values))
+        lower, width = self.lower.reshape(-1)[valid], self.width.reshape(-1)[valid]
+        index = np.clip(((values[valid] - lower) / width).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(index * self.counts.shape[1] + valid,
+                                   minlength=self.counts.size).reshape(self.counts.shape).astype(np.int32)
+        return self
+
+    def merge(self, other: 'Histogram') -> 'Histogram':
+        '''Adds the counts of another histogram over the same bins.'''
+        self.counts += other.counts
+        return self
+
+    def ranked(self, rank: np.ndarray) -> np.ndarray:
+        '''Returns the estimated value of each cell at an integer rank (0 is the smallest).'''
+        cumulative = self.counts.cumsum(axis=0)
+        index = np.minimum((cumulative <= rank).sum(axis=0), self.bins - 1)
+        cells = np.arange(cumulative.shape[1])
+        before = np.where(index > 0, cumulative[np.maximum(index - 1, 0), cells], 0)
+        inside = np.maximum(self.counts[index, cells], 1)
+        # values are spread evenly through their bin.
+        position = index + np.clip((rank - before + 0.5) / inside, 0, 1)
+        return self.lower.reshape(-1) + position * self.width.reshape(-1)
+
+    def quantile(self, q: float) -> np.ndarray:
+        '''Returns the q-th quantile (0 to 1, linear interpolation between ranks like numpy).'''
+        total = self.counts.sum(axis=0)
+        rank = q * np.maximum(total - 1, 0)
+        low, high = self.ranked(np.floor(rank)), self.ranked(np.ceil(rank))
+        values = low + (rank - np.floor(rank)) * (high - low)
+        return np.where(total > 0, values, np.nan).reshape(self.lower.shape)
+
+def time_keys(time: xr.DataArray, daily: bool = False) -> np.ndarray:
+    '''Returns integer YYYYMMDD keys of a time coordinate (DD is 00 unless daily).'''
+    day = time.dt.day.values if daily else 0
+    return time.dt.year.values * 10000 + time.dt.month.values * 100 + day
+
+def key_date(key: int) -> None|pd.Timestamp:
+    '''Returns the date of a time key, None if it is not a (proleptic gregorian) date.'''
+    try:
+        return pd.Timestamp(key // 10000, key // 100 % 100, key % 100 or 1)
+    except ValueError:
+        return None
+
+def regrid(da: xr.DataArray, lat: np.ndarray, lon: np.ndarray,
+           method: str = 'nearest') -> xr.DataArray:
+    '''
+    Returns a variable on a target lat/lon grid (longitudes -180 to 180).
+
+    Note:
+        method='nearest' needs no extra packages, other methods use xarray interp (scipy).
+    '''
+    la = coordinate_name(da, 'lat', 'latitude')
+    lo = coordinate_name(da, 'lon', 'longitude')
+    da = da.assign_coords({lo: (da[lo] + 180) % 360 - 180}).sortby(lo)
+    if method == 'nearest':
+        da = da.sel({la: lat, lo: lon}, method='nearest')
+        da = da.assign_coords({la: lat, lo: lon})
+    else:
+        da = da.interp({la: lat, lo: lon}, method=method)
+    return da.rename({la: 'lat', lo: 'lon'})
+
+def load_block(paths: list[str], variable: str, keys: np.ndarray,
+               lat: np.ndarray, lon: np.ndarray, method: str = 'nearest',
+               daily: bool = False) -> np.ndarray:
+    '''
+    Reads one model's values at a block of time keys (see: time_keys) onto a target grid,
+    NaN where the model has no data.
+    '''
+    block = np.full((keys.size, lat.size, lon.size), np.nan)
+    position = {k: i for i, k in enumerate(keys)}
+    for path in paths:
+        with xr.open_dataset(path) as ds:
+            found = time_keys(ds['time'], daily)
+            rows = np.flatnonzero(np.isin(found, keys))
+            if rows.size:
+                values = regrid(ds[variable].isel(time=rows), lat, lon, method)
+                block[[position[k] for k in found[rows]]] = values.transpose(
+                    'time', 'lat', 'lon').values
+    return block
+
+def _moments(args: tuple) -> RunningStats:
+    '''Worker: returns one model's block as running statistics.'''
+    block = load_block(*args)
+    return RunningStats(block.shape).update(block)
+
+def _histogram(args: tuple) -> Histogram:
+    '''Worker: returns one model's block as histogram counts.'''
+    *load, lower, upper, bins = args
+    return Histogram(lower, upper, bins).update(load_block(*load))
+
+def _reduce(function, tasks: list[tuple], pool: None|ProcessPoolExecutor, workers: int):
+    '''Merges the results of function over tasks, at most workers results are held at once.'''
+    result = None
+    for i in range(0, len(tasks), workers):
+        batch = tasks[i:i + workers]
+        for partial in (pool.map(function, batch) if pool else map(function, batch)):
+            result = partial if result is None else result.merge(partial)
+    return result
+
+def ensemble_statistics(catalog: Catalog, variable: cmip6.Variables,
+                        experiment: cmip6.Experiments,
+                        time_step: cmip6.TemporalResolutions = cmip6.TemporalResolutions.MONTHLY,
+                        models: None|list[cmip6.Models] = None,
+                        quantiles: tuple[float,...] = DEFAULT_QUANTILES,
+                        grid: None|xr.Dataset = None, method: str = 'nearest',
+                        time_block: int = DEFAULT_TIME_BLOCK, bins: int = DEFAULT_BINS,
+                        max_workers: int = 1, target: None|str = None) -> xr.Dataset:
+    '''
+    Returns the mean, standard deviation (spread), minimum, maximum, member count and
+    quantiles across the models of a variable and experiment in a catalog, at each time
+    step and grid cell, written to a NetCDF target if one is provided.
+
+    Note:
+        [1] Models are regridded to grid (default: the first model's grid), see: regrid.
+        [2] Models are matched on year, month (and day), missing time steps are skipped,
+            as are days outside the gregorian calendar (i.e. 30 February in 360 day calendars).
+        [3] Each block of time_block steps is read twice, once for the Welford moments
+            and once for histogram quantiles (see: Histogram), one model at a time,
+            so peak memory depends on time_block x grid x bins, not on the number of models.
+        [4] max_workers > 1 reads models in parallel worker processes.
+        [5] With a target, blocks are appended to the file as they are finished
+            and the returned dataset is opened lazily from it.
+    '''
+    members: dict[str, list[str]] = {}
+    for entry in catalog.search(variable, time_step, models, experiment):
+        members.setdefault(entry.model, []).append(str(entry.path))
+    if not members:
+        raise FileNotFoundError(
+            f'No {variable.value} {experiment.value} files under {catalog.root}.')
+    name = variable.value
+    daily = time_step == cmip6.TemporalResolutions.DAILY
+    keys = set()
+    for paths in members.values():
+        for path in paths:
+            with xr.open_dataset(path) as ds:
+                keys.update(time_keys(ds['time'], daily).tolist())
+                if grid is None:
+                    lon = ds[coordinate_name(ds, 'lon', 'longitude')].values
+                    grid = xr.Dataset(coords={
+                        'lat': ds[coordinate_name(ds, 'lat', 'latitude')].values,
+                        'lon': np.sort((lon + 180) % 360 - 180)})
+    dates = {k: key_date(k) for k in sorted(keys)}
+    keys = np.array([k for k, date in dates.items() if date is not None])
+    lat, lon = grid['lat'].values, grid['lon'].values
+    print(f'Ensemble of {len(members)} models, {keys.size} time steps, '
+          f'{lat.size} x {lon.size} grid, in blocks of {time_block}.')
+
+    workers = max(1, max_workers)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    blocks = []
+    try:
+        for start in range(0, keys.size, time_block):
+            block = keys[start:start + time_block]
+            tasks = [(paths, name, block, lat, lon, method, daily) for paths in members.values()]
+            stats = _reduce(_moments, tasks, pool, workers)
+            empty = stats.count == 0
+            data = {'mean': np.where(empty, np.nan, stats.mean),
+                    'std': np.sqrt(stats.variance()),
+                    'minimum': np.where(empty, np.nan, stats.minimum),
+                    'maximum': np.where(empty, np.nan, stats.maximum),
+                    'count': stats.count}
+            if quantiles:
+                lower = np.where(empty, 0.0, stats.minimum)
+                upper = np.where(empty, 0.0, stats.maximum)
+                histogram = _reduce(_histogram, [(*t, lower, upper, bins) for t in tasks],
+                                    pool, workers)
+                data['quantiles'] = np.stack([histogram.quantile(q) for q in quantiles], axis=1)
+            ds = xr.Dataset(
+                {k: (('time', 'quantile', 'lat', 'lon') if k == 'quantiles' else
+                     ('time', 'lat', 'lon'), v) for k, v in data.items()},
+                coords={'time': [dates[k] for k in block],
+                        'quantile': list(quantiles), 'lat': lat, 'lon': lon},
+                attrs={'variable': name, 'experiment': experiment.value,
+                       'models': ' '.join(members)})
+            if target is None:
+                blocks.append(ds)
+            elif start == 0:
+                ds.to_netcdf(target, unlimited_dims=['time'])
+            else:
+                part = Path(target).with_suffix('.block.nc')
+                ds.to_netcdf(part)
+                append_time(target, part)
+                part.unlink()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if target is not None:
+        return xr.open_dataset(target)
+    return xr.concat(blocks, dim='time')
@@ -0,0 +1,168 @@
+'''
+Estimates the size of CMIP6 requests, and the time to download them,
+before they are sent to the CDS.
+'''
+import math
+import calendar
+from dataclasses import dataclass, field
+
+import climate_data.copernicus.cmip6 as cmip6
+
+DEFAULT_RESOLUTION: tuple[float, float] = (1.0, 1.0)
+'''Approximate grid spacing (degrees latitude, longitude) of a CMIP6 model.'''
+BYTES_PER_VALUE: int = 4
+'''CMIP6 variables are stored as 32 bit floats.'''
+QUEUE_SECONDS: float = 120.0
+'''Rough time a request spends in the CDS queue, before it is processed.'''
+BYTES_PER_SECOND: float = 2 * 2**20
+'''Rough combined CDS processing and transfer rate.'''
+
+MODEL_RESOLUTIONS: dict[cmip6.Models, tuple[float, float]] = {
+    cmip6.Models.ACCESS_CM2: (1.25, 1.875),
+    cmip6.Models.ACCESS_ESM1_5: (1.25, 1.875),
+    cmip6.Models.AWI_CM_1_1_MR: (0.9375, 0.9375),
+    cmip6.Models.AWI_ESM_1_1_LR: (1.875, 1.875),
+    cmip6.Models.BCC_CSM2_MR: (1.125, 1.125),
+    cmip6.Models.BCC_ESM1: (2.8125, 2.8125),
+    cmip6.Models.CAMS_CSM_1_0: (1.125, 1.125),
+    cmip6.Models.CANESM5: (2.8125, 2.8125),
+    cmip6.Models.CANESM5_CANOE: (2.8125, 2.8125),
+    cmip6.Models.CESM2: (0.9424, 1.25),
+    cmip6.Models.CESM2_FV2: (1.8947, 2.5),
+    cmip6.Models.CESM2_WACCM: (0.9424, 1.25),
+    cmip6.Models.CESM2_WACCM_FV2: (1.8947, 2.5),
+    cmip6.Models.CIESM: (0.9424, 1.25),
+    cmip6.Models.CMCC_CM2_HR4: (0.9424, 1.25),
+    cmip6.Models.CMCC_CM2_SR5: (0.9424, 1.25),
+    cmip6.Models.CMCC_ESM2: (0.9424, 1.25),
+    cmip6.Models.CNRM_CM6_1: (1.4, 1.4),
+    cmip6.Models.CNRM_CM6_1_HR: (0.5, 0.5),
+    cmip6.Models.CNRM_ESM2_1: (1.4, 1.4),
+    cmip6.Models.E3SM_1_0: (1.0, 1.0),
+    cmip6.Models.E3SM_1_1: (1.0, 1.0),
+    cmip6.Models.E3SM_1_1_ECA: (1.0, 1.0),
+    cmip6.Models.EC_EARTH3: (0.7, 0.7),
+    cmip6.Models.EC_EARTH3_AERCHEM: (0.7, 0.7),
+    cmip6.Models.EC_EARTH3_CC: (0.7, 0.7),
+    cmip6.Models.EC_EARTH3_VEG: (0.7, 0.7),
+    cmip6.Models.EC_EARTH3_VEG_LR: (1.125, 1.125),
+    cmip6.Models.FGOALS_F3_L: (1.0, 1.25),
+    cmip6.Models.FGOALS_G3: (2.25, 2.0),
+    cmip6.Models.FIO_ESM_2_0: (0.9424, 1.25),
+    cmip6.Models.GFDL_ESM4: (1.0, 1.25),
+    cmip6.Models.GISS_E2_1_G: (2.0, 2.5),
+    cmip6.Models.GISS_E2_1_H: (2.0, 2.5),
+    cmip6.Models.HADGEM3_GC31_LL: (1.25, 1.875),
+    cmip6.Models.HADGEM3_GC31_MM: (0.5556, 0.8333),
+    cmip6.Models.IITM_ESM: (1.875, 1.875),
+    cmip6.Models.INM_CM4_8: (1.5, 2.0),
+    cmip6.Models.INM_CM5_0: (1.5, 2.0),
+    cmip6.Models.IPSL_CM5A2_INCA: (1.8947, 3.75),
+    cmip6.Models.IPSL_CM6A_LR: (1.2676, 2.5),
+    cmip6.Models.KACE_1_0_G: (1.25, 1.875),
+    cmip6.Models.KIOST_ESM: (1.875, 1.875),
+    cmip6.Models.MCM_UA_1_0: (2.25, 3.75),
+    cmip6.Models.MIROC6: (1.4, 1.4),
+    cmip6.Models.MIROC_ES2H: (1.4, 1.4),
+    cmip6.Models.MIROC_ES2L: (2.8125, 2.8125),
+    cmip6.Models.MPI_ESM_1_2_HAM: (1.875, 1.875),
+    cmip6.Models.MPI_ESM1_2_HR: (0.9375, 0.9375),
+    cmip6.Models.MPI_ESM1_2_LR: (1.875, 1.875),
+    cmip6.Models.MRI_ESM2_0: (1.125, 1.125),
+    cmip6.Models.NESM3: (1.875, 1.875),
+    cmip6.Models.NORCPM1: (1.8947, 2.5),
+    cmip6.Models.NORESM2_LM: (1.8947, 2.5),
+    cmip6.Models.NORESM2_MM: (0.9424, 1.25),
+    cmip6.Models.SAM0_UNICON: (0.9424, 1.25),
+    cmip6.Models.TAIESM1: (0.9424, 1.25),
+    cmip6.Models.UKESM1_0_LL: (1.25, 1.875),
+}
+'''Approximate native atmosphere grid spacing (degrees latitude, longitude) of each model.'''
+
+def grid_cells(location: tuple[float, float, float, float],
+               resolution: tuple[float, float] = DEFAULT_RESOLUTION) -> int:
+    '''Returns the approximate number of grid cells in a [N, W, S, E] bounding box.'''
+    n, w, s, e = location
+    width = e - w if e >= w else e - w + 360 # crosses the antimeridian.
+    return (max(1, math.ceil((n - s) / resolution[0])) *
+            max(1, math.ceil(width / resolution[1])))
+
+def timesteps(request) -> int:
+    '''Returns the number of time steps in a CMIP6Request.'''
+    if request.time_step == cmip6.TemporalResolutions.DAILY:
+        days = [int(d) for d in (request.days or cmip6.DAYS)]
+        # leap days are ignored, calendars vary across models.
+        per_year = sum(len([d for d in days if d <= calendar.monthrange(2001, int(m))[1]])
+                       for m in request.months)
+    else:
+        per_year = len(request.months)
+    return per_year * len(request.years)
+
+def estimate_bytes(request, resolution: None|tuple[float, float] = None) -> int:
+    '''
+    Returns the approximate uncompressed size (bytes) of a CMIP6Request's data,
+    at the model's native resolution unless a resolution is provided.
+    '''
+    if resolution is None:
+        resolution = MODEL_RESOLUTIONS.get(request.model, DEFAULT_RESOLUTION)
+    return grid_cells(request.location, resolution) * timesteps(request) * BYTES_PER_VALUE
+
+def estimate_seconds(size: int) -> float:
+    '''Returns a rough time (seconds) to queue, process and download size bytes.'''
+    return QUEUE_SECONDS + size / BYTES_PER_SECOND
+
+@dataclass
+class Estimate:
+    '''Estimated size and duration of a single CMIP6Request.'''
+    request: any
+    cells: int
+    timesteps: int
+    bytes: int
+    seconds: float
+
+    @classmethod
+    def of(cls, request) -> 'Estimate':
+        '''Estimates a CMIP6Request.'''
+        resolution = MODEL_RESOLUTIONS.get(request.model, DEFAULT_RESOLUTION)
+        size = estimate_bytes(request, resolution)
+        return cls(request, grid_cells(request.location, resolution),
+                   timesteps(request), size, estimate_seconds(size))
+
+@dataclass
+class Plan:
+    '''Estimates for a batch of CMIP6Requests.'''
+    estimates: list[Estimate] = field(default_factory=list)
+    max_workers: int = 1
+
+    @property
+    def total_bytes(self) -> int:
+        '''Total estimated bytes of the batch.'''
+        return sum(e.bytes for e in self.estimates)
+
+    @property
+    def total_seconds(self) -> float:
+        '''
+        Rough duration of the batch, with max_workers requests in flight
+        (no faster than its longest request).
+        '''
+        if not self.estimates:
+            return 0.0
+        return max(sum(e.seconds for e in self.estimates) / self.max_workers,
+                   max(e.seconds for e in self.estimates))
+
+    def largest(self, n: int = 5) -> list[Estimate]:
+        '''Returns the n largest requests.'''
+        return sorted(self.estimates, key=lambda e: e.bytes, reverse=True)[:n]
+
+    def __str__(self) -> str:
+        lines = [f'Plan: {len(self.estimates)} requests, {self.total_bytes / 2**20:,.1f} MB, '
+                 f'~{self.total_seconds / 3600:.1f} hours with {self.max_workers} worker(s).']
+        for e in self.largest():
+            lines.append(f'    {e.request.variable.value} {e.request.time_step.value} '
+                         f'{e.request.name_file()}: {e.cells} cells x {e.timesteps} steps, '
+                         f'{e.bytes / 2**20:,.1f} MB')
+        return '\n'.join(lines)
+
+def plan_requests(requests: list, max_workers: int = 1) -> Plan:
+    '''Estimates every request in a batch, without contacting the CDS.'''
+    return Plan([Estimate.of(r) for r in requests], max_workers)
@@ -0,0 +1,214 @@
+'''
+Extends already downloaded CMIP6 files with the years a request adds to them:
+only the missing years are requested from the CDS, then stitched onto the existing file along time.
+'''
+import os
+import json
+import dataclasses
+from pathlib import Path
+
+import numpy as np
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.cache import ResponseCache, Source
+from climate_data.copernicus.catalog import parse_path
+from climate_data.copernicus.client import ClientProvider
+from climate_data.copernicus.convert import ZarrConverter
+from climate_data.copernicus.index import FileIndex
+from climate_data.copernicus.metrics import Events
+from climate_data.copernicus.request import CMIP6Request, Status, ZipAction
+from climate_data.copernicus.subset import (append_time, concat_time, grid, has_extent,
+                                            has_unlimited_time)
+
+GAP_DIRECTORY = 'gaps'
+'''Directory (next to the extended files) the missing years are downloaded to.'''
+
+def existing_files(request: CMIP6Request, directory: str, index: None|FileIndex = None,
+                   file_format: str = cmip6.FileFormats.NETCDF.value
+                   ) -> list[tuple[Path, int, int]]:
+    '''
+    Returns the files already downloaded for a request's model, experiment, variable,
+    time step, months and days, with the first and last year each holds.
+
+    Note:
+        [1] With an index, files must also have the request's bbox.
+        [2] Without one, the directory (see: CMIP6Request.create_directories) is scanned,
+            and files are opened to check their grid matches the request's bbox
+            (see: subset.has_extent), the file names do not record it.
+    '''
+    first = f'{request.months[0]}{request.days[0] if request.days else ""}'
+    last = f'{request.months[-1]}{request.days[-1] if request.days else ""}'
+    found = []
+    if index is not None:
+        wanted = request.request
+        rows = index.search(model=request.model, experiment=request.experiment,
+                            variable=request.variable, time_step=request.time_step,
+                            **dict(zip(('north', 'west', 'south', 'east'), request.location)))
+        for row in rows:
+            held = json.loads(row['payload'] or 'null')
+            if (held is None or held['format'] != file_format
+                    or held['request']['month'] != list(wanted['month'])
+                    or held['request'].get('day') != (list(wanted['day'])
+                                                      if 'day' in wanted else None)):
+                continue
+            path = index.base / row['path']
+            if path.exists():
+                found.append((path, row['first_year'], row['last_year']))
+        return found
+    for path in sorted(Path(directory).glob(f'{request.model.value}_*{file_format}')):
+        entry = parse_path(path)
+        if (entry is None or entry.model != request.model.value # e.g. not cesm2_waccm for cesm2.
+                or entry.experiment != request.experiment.value
+                or entry.start[4:] != first or entry.end[4:] != last
+                or not has_extent(path, request.location)):
+            continue
+        found.append((path, int(entry.start[:4]), int(entry.end[:4])))
+    return found
+
+def missing_years(request: CMIP6Request, first: int,
+                  last: int) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    '''
+    Returns the years a request needs before, and after, a file holding first to last,
+    so the extended file has no gap (empty if the request does not reach past the file).
+    '''
+    years = [int(y) for y in request.years]
+    possible = cmip6.default_years(request.experiment)
+    before = tuple(y for y in possible if min(years) <= int(y) < first)
+    after = tuple(y for y in possible if last < int(y) <= max(years))
+    return before, after
+
+def find_extendable(request: CMIP6Request, directory: str, index: None|FileIndex = None,
+                    file_format: str = cmip6.FileFormats.NETCDF.value
+                    ) -> None|tuple[Path, int, int]:
+    '''
+    Returns the existing file that a request overlaps (or adjoins) the most,
+    with its first and last year, None if there is not one.
+    '''
+    years = [int(y) for y in request.years]
+    best, best_overlap = None, -1
+    for path, first, last in existing_files(request, directory, index, file_format):
+        if min(years) > last + 1 or max(years) < first - 1:
+            continue
+        overlap = sum(first <= y <= last for y in years)
+        if overlap > best_overlap:
+            best, best_overlap = (path, first, last), overlap
+    return best
+
+def download_extended(request: CMIP6Request, directory: str,
+                      file_format: str = cmip6.FileFormats.NETCDF.value,
+                      cache: None|ResponseCache = None,
+                      provider: None|ClientProvider = None,
+                      zip_action: ZipAction = ZipAction.KEEP,
+                      index: None|FileIndex = None,
+                      converter: None|ZarrConverter = None,
+                      events: None|Events = None) -> str:
+    '''
+    Downloads only the years a request adds to an existing file (see: find_extendable),
+    then stitches them onto it, and renames it to the combined years' name_file().
+    Requests without an existing file are downloaded in full.
+
+    Note:
+        [1] The request's years become the combined years, and its file chain holds the zips
+            of the missing years, then the extended file.
+        [2] Later years are appended in place when the file's time dimension is unlimited
+            (files written by an earlier extension are), otherwise the file is rewritten.
+            Earlier years always rewrite it.
+        [3] A file holding all of the request's years is returned as is (source: index).
+        [4] The index entry of the file is replaced, and the converter is passed
+            the extended file, its store only takes the later years.
+        [5] If a missing block fails, or its grid differs from the file's,
+            the existing file is left unchanged.
+    '''
+    existing = find_extendable(request, directory, index, file_format)
+    if existing is None:
+        return request.download(directory, file_format=file_format, cache=cache,
+                                provider=provider, zip_action=zip_action, index=index,
+                                converter=converter, events=events)
+    path, first, last = existing
+    before, after = missing_years(request, first, last)
+    start, end = int(before[0]) if before else first, int(after[-1]) if after else last
+    combined = tuple(y for y in cmip6.default_years(request.experiment) if start <= int(y) <= end)
+    if not before and not after:
+        request.years = combined
+        request.file_chain = [path]
+        request.status = Status.SUCCESS
+        request.source = Source.INDEX
+        return str(path)
+
+    gap_directory = Path(directory) / GAP_DIRECTORY
+    gap_directory.mkdir(exist_ok=True)
+    gaps = [dataclasses.replace(request, years=years) for years in (before, after) if years]
+    print(f'Extending {path.name} with {len(before) + len(after)} years.')
+    for gap in gaps:
+        gap.download(gap_directory, overwrite=True, file_format=file_format, cache=cache,
+                     provider=provider, zip_action=zip_action, events=events)
+    failed = [g for g in gaps if g.status != Status.SUCCESS]
+    if failed:
+        request.status = Status.ERROR
+        request.error = failed[0].error
+        return f'Error: {failed[0].error}'
+
+    lat, lon = grid(path)
+    for gap in gaps:
+        gap_lat, gap_lon = grid(gap.file_chain[-1])
+        if not (np.array_equal(lat, gap_lat) and np.array_equal(lon, gap_lon)):
+            request.status = Status.ERROR
+            request.error = ValueError(
+                f'The grid of {path.name} does not match the missing years downloaded.')
+            return f'Error: {request.error}'
+
+    request.years = combined
+    target = Path(directory) / request.create_or_name_file('', file_format)
+    if not before and has_unlimited_time(path):
+        append_time(path, gaps[-1].file_chain[-1])
+        os.replace(path, target)
+    else:
+        partial = target.with_name(f'{target.name}.part')
+        sources = [path]
+        if before:
+            sources.insert(0, gaps[0].file_chain[-1])
+        if after:
+            sources.append(gaps[-1].file_chain[-1])
+        try:
+            concat_time(sources, partial)
+        except Exception:
+            partial.unlink(missing_ok=True)
+            raise
+        os.replace(partial, target)
+        path.unlink()
+    request.file_chain = []
+    for gap in gaps:
+        request.file_chain.extend(gap.file_chain[:-1]) # zip of each block, unless deleted.
+        Path(gap.file_chain[-1]).unlink()
+    request.file_chain.append(target)
+    if index is not None:
+        index.remove(path.resolve())
+        index.add(target.resolve(), request.request, None, file_format)
+    if converter is not None:
+        converter.convert(target)
+    request.status = Status.SUCCESS
+    request.source = Source.EXTENDED
+    return str(target)
+
+def download_extended_requests(requests: list[CMIP6Request], base_directory: str,
+                               file_format: str = cmip6.FileFormats.NETCDF.value,
+                               cache: None|ResponseCache = None,
+                               provider: None|ClientProvider = None,
+                               zip_action: ZipAction = ZipAction.KEEP,
+                               index: None|FileIndex = None,
+                               converter: None|ZarrConverter = None,
+                               events: None|Events = None) -> list[str]:
+    '''
+    Batch process a list of CMIP6 requests (e.g. from build_CMIP6Requests),
+    extending the files already downloaded with download_extended.
+    Returns the file paths ('' for requests that failed).
+    '''
+    print(f'Downloading {len(requests)} requests to: {base_directory}')
+    for i, r in enumerate(requests):
+        download_extended(r, r.create_directories(base_directory), file_format, cache, provider,
+                          zip_action, index, converter, events)
+        source = f' ({r.source.value})' if r.source else ''
+        print(f'''    {[i]} {r.status}{source}: {Path(r.file_chain[-1]).name if r.file_chain else ''}''')
+    success_count = sum(1 for r in requests if r.status == Status.SUCCESS)
+    print(f'Successfully processed {success_count} of {len(requests)} requests.')
+    return [str(r.file_chain[-1]) if r.file_chain else '' for r in requests]
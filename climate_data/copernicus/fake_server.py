@@ -0,0 +1,258 @@
+'''
+Local stand-in for the Copernicus CDS API, for testing and benchmarking the download pipeline
+offline: FakeCDSServer serves synthetic NetCDF results (see: synthetic_dataset) over HTTP.
+'''
+import json
+import time
+import random
+import http.server
+import zipfile
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from climate_data.copernicus.client import ClientProvider
+
+def synthetic_dataset(request: dict[str, any]) -> xr.Dataset:
+    '''Builds a one degree dataset covering a CDS request payload.'''
+    years, months = request['year'], request['month']
+    if request['temporal_resolution'] == 'daily':
+        time = pd.date_range(f'{years[0]}-01-01', f'{years[-1]}-12-31', freq='D')
+        days = [int(d) for d in request.get('day') or range(1, 32)]
+        time = time[time.year.isin([int(y) for y in years]) &
+                    time.month.isin([int(m) for m in months]) & time.day.isin(days)]
+    else:
+        time = pd.date_range(f'{years[0]}-01-01', f'{years[-1]}-12-31', freq='MS')
+        time = time[time.year.isin([int(y) for y in years]) &
+                    time.month.isin([int(m) for m in months])]
+    n, w, s, e = request['area']
+    lat, lon = np.arange(s, n) + 0.5, np.arange(w, e) + 0.5
+    data = np.arange(time.size * lat.size * lon.size, dtype='float32')
+    return xr.Dataset(
+        {request['variable']: (('time', 'lat', 'lon'),
+                               data.reshape(time.size, lat.size, lon.size))},
+        coords={'time': time, 'lat': lat, 'lon': lon})
+
+def write_zip(target: str, request: dict[str, any], netcdf: bool = False) -> str:
+    '''
+    Writes a zip holding a single .nc member to the target path,
+    the member is a valid NetCDF file covering the request if netcdf is True.
+    '''
+    name = f'{request["variable"]}_{request["model"]}.nc'
+    with zipfile.ZipFile(target, 'w') as z:
+        if netcdf:
+            with tempfile.TemporaryDirectory() as tmp:
+                synthetic_dataset(request).to_netcdf(Path(tmp) / name)
+                z.write(Path(tmp) / name, name)
+        else:
+            z.writestr(name, b'CDF\x01')
+    return str(target)
+class FakeCDSServer:
+    '''
+    Local HTTP stand-in for the (legacy) CDS API, used through cdsapi's own client
+    (see: provider), so the whole download pipeline runs offline.
+
+    Jobs are POSTed to /resources/<dataset>, polled at /tasks/<id>,
+    and their zipped NetCDF results served from /results/<id>.zip (with Range requests).
+
+    Note:
+        [1] latency is the seconds a job runs, once one of the max_active running slots
+            is free (the per-user CDS quota), jobs beyond max_active wait queued.
+        [2] bandwidth throttles each result transfer to bytes per second (None: unthrottled).
+        [3] failure_rate is the fraction of jobs that end failed, drop_rate the fraction
+            whose first transfer is cut off half way (drawn from a seeded generator).
+        [4] Submissions beyond max_queued jobs not yet completed are rejected
+            with 429 Too Many Requests, like the CDS rejects users over their queue limit.
+        [5] Results are synthetic NetCDF files covering each request (see: write_zip),
+            or the same payload bytes for every job if one is provided.
+    '''
+    def __init__(self, latency: float = 0.0, bandwidth: None|float = None,
+                 failure_rate: float = 0.0, drop_rate: float = 0.0,
+                 max_active: None|int = None, max_queued: None|int = None,
+                 payload: None|bytes = None, seed: int = 0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.payload = payload
+        self.jobs: dict[str, dict[str, any]] = {}
+        self.submitted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.peak_active = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            '''Serves the CDS API endpoints.'''
+            protocol_version = 'HTTP/1.1' # keep-alive, like the CDS.
+
+            def reply(self, code: int, body: dict[str, any]) -> None:
+                '''Sends a JSON response.'''
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self): # pylint: disable=invalid-name
+                '''Submits a job.'''
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                code, body = server.submit(request)
+                self.reply(code, body)
+
+            def do_GET(self): # pylint: disable=invalid-name
+                '''Serves the status, a job's state, or a job's result.'''
+                parts = self.path.strip('/').split('/')
+                if parts == ['status.json']:
+                    self.reply(200, {})
+                elif len(parts) == 2 and parts[0] == 'tasks':
+                    self.reply(*server.state(parts[1]))
+                elif len(parts) == 2 and parts[0] == 'results':
+                    self.send_result(parts[1].removesuffix('.zip'))
+                else:
+                    self.reply(404, {'message': f'Not found: {self.path}'})
+
+            def do_DELETE(self): # pylint: disable=invalid-name
+                '''Deletes a job.'''
+                with server._lock: # pylint: disable=protected-access
+                    server.jobs.pop(self.path.strip('/').split('/')[-1], None)
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def send_result(self, request_id: str) -> None:
+                '''Streams a result at the server bandwidth, from a Range offset if given.'''
+                job = server.jobs.get(request_id)
+                if job is None or job['state'] != 'completed':
+                    self.reply(404, {'message': f'No result for {request_id}.'})
+                    return
+                payload = memoryview(server.result(job))
+                start = 0
+                header = self.headers.get('Range')
+                if header:
+                    start = int(header.split('=')[1].split('-')[0])
+                    self.send_response(206)
+                    self.send_header('Content-Range',
+                                     f'bytes {start}-{len(payload) - 1}/{len(payload)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/zip')
+                self.send_header('Content-Length', str(len(payload) - start))
+                self.end_headers()
+                end = len(payload)
+                if job['drop'] and not header:
+                    job['drop'] = False
+                    server.dropped += 1
+                    end = len(payload) // 2
+                    self.close_connection = True
+                step = 2**16
+                started = time.perf_counter()
+                for offset in range(start, end, step):
+                    stop = min(offset + step, end)
+                    if server.bandwidth:
+                        due = (stop - start) / server.bandwidth
+                        time.sleep(max(0.0, due - (time.perf_counter() - started)))
+                    self.wfile.write(payload[offset:stop])
+                with server._lock: # pylint: disable=protected-access
+                    server.bytes_sent += end - start
+
+            def log_message(self, *args): # pylint: disable=arguments-differ
+                '''Silences request logging.'''
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def submit(self, request: dict[str, any]) -> tuple[int, dict[str, any]]:
+        '''Queues a job, returns the response code and body.'''
+        with self._lock:
+            self._advance()
+            pending = sum(1 for j in self.jobs.values() if j['state'] in ('queued', 'running'))
+            if self.max_queued is not None and pending >= self.max_queued:
+                self.rejected += 1
+                return 429, {'message': 'Too many queued requests.',
+                             'reason': f'At most {self.max_queued} requests may be queued.'}
+            self.submitted += 1
+            request_id = f'job-{self.submitted}'
+            self.jobs[request_id] = {
+                'request': request, 'state': 'queued', 'started': None, 'payload': None,
+                'fail': self._random.random() < self.failure_rate,
+                'drop': self._random.random() < self.drop_rate}
+            self._advance()
+        return 202, self._reply(request_id)
+
+    def state(self, request_id: str) -> tuple[int, dict[str, any]]:
+        '''Returns the response code and body of a job's state.'''
+        with self._lock:
+            if request_id not in self.jobs:
+                return 404, {'message': f'Request {request_id} not found.'}
+            self._advance()
+        return 200, self._reply(request_id)
+
+    def result(self, job: dict[str, any]) -> bytes:
+        '''Returns a completed job's zipped result, built on first use.'''
+        if self.payload is not None:
+            return self.payload
+        if job['payload'] is None:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / 'result.zip'
+                write_zip(path, job['request'], netcdf=True)
+                job['payload'] = path.read_bytes()
+        return job['payload']
+
+    def _advance(self) -> None:
+        '''Starts queued jobs in submission order while slots are free, completes finished jobs.'''
+        now = time.monotonic()
+        running = [j for j in self.jobs.values() if j['state'] == 'running']
+        for job in running:
+            if now - job['started'] >= self.latency:
+                job['state'] = 'failed' if job['fail'] else 'completed'
+        active = sum(1 for j in self.jobs.values() if j['state'] == 'running')
+        for job in self.jobs.values():
+            if job['state'] != 'queued':
+                continue
+            if self.max_active is not None and active >= self.max_active:
+                break
+            job['state'], job['started'] = 'running', now
+            active += 1
+            if self.latency <= 0:
+                job['state'] = 'failed' if job['fail'] else 'completed'
+                active -= 1
+            self.peak_active = max(self.peak_active, active)
+
+    def _reply(self, request_id: str) -> dict[str, any]:
+        '''Returns a job's reply, in the legacy CDS API format (results are built unlocked).'''
+        job = self.jobs[request_id]
+        reply = {'request_id': request_id, 'state': job['state']}
+        if reply['state'] == 'completed':
+            reply.update(location=f'{self.url}/results/{request_id}.zip',
+                         content_type='application/zip',
+                         content_length=len(self.result(job)))
+        elif reply['state'] == 'failed':
+            reply['error'] = {'message': 'The job has failed',
+                              'reason': 'Simulated server error'}
+        return reply
+
+    def provider(self, **client_kwargs: any) -> ClientProvider:
+        '''Returns a provider of cdsapi clients talking to this server.'''
+        return ClientProvider(url=self.url, key='1:fake-key', quiet=True,
+                              **{'sleep_max': 0.1, 'retry_max': 3, **client_kwargs})
+
+    def __enter__(self) -> 'FakeCDSServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,193 @@
+'''
+Persistent (SQLite) index of the files downloaded under a base directory,
+so existence, coverage and missing data checks are lookups instead of directory scans.
+'''
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.cache import covers, request_payload
+from climate_data.copernicus.catalog import parse_path
+
+FILE_NAME = 'index.sqlite'
+'''Index file name, in the base directory.'''
+
+HASH_CHUNK_SIZE = 16 * 2**20
+'''Bytes read at a time when computing a checksum.'''
+
+COLUMNS = ('path', 'model', 'experiment', 'variable', 'time_step',
+           'north', 'west', 'south', 'east', 'first_year', 'last_year',
+           'size', 'checksum', 'payload', 'updated')
+
+def checksum(path: str) -> str:
+    '''Returns the sha256 hex digest of a file.'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class FileIndex:
+    '''
+    Records each downloaded file's model, experiment, variable, time step,
+    bounding box, year range, size and checksum, keyed by its path relative to the base directory.
+
+    Note:
+        [1] Entries are added by CMIP6Request.download and unzip_file (when an index is passed),
+            files written any other way can be added with add() or rebuild().
+        [2] Files removed outside of this module are not noticed until rebuild() is called.
+        [3] A single connection is shared by worker threads, behind a lock.
+    '''
+    def __init__(self, base_directory: str, file_name: str = FILE_NAME):
+        self.base = Path(base_directory)
+        self.path = self.base / file_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute(
+                '''CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY, model TEXT, experiment TEXT, variable TEXT,
+                    time_step TEXT, north REAL, west REAL, south REAL, east REAL,
+                    first_year INTEGER, last_year INTEGER, size INTEGER, checksum TEXT,
+                    payload TEXT, updated REAL)''')
+            self._connection.execute(
+                '''CREATE INDEX IF NOT EXISTS files_dataset
+                    ON files (variable, time_step, model, experiment)''')
+
+    def close(self) -> None:
+        '''Closes the database connection.'''
+        self._connection.close()
+
+    def __enter__(self) -> 'FileIndex':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def relative(self, path: str) -> str:
+        '''Returns a path relative to the base directory (the index key), relative paths are kept.'''
+        path = Path(path)
+        if path.is_absolute():
+            path = Path(os.path.relpath(path, self.base.resolve()))
+        return path.as_posix()
+
+    def add(self, path: str, request: None|dict[str, any] = None,
+            digest: None|str = None,
+            file_format: str = cmip6.FileFormats.NETCDF.value) -> dict[str, any]:
+        '''
+        Inserts or replaces the entry for a file, returns it.
+
+        Note:
+            [1] request is the CDS request dictionary (see: CMIP6Request.request),
+                without one the fields are parsed from the file name and the bbox is unknown.
+            [2] The checksum is computed from the file unless it is provided.
+        '''
+        path = Path(path)
+        path = (path if path.is_absolute() else self.base / path).resolve()
+        if request is not None:
+            payload = request_payload(request, cmip6.DATASET, file_format)
+            years = [int(y) for y in request['year']]
+            fields = {'model': request['model'], 'experiment': request['experiment'],
+                      'variable': request['variable'],
+                      'time_step': request['temporal_resolution'],
+                      **dict(zip(('north', 'west', 'south', 'east'), request['area'])),
+                      'first_year': min(years), 'last_year': max(years),
+                      'payload': json.dumps(payload)}
+        else:
+            entry = parse_path(path)
+            if entry is None:
+                raise ValueError(f'Cannot index {path}, it does not follow the cmip6 file layout.')
+            fields = {'model': entry.model, 'experiment': entry.experiment,
+                      'variable': entry.variable, 'time_step': entry.time_step,
+                      'north': None, 'west': None, 'south': None, 'east': None,
+                      'first_year': int(entry.start[:4]), 'last_year': int(entry.end[:4]),
+                      'payload': None}
+        fields = {'path': self.relative(path), **fields, 'size': path.stat().st_size,
+                  'checksum': digest or checksum(path), 'updated': time.time()}
+        with self._lock, self._connection:
+            self._connection.execute(
+                f'''INSERT OR REPLACE INTO files ({', '.join(COLUMNS)})
+                    VALUES ({', '.join('?' * len(COLUMNS))})''',
+                [fields[c] for c in COLUMNS])
+        return fields
+
+    def remove(self, path: str) -> None:
+        '''Removes the entry for a file.'''
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM files WHERE path = ?', (self.relative(path),))
+
+    def get(self, path: str) -> None|dict[str, any]:
+        '''Returns the entry for a file, None if it is not indexed.'''
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT * FROM files WHERE path = ?', (self.relative(path),)).fetchone()
+        return None if row is None else dict(row)
+
+    def exists(self, path: str) -> bool:
+        '''Returns True if a file is indexed.'''
+        return self.get(path) is not None
+
+    def search(self, **fields: any) -> list[dict[str, any]]:
+        '''Returns the entries with the provided field values (see: COLUMNS), e.g. model='cesm2'.'''
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown index fields: {unknown}.')
+        where = ' AND '.join(f'{name} = ?' for name in fields) or '1'
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(
+                f'SELECT * FROM files WHERE {where} ORDER BY path',
+                [v.value if hasattr(v, 'value') else v for v in fields.values()])]
+
+    def covering(self, request: dict[str, any],
+                 file_format: str = cmip6.FileFormats.NETCDF.value) -> list[dict[str, any]]:
+        '''
+        Returns the entries of files holding all the data of a CDS request dictionary,
+        i.e. an enclosing bbox and a superset of its years, months and days.
+        '''
+        wanted = request_payload(request, cmip6.DATASET, file_format)
+        years = [int(y) for y in request['year']]
+        n, w, s, e = request['area']
+        with self._lock:
+            rows = self._connection.execute(
+                '''SELECT * FROM files WHERE variable = ? AND time_step = ? AND model = ?
+                    AND experiment = ? AND first_year <= ? AND last_year >= ?
+                    AND north >= ? AND west <= ? AND south <= ? AND east >= ?''',
+                (request['variable'], request['temporal_resolution'], request['model'],
+                 request['experiment'], min(years), max(years), n, w, s, e)).fetchall()
+        return [dict(row) for row in rows if covers(json.loads(row['payload']), wanted)]
+
+    def missing(self, requests: list, file_format: str = cmip6.FileFormats.NETCDF.value) -> list:
+        '''Returns the CMIP6Requests whose data is not held by any indexed file.'''
+        return [r for r in requests if not self.covering(r.request, file_format)]
+
+    def rebuild(self) -> int:
+        '''
+        Rescans the cmip6 tree under the base directory (see: catalog.Catalog),
+        drops entries of deleted files and adds unindexed files, returns the number of files.
+        '''
+        with self._lock:
+            indexed = {row['path'] for row in self._connection.execute('SELECT path FROM files')}
+        root = self.base / 'cmip6'
+        found = set()
+        if root.exists():
+            for path in root.glob('*/*/*'):
+                if path.is_file() and parse_path(path) is not None:
+                    found.add(self.relative(path.resolve()))
+        for path in indexed - found:
+            self.remove(path)
+        for path in found - indexed:
+            self.add(path)
+        return len(found)
+
+    def summary(self) -> dict[str, int]:
+        '''Returns the number of indexed files and their total size in bytes.'''
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes FROM files').fetchone()
+        return dict(row)
@@ -0,0 +1,95 @@
+'''
+Persistent (SQLite) manifest of a batch of CDS requests,
+so an interrupted batch can be restarted where it left off.
+'''
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+FILE_NAME = 'manifest.sqlite'
+'''Manifest file name, in the batch's base directory.'''
+
+COLUMNS = ('key', 'payload', 'job_id', 'status', 'submitted', 'completed',
+           'finished', 'bytes', 'paths', 'error', 'updated')
+
+class Manifest:
+    '''
+    Records each request's canonical payload, CDS job id, status, timings,
+    bytes downloaded and output paths, keyed by its request_key.
+
+    Note:
+        [1] Timings are unix timestamps: submitted to the CDS, completed by the CDS,
+            and finished (transferred and unzipped).
+        [2] Completed requests are held in memory, so skipping them is a dictionary lookup.
+        [3] A single connection is shared by worker threads, behind a lock.
+    '''
+    def __init__(self, base_directory: str, file_name: str = FILE_NAME):
+        self.path = Path(base_directory) / file_name
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute(
+                '''CREATE TABLE IF NOT EXISTS requests (
+                    key TEXT PRIMARY KEY, payload TEXT, job_id TEXT, status TEXT,
+                    submitted REAL, completed REAL, finished REAL, bytes INTEGER,
+                    paths TEXT, error TEXT, updated REAL)''')
+        self._completed: dict[str, list[str]] = {
+            row['key']: json.loads(row['paths']) for row in self._connection.execute(
+                "SELECT key, paths FROM requests WHERE status = 'success'")}
+
+    def close(self) -> None:
+        '''Closes the database connection.'''
+        self._connection.close()
+
+    def __enter__(self) -> 'Manifest':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get(self, key: str) -> None|dict[str, any]:
+        '''Returns the recorded entry for a request key, None if there is none.'''
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT * FROM requests WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry['payload'] = json.loads(entry['payload']) if entry['payload'] else None
+        entry['paths'] = json.loads(entry['paths']) if entry['paths'] else []
+        return entry
+
+    def completed(self, key: str) -> None|list[str]:
+        '''Returns the output paths of a successfully completed request, None otherwise.'''
+        return self._completed.get(key)
+
+    def record(self, key: str, **fields: any) -> None:
+        '''Inserts or updates a request's entry with the provided fields (see: COLUMNS).'''
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f'Unknown manifest fields: {unknown}.')
+        if 'payload' in fields:
+            fields['payload'] = json.dumps(fields['payload'])
+        if 'paths' in fields:
+            fields['paths'] = json.dumps([str(p) for p in fields['paths']])
+        fields['updated'] = time.time()
+        names = ', '.join(fields)
+        updates = ', '.join(f'{name} = excluded.{name}' for name in fields)
+        with self._lock, self._connection:
+            self._connection.execute(
+                f'''INSERT INTO requests (key, {names}) VALUES (?{', ?' * len(fields)})
+                    ON CONFLICT(key) DO UPDATE SET {updates}''',
+                (key, *fields.values()))
+            if fields.get('status') == 'success':
+                self._completed[key] = json.loads(fields.get('paths', '[]'))
+            elif 'status' in fields:
+                self._completed.pop(key, None)
+
+    def summary(self) -> dict[str, int]:
+        '''Returns the number of recorded requests in each status.'''
+        with self._lock:
+            return {row['status']: row['n'] for row in self._connection.execute(
+                'SELECT status, COUNT(*) AS n FROM requests GROUP BY status')}
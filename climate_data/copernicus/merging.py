@@ -0,0 +1,170 @@
+'''
+Merges the requests of a batch that overlap (the same model, experiment, variable and time step,
+with overlapping or adjacent years, or nested areas) into fewer CDS requests,
+then cuts each original request's file out of the merged downloads.
+'''
+import dataclasses
+from pathlib import Path
+from dataclasses import dataclass, field
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.cache import (ResponseCache, Source, covers, link_or_copy,
+                                           request_payload)
+from climate_data.copernicus.client import ClientProvider
+from climate_data.copernicus.chunking import DEFAULT_MAX_BYTES
+from climate_data.copernicus.clustering import union
+from climate_data.copernicus.estimate import estimate_bytes
+from climate_data.copernicus.request import CMIP6Request, Status, download_requests
+from climate_data.copernicus.subset import subset_file
+
+MERGED_DIRECTORY = 'merged'
+'''Directory (in the base directory) merged requests are downloaded to.'''
+
+@dataclass
+class Merge:
+    '''A merged request, and the indices of the batch requests it holds.'''
+    request: CMIP6Request
+    members: list[int]
+    bytes: int = 0
+
+@dataclass
+class MergePlan:
+    '''Merged requests for a batch, and their estimated savings.'''
+    merges: list[Merge] = field(default_factory=list)
+    naive_requests: int = 0
+    naive_bytes: int = 0
+    requests: int = 0
+    bytes: int = 0
+
+    def __str__(self) -> str:
+        lines = [f'Merges: {self.naive_requests} requests -> {self.requests} '
+                 f'({self.naive_requests - self.requests} jobs saved), '
+                 f'{self.naive_bytes / 2**20:,.1f} MB -> {self.bytes / 2**20:,.1f} MB '
+                 f'({(self.naive_bytes - self.bytes) / 2**20:,.1f} MB saved).']
+        for m in self.merges:
+            if len(m.members) > 1:
+                lines.append(f'    {m.request.name_file()} {m.request.location}: '
+                             f'requests {m.members}')
+        return '\n'.join(lines)
+
+def merge_key(request: CMIP6Request) -> tuple:
+    '''Returns the fields requests must share to be merged.'''
+    return (request.model, request.experiment, request.variable, request.time_step,
+            tuple(request.months), request.days and tuple(request.days))
+
+def merged(a: CMIP6Request, b: CMIP6Request) -> CMIP6Request:
+    '''Returns the request for the union of two requests' areas and (consecutive) years.'''
+    years = [int(y) for y in (*a.years, *b.years)]
+    return dataclasses.replace(
+        a, location=union(a.location, b.location),
+        years=tuple(y for y in cmip6.default_years(a.experiment)
+                    if min(years) <= int(y) <= max(years)))
+
+def plan_merges(requests: list[CMIP6Request], max_bytes: int = DEFAULT_MAX_BYTES) -> MergePlan:
+    '''
+    Greedily merges requests sharing a merge_key while the merged request is estimated
+    to be no larger than the two it replaces (and under max_bytes),
+    so no more data is downloaded than without merging.
+
+    Note:
+        [1] Duplicates, overlapping or adjacent years over the same area, and nested areas
+            over the same years merge; disjoint years or areas would download data
+            no request asked for, and do not.
+        [2] The pair saving the most bytes is merged first, until no merge qualifies.
+    '''
+    groups: dict[tuple, list[Merge]] = {}
+    for i, r in enumerate(requests):
+        # a copy, so the batch's own requests only record their cut files.
+        groups.setdefault(merge_key(r), []).append(Merge(dataclasses.replace(r), [i],
+                                                         estimate_bytes(r)))
+    merges = []
+    for group in groups.values():
+        while len(group) > 1:
+            best, best_saving = None, -1
+            for i, a in enumerate(group):
+                for j in range(i + 1, len(group)):
+                    b = group[j]
+                    request = merged(a.request, b.request)
+                    size = estimate_bytes(request)
+                    if size > max_bytes or size > a.bytes + b.bytes:
+                        continue
+                    if a.bytes + b.bytes - size > best_saving:
+                        best, best_saving = (i, j, request, size), a.bytes + b.bytes - size
+            if best is None:
+                break
+            i, j, request, size = best
+            group[i] = Merge(request, sorted(group[i].members + group[j].members), size)
+            group.pop(j)
+        merges.extend(group)
+    merges.sort(key=lambda m: m.members[0])
+    return MergePlan(merges, len(requests), sum(estimate_bytes(r) for r in requests),
+                     len(merges), sum(m.bytes for m in merges))
+
+def download_merged(requests: list[CMIP6Request], base_directory: str,
+                    overwrite: bool = False,
+                    file_format: str = cmip6.FileFormats.NETCDF.value,
+                    max_bytes: int = DEFAULT_MAX_BYTES,
+                    max_workers: int = 1,
+                    cache: None|ResponseCache = None,
+                    provider: None|ClientProvider = None,
+                    keep_merged: bool = False) -> list[str]:
+    '''
+    Downloads a batch as fewer merged requests (see: plan_merges),
+    then cuts each request's file from its merged file.
+    Returns each request's file path ('' for requests that failed).
+
+    Note:
+        [1] Merged requests are downloaded to base_directory/merged, each request's file is
+            written to the usual layout under base_directory (its source is merged),
+            or under base_directory/<area> (see: CMIP6Request.name_area) if the batch
+            holds several areas, as file names do not record the area.
+        [2] A merged request identical to the request it holds is linked (or copied), not cut.
+        [3] Merged files are removed once every request is cut, unless keep_merged is True.
+        [4] A request whose file exists (and overwrite is False) records a FileExistsError.
+    '''
+    plan = plan_merges(requests, max_bytes)
+    print(plan)
+    directory = Path(base_directory) / MERGED_DIRECTORY
+    directory.mkdir(exist_ok=True)
+    batch = [m.request for m in plan.merges]
+    download_requests(batch, directory, overwrite=overwrite, file_format=file_format,
+                      max_workers=max_workers, cache=cache, provider=provider)
+
+    areas = len({tuple(r.location) for r in requests}) > 1
+    written: set[Path] = set()
+    for m in plan.merges:
+        source = m.request
+        for i in m.members:
+            r = requests[i]
+            if source.status != Status.SUCCESS:
+                r.status, r.error = Status.ERROR, source.error
+                continue
+            base = Path(base_directory) / r.name_area() if areas else Path(base_directory)
+            base.mkdir(exist_ok=True)
+            target = Path(r.create_directories(base)) / f'{r.name_file()}{file_format}'
+            if target not in written:
+                if target.exists() and not overwrite:
+                    r.status = Status.ERROR
+                    r.error = FileExistsError(
+                        f'''File at: {str(target)} already exists,
+                        choose overwrite=True to replace existing file.''')
+                    continue
+                payload = request_payload(r.request, cmip6.DATASET, file_format)
+                if covers(payload, request_payload(source.request, cmip6.DATASET, file_format)):
+                    target.unlink(missing_ok=True)
+                    link_or_copy(Path(source.file_chain[-1]), target)
+                else:
+                    subset_file(source.file_chain[-1], target, r.location, r.years,
+                                r.months, r.days)
+                written.add(target)
+            r.file_chain = [target]
+            r.status = Status.SUCCESS
+            r.source = Source.MERGED
+    if not keep_merged:
+        for request in batch:
+            for path in request.file_chain:
+                Path(path).unlink(missing_ok=True)
+    success_count = sum(1 for r in requests if r.status == Status.SUCCESS)
+    print(f'Successfully processed {success_count} of {len(requests)} requests '
+          f'with {len(batch)} CDS requests.')
+    return [str(r.file_chain[-1]) if r.file_chain else '' for r in requests]
@@ -0,0 +1,156 @@
+'''
+Per-request timing events for the download pipeline, and their batch summary.
+
+Requests emit an Event (with a monotonic timestamp) as they are submitted, queued, run,
+transferred and extracted. Events are passed to sinks: any callable, a JsonLinesSink,
+and the Summary each Events emitter keeps, which reports per-stage percentiles and throughput.
+'''
+import json
+import time
+import threading
+from enum import Enum
+from pathlib import Path
+from dataclasses import dataclass
+
+import numpy as np
+
+class Stage(Enum):
+    '''Pipeline stage a request enters.'''
+    SUBMIT = 'submit'                   # sent to the CDS.
+    QUEUED = 'queued'                   # accepted by the CDS.
+    RUNNING = 'running'                 # being processed by the CDS.
+    COMPLETED = 'completed'             # result ready to transfer.
+    TRANSFER_START = 'transfer_start'
+    TRANSFER_END = 'transfer_end'       # bytes: size of the zip transferred.
+    EXTRACT_START = 'extract_start'
+    EXTRACT_END = 'extract_end'         # bytes: size of the file extracted.
+    DONE = 'done'                       # finished by download_requests, successfully.
+    ERROR = 'error'                     # finished by download_requests, with an error.
+
+STAGES: dict[str, tuple[Stage, Stage]] = {
+    'submit': (Stage.SUBMIT, Stage.QUEUED),
+    'queue': (Stage.QUEUED, Stage.RUNNING),
+    'run': (Stage.RUNNING, Stage.COMPLETED),
+    'server': (Stage.QUEUED, Stage.COMPLETED),
+    'transfer': (Stage.TRANSFER_START, Stage.TRANSFER_END),
+    'extract': (Stage.EXTRACT_START, Stage.EXTRACT_END),
+}
+'''Durations reported by a Summary, as the events they start and end at.'''
+
+@dataclass(frozen=True)
+class Event:
+    '''A request entering a pipeline stage, at a time.monotonic() timestamp.'''
+    request: str
+    stage: Stage
+    time: float
+    bytes: int = 0
+
+    def to_dict(self) -> dict[str, any]:
+        '''Returns a JSON serializable dictionary.'''
+        return {'request': self.request, 'stage': self.stage.value, 'time': self.time,
+                'bytes': self.bytes}
+
+class JsonLinesSink:
+    '''Writes events to a file, one JSON object per line (appended, so batches accumulate).'''
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._file = open(self.path, 'a', encoding='utf-8') # pylint: disable=consider-using-with
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        with self._lock:
+            self._file.write(json.dumps(event.to_dict()) + '\n')
+            self._file.flush()
+
+    def close(self) -> None:
+        '''Closes the file.'''
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> 'JsonLinesSink':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class Summary:
+    '''
+    Aggregates events into per-stage durations (see: STAGES) across a batch.
+
+    Note:
+        [1] Stages a request did not pass through are skipped (e.g. a cache hit has no transfer,
+            and a job polled once it was already completed has no queue or run stage).
+        [2] total is each request's first to last event, throughput is the bytes transferred
+            over the batch's first to last event.
+    '''
+    def __init__(self):
+        self.events: dict[str, dict[Stage, Event]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event) -> None:
+        with self._lock:
+            self.events.setdefault(event.request, {})[event.stage] = event
+
+    def durations(self, stage: str) -> list[float]:
+        '''Returns the seconds each request spent in a stage (see: STAGES), or in total.'''
+        with self._lock:
+            requests = list(self.events.values())
+        if stage == 'total':
+            return [max(e.time for e in r.values()) - min(e.time for e in r.values())
+                    for r in requests]
+        start, end = STAGES[stage]
+        return [r[end].time - r[start].time for r in requests if start in r and end in r]
+
+    def transferred(self) -> int:
+        '''Returns the bytes transferred across the batch.'''
+        with self._lock:
+            return sum(r[Stage.TRANSFER_END].bytes for r in self.events.values()
+                       if Stage.TRANSFER_END in r)
+
+    def elapsed(self) -> float:
+        '''Returns the seconds from the first to the last event.'''
+        with self._lock:
+            times = [e.time for r in self.events.values() for e in r.values()]
+        return max(times) - min(times) if times else 0.0
+
+    def report(self) -> dict[str, any]:
+        '''Returns the count, p50 and p95 seconds of each stage, and the batch throughput.'''
+        stages = {}
+        for stage in (*STAGES, 'total'):
+            values = self.durations(stage)
+            if values:
+                p50, p95 = np.percentile(values, (50, 95))
+                stages[stage] = {'count': len(values), 'p50': float(p50), 'p95': float(p95)}
+        elapsed, transferred = self.elapsed(), self.transferred()
+        return {'requests': len(self.events), 'stages': stages, 'bytes': transferred,
+                'elapsed': elapsed,
+                'mb_per_s': transferred / 2**20 / elapsed if elapsed > 0 else 0.0}
+
+    def __str__(self) -> str:
+        report = self.report()
+        lines = [f'{report["requests"]} requests, {report["bytes"] / 2**20:,.1f} MB in '
+                 f'{report["elapsed"]:.1f}s ({report["mb_per_s"]:.2f} MB/s).']
+        for stage, values in report['stages'].items():
+            lines.append(f'    {stage}: p50 {values["p50"]:.2f}s, p95 {values["p95"]:.2f}s '
+                         f'({values["count"]} requests)')
+        return '\n'.join(lines)
+
+class Events:
+    '''
+    Emits request events to sinks (callables taking an Event) and to its summary.
+
+    Note:
+        Passed to CMIP6Request.download, fetch, unzip_file or download_requests.
+        Sinks are called from the worker threads, so must be thread safe.
+    '''
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+        self.summary = Summary()
+
+    def emit(self, request: str, stage: Stage, size: int = 0) -> Event:
+        '''Timestamps an event and passes it to each sink.'''
+        event = Event(request, stage, time.monotonic(), size)
+        self.summary(event)
+        for sink in self.sinks:
+            sink(event)
+        return event
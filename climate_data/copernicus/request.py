@@ -1,21 +1,80 @@
 '''
 Makes Copernicus CDS API requests.
 '''
+import time
+import shutil
+import hashlib
 import zipfile
 from enum import Enum
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from dataclasses import dataclass, field
 
 import cdsapi
 
 import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.availability import Availability, is_unavailable_error
+from climate_data.copernicus.client import ClientProvider, default_provider
+from climate_data.copernicus.cache import ResponseCache, Source, request_key, request_payload
+from climate_data.copernicus.estimate import plan_requests
+from climate_data.copernicus.index import FileIndex
+from climate_data.copernicus.convert import ZarrConverter
+from climate_data.copernicus.manifest import Manifest
+from climate_data.copernicus.metrics import Events, Stage
+from climate_data.copernicus.retry import Failure, Retry, classify
+from climate_data.copernicus.transfer import download_result, remove_partial
+
+MAX_WORKERS = 8
+'''Maximum number of requests in flight at once, kept below the CDS per-user queue limit.'''
+
+POLL_INTERVAL = 1.0
+'''Initial seconds between server polls, grows by half each poll up to MAX_POLL_INTERVAL.'''
+MAX_POLL_INTERVAL = 120.0
+EXTRACT_CHUNK_SIZE = 16 * 2**20
+'''Bytes copied per read when streaming a file out of a zip.'''
 
 class Status(Enum):
     '''Request status.'''
     ERROR = 'error'
     SUCCESS = 'success'
     UNPROCESSED = 'unprocessed'
+    QUEUED = 'queued'           # submitted, waiting in the CDS queue.
+    RUNNING = 'running'         # being processed by the CDS.
+    COMPLETED = 'completed'     # result is ready to fetch from the CDS.
+    DOWNLOADED = 'downloaded'   # result is transferred, but not yet unzipped.
+
+class ZipAction(Enum):
+    '''What to do with a downloaded zip once its file is extracted.'''
+    KEEP = 'keep'
+    DELETE = 'delete'
+    ARCHIVE = 'archive' # move into a zip folder, next to the extracted file.
+
+SERVER_STATES: dict[str, Status] = {
+    'queued': Status.QUEUED, 'accepted': Status.QUEUED,
+    'running': Status.RUNNING,
+    'completed': Status.COMPLETED, 'successful': Status.COMPLETED,
+    'failed': Status.ERROR, 'rejected': Status.ERROR,
+    'dismissed': Status.ERROR, 'deleted': Status.ERROR,
+}
+'''Maps CDS job states (legacy and current API) to request status.'''
+
+def job_state(job) -> str:
+    '''Refreshes and returns the server state of a job handle returned by a CDS client.'''
+    if hasattr(type(job), 'status'): # ecmwf.datastores Remote
+        return job.status
+    job.update()
+    return job.reply['state']
+
+def job_id(job) -> str:
+    '''Returns the server side request id of a job handle returned by a CDS client.'''
+    return getattr(job, 'request_id', None) or job.reply['request_id']
+
+def attach_job(client, request_id: str):
+    '''Returns a handle to a job already submitted to the CDS, from its request id.'''
+    if hasattr(client, 'client'): # ecmwf.datastores LegacyClient
+        return client.client.get_remote(request_id)
+    return cdsapi.api.Result(client, {'request_id': request_id, 'state': 'queued'})
 
 @dataclass
 class CMIP6Request:
@@ -48,10 +107,29 @@ class CMIP6Request:
         if self.years is None:
             self.years = possible_years
         else: # validate years
-            if not all([y in possible_years for y in self.years]):
+            if not set(self.years).issubset(possible_years):
                 raise ValueError(f'Invalid years: {self.years}')
         self.status: Status = Status.UNPROCESSED
         self.file_chain: list[str] = []
+        self.job = None                     # CDS job handle, set by submit().
+        self.job_id: None|str = None
+        self.error: None|Exception = None
+        self.source: None|Source = None     # set when data is downloaded or served by a cache.
+        self.available: None|bool = None    # set by build_CMIP6Requests from an Availability.
+        self.events: None|Events = None     # set by the methods passed an Events emitter.
+        self.priority: int = 0              # lower values are submitted first (see: scheduler).
+
+    @property
+    def failure(self) -> None|Failure:
+        '''Returns the kind of the request's error (see: retry.classify), None without one.'''
+        return None if self.error is None else classify(self.error)
+
+    def reset(self) -> None:
+        '''Clears the status, job and error of a failed request, so it can be sent again.'''
+        self.status = Status.UNPROCESSED
+        self.job = None
+        self.job_id = None
+        self.error = None
 
     @property
     def request(self) -> dict[str, any]:
@@ -70,6 +148,16 @@ class CMIP6Request:
             request['day'] = self.days
         return request
 
+    def label(self) -> str:
+        '''Returns the name the request's events are emitted under (unique to its area and file).'''
+        return (f'{self.variable.value}/{self.time_step.value}/{self.name_area()}/'
+                f'{self.name_file()}')
+
+    def emit(self, stage: Stage, size: int = 0) -> None:
+        '''Emits an event, if the request was passed an Events emitter.'''
+        if self.events is not None:
+            self.events.emit(self.label(), stage, size)
+
     def create_directories(self, base_directory: str) -> str:
         '''
         Creates directory for CMIP6 data, at:
@@ -94,6 +182,10 @@ class CMIP6Request:
             return f'{self.years[i]}{self.months[i]}{self.days[i] if self.days else ""}'
         return f'{self.model.value}_{self.experiment.value}_{date(True)}-{date(False)}'
 
+    def name_area(self) -> str:
+        '''Creates a directory name for the request's bbox, e.g. area_23_100_13_108.'''
+        return 'area_' + '_'.join(f'{v:g}' for v in self.location)
+
     def create_or_name_file(self, file_name: str = '',
                             file_format: str = cmip6.FileFormats.NETCDF.value) -> str:
         '''Validates file names, or creates on if one is not provided.'''
@@ -107,11 +199,17 @@ class CMIP6Request:
         else: # create file name
             return f'{self.name_file()}{file_format}'
 
-    def download(self, directory: str, file_name: str = '', overwrite: bool = False,
-                 file_format: str = cmip6.FileFormats.NETCDF.value) -> str:
+    def validate_path(self, directory: str, file_name: str = '',
+                      overwrite: bool = False,
+                      file_format: str = cmip6.FileFormats.NETCDF.value) -> Path:
         '''
-        Sends a request to the Copernicus CDS API.
-        Stores the downloaded file in the specified directory.
+        Returns the path of the downloaded zip file,
+        removes an existing file (and any partial transfer to it) if overwrite is True.
+        
+        Note:
+            [1] Without overwrite, a partial transfer (.part file) is kept so it can be resumed.
+            [2] Without overwrite, the file the zip extracts to must not exist either
+                (e.g. the zip was deleted after an earlier extraction, see: ZipAction).
         '''
         # validate and set file name.
         file_name = self.create_or_name_file(file_name, cmip6.FileFormats.ZIP.value)
@@ -130,31 +228,255 @@ class CMIP6Request:
                 self.status = Status.ERROR
                 raise FileNotFoundError(
                     f'Directory at: {str(filepath.parent)} not found.')
+        extracted = filepath.with_suffix(file_format)
+        if not overwrite and extracted.exists():
+            self.status = Status.ERROR
+            raise FileExistsError(
+                f'''File at: {str(extracted)} already exists,
+                choose overwrite=True to replace existing file.''')
+        if overwrite:
+            remove_partial(filepath)
+        return filepath
+
+    def download(self, directory: str, file_name: str = '', overwrite: bool = False,
+                 file_format: str = cmip6.FileFormats.NETCDF.value,
+                 cache: None|ResponseCache = None,
+                 provider: None|ClientProvider = None,
+                 zip_action: ZipAction = ZipAction.KEEP,
+                 index: None|FileIndex = None,
+                 converter: None|ZarrConverter = None,
+                 events: None|Events = None) -> str:
+        '''
+        Sends a request to the Copernicus CDS API.
+        Stores the downloaded file in the specified directory.
+        
+        Note:
+            [1] If a cache is provided, identical earlier requests are served from it,
+                requests covered by a larger cached response are cut from it locally,
+                and new responses are added to it.
+            [2] The CDS client comes from the provider (default: client.default_provider()).
+            [3] zip_action is applied to the downloaded zip once it is extracted.
+            [4] If an index is provided, the extracted file is recorded in it.
+            [5] If a converter is provided, the extracted file is converted to its Zarr store.
+            [6] If an Events emitter is provided, the request's stages are emitted to it.
+                The job is then polled here rather than inside the CDS client,
+                so the time spent queued and running is observed.
+        '''
+        filepath = self.validate_path(directory, file_name, overwrite, file_format)
+        self.events = events or self.events
 
         # request data from CDS
         self.request['format'] = file_format
+        key = request_key(self.request, cmip6.DATASET, file_format)
+        payload = request_payload(self.request, cmip6.DATASET, file_format)
         try:
-            client = cdsapi.Client()
-            client.retrieve(cmip6.DATASET, self.request, filepath)
+            self.source = Source.REMOTE
+            if cache is not None:
+                self.serve_from_cache(filepath, cache, file_format)
+            if self.source == Source.REMOTE and self.events is None:
+                client = (provider or default_provider()).get()
+                # blocks until the result is ready, then transfers it resumably.
+                download_result(client.retrieve(cmip6.DATASET, self.request), filepath)
+            elif self.source == Source.REMOTE:
+                if self.submit(provider) is None or self.wait() != Status.COMPLETED:
+                    raise self.error
+                self.transfer(filepath)
+                self.job = None
+            if self.source == Source.REMOTE:
+                if cache is not None:
+                    cache.put(key, filepath, payload)
             self.file_chain.append(filepath)
             self.status = Status.SUCCESS
             #self.unzip_file(self.file_chain[-1], Path(file_name).stem, file_format, overwrite)
             #return str(self.file_chain[-1])
         except Exception as e: # pylint: disable=broad-except
             self.status = Status.ERROR
+            self.error = e
             return f'Error: {e}'
-        self.unzip_file(self.file_chain[-1], Path(file_name).stem, file_format, overwrite)
+        return self.extract(filepath, file_format, overwrite, zip_action, index, converter,
+                            cache)
+
+    def transfer(self, filepath: Path) -> str:
+        '''Transfers the result of a completed job to filepath, resumably (see: download_result).'''
+        self.emit(Stage.TRANSFER_START)
+        download_result(self.job, filepath)
+        self.emit(Stage.TRANSFER_END, Path(filepath).stat().st_size)
+        return str(filepath)
+
+    def serve_from_cache(self, filepath: Path, cache: ResponseCache,
+                         file_format: str = cmip6.FileFormats.NETCDF.value) -> bool:
+        '''
+        Writes the response to filepath from the cache, if it holds the request
+        (or a larger response covering it), sets the request source.
+        Returns False if the request must be sent to the CDS.
+        '''
+        key = request_key(self.request, cmip6.DATASET, file_format)
+        payload = request_payload(self.request, cmip6.DATASET, file_format)
+        if cache.get(key, filepath):
+            self.source = Source.CACHE
+        elif cache.get_subset(payload, filepath):
+            self.source = Source.SUBSET
+            cache.put(key, filepath, payload)
+        else:
+            self.source = Source.REMOTE
+        return self.source != Source.REMOTE
+
+    def submit(self, provider: None|ClientProvider = None, events: None|Events = None):
+        '''
+        Submits the request to the Copernicus CDS API without waiting for it.
+        Returns the job handle (None on error), see: poll(), wait() and fetch().
+        '''
+        self.events = events or self.events
+        try:
+            client = (provider or default_provider()).get(wait_until_complete=False)
+            self.emit(Stage.SUBMIT)
+            self.job = client.retrieve(cmip6.DATASET, self.request)
+            self.job_id = job_id(self.job)
+            self.status = Status.QUEUED
+            self.emit(Stage.QUEUED)
+        except Exception as e: # pylint: disable=broad-except
+            self.status = Status.ERROR
+            self.error = e
+            self.job = None
+        return self.job
+
+    def attach(self, request_id: str, provider: None|ClientProvider = None,
+               events: None|Events = None):
+        '''
+        Re-attaches to a job submitted earlier (e.g. by a previous run) from its request id.
+        Returns the job handle (None on error), see: poll(), wait() and fetch().
+        '''
+        self.events = events or self.events
+        try:
+            client = (provider or default_provider()).get(wait_until_complete=False)
+            self.job = attach_job(client, request_id)
+            self.job_id = request_id
+            self.status = Status.QUEUED
+        except Exception as e: # pylint: disable=broad-except
+            self.status = Status.ERROR
+            self.error = e
+            self.job = None
+        return self.job
+
+    def poll(self) -> Status:
+        '''Refreshes the request status from the server state of a submitted job.'''
+        if self.job is None:
+            raise RuntimeError('Request has not been submitted, call submit() first.')
+        previous = self.status
+        try:
+            state = job_state(self.job)
+        except Exception as e: # pylint: disable=broad-except
+            self.status = Status.ERROR
+            self.error = e
+            return self.status
+        if state not in SERVER_STATES:
+            self.status = Status.ERROR
+            self.error = ValueError(f'Unknown CDS job state: {state}.')
+        else:
+            self.status = SERVER_STATES[state]
+            if self.status == Status.ERROR:
+                self.error = RuntimeError(f'CDS job {self.job_id} is {state}.')
+            elif self.status != previous:
+                self.emit(Stage(self.status.value))
+        return self.status
+
+    def wait(self, timeout: None|float = None) -> Status:
+        '''
+        Polls a submitted job until it is completed or fails,
+        or until timeout seconds have passed.
+        '''
+        start = time.monotonic()
+        interval = POLL_INTERVAL
+        while self.poll() in (Status.QUEUED, Status.RUNNING):
+            if timeout is not None and time.monotonic() - start + interval > timeout:
+                break
+            time.sleep(interval)
+            interval = min(interval * 1.5, MAX_POLL_INTERVAL)
+        return self.status
+
+    def fetch(self, directory: str, file_name: str = '', overwrite: bool = False,
+              file_format: str = cmip6.FileFormats.NETCDF.value,
+              cache: None|ResponseCache = None,
+              zip_action: ZipAction = ZipAction.KEEP,
+              index: None|FileIndex = None,
+              converter: None|ZarrConverter = None,
+              events: None|Events = None) -> str:
+        '''
+        Transfers the result of a completed job to the specified directory,
+        then unzips it (the result is added to the cache, index and converter, if provided).
+        '''
+        if self.status != Status.COMPLETED:
+            raise RuntimeError(
+                f'Request status is {self.status}, only completed jobs can be fetched.')
+        self.events = events or self.events
+        filepath = self.validate_path(directory, file_name, overwrite, file_format)
+        try:
+            self.transfer(filepath)
+            self.source = Source.REMOTE
+            if cache is not None:
+                cache.put(request_key(self.request, cmip6.DATASET, file_format), filepath,
+                          request_payload(self.request, cmip6.DATASET, file_format))
+            self.file_chain.append(filepath)
+            self.status = Status.DOWNLOADED
+        except Exception as e: # pylint: disable=broad-except
+            self.status = Status.ERROR
+            self.error = e
+            return f'Error: {e}'
+        self.job = None # release the handle, the server may now clean up the job.
+        return self.extract(filepath, file_format, overwrite, zip_action, index, converter,
+                            cache)
+
+    def extract(self, zippath: Path, file_format: str = cmip6.FileFormats.NETCDF.value,
+                overwrite: bool = False, zip_action: ZipAction = ZipAction.KEEP,
+                index: None|FileIndex = None,
+                converter: None|ZarrConverter = None,
+                cache: None|ResponseCache = None) -> str:
+        '''
+        Unzips a transferred (or cached) zip with unzip_file, recording an error
+        rather than raising it, returns the extracted file path.
+
+        Note:
+            A corrupt response is removed from the cache, if provided,
+            so a retry fetches it from the CDS again.
+        '''
+        try:
+            self.unzip_file(zippath, zippath.stem, file_format, overwrite,
+                            zip_action=zip_action, index=index, converter=converter)
+        except Exception as e: # pylint: disable=broad-except
+            if cache is not None and isinstance(e, zipfile.BadZipFile):
+                cache.remove(request_key(self.request, cmip6.DATASET, file_format))
+            self.status = Status.ERROR
+            self.error = e
+            return f'Error: {e}'
+        self.status = Status.SUCCESS
         return str(self.file_chain[-1])
 
     def unzip_file(self, zippath: str, file_name: str = '',
                    file_format: str = cmip6.FileFormats.NETCDF.value,
-                   overwrite: bool = False) -> str:
-        '''Unzips a single file with a specified extension.'''          
+                   overwrite: bool = False, stream: bool = True,
+                   zip_action: ZipAction = ZipAction.KEEP,
+                   index: None|FileIndex = None,
+                   converter: None|ZarrConverter = None,
+                   events: None|Events = None) -> str:
+        '''
+        Unzips a single file with a specified extension.
+
+        Note:
+            [1] stream=True copies the file straight to its final name in large chunks,
+                the CRC is verified as it is read, a corrupt file (and zip) is removed.
+                stream=False extracts the file next to the zip, then renames it.
+            [2] zip_action deletes the zip, or archives it into a zip folder, once extracted.
+            [3] If an index is provided, the extracted file is recorded in it
+                (when streaming, its checksum is computed as it is written).
+            [4] If a converter is provided, the extracted file is written to its Zarr store.
+            [5] If an Events emitter is provided, the extraction (and conversion) is emitted to it.
+        '''
+        self.events = events or self.events
         #check zip file path.
         if not Path(zippath).exists():
             self.status = Status.ERROR
             raise FileNotFoundError(f'Error: {zippath} not found.')
-        if self.status != Status.SUCCESS:
+        if self.status not in (Status.SUCCESS, Status.DOWNLOADED):
             print(f'''Warning: unzip proceeding at {zippath},
                   but request status is {self.status}.''')
 
@@ -163,35 +485,83 @@ class CMIP6Request:
 
         # Unzip file.
         new_name = Path(zippath).parent / file_name
-        with zipfile.ZipFile(zippath, 'r') as zip_ref:
-            files = [f for f in zip_ref.namelist() if f.endswith(file_format)]
-            if len(files) == 0:
-                self.status = Status.ERROR
-                raise FileNotFoundError(
-                    f'No {file_format} file found in {zippath}.')
-            if len(files) != 1:
-                self.status = Status.ERROR
-                raise FileNotFoundError(
-                    f'''Expected one {file_format} file,
-                    found {len(files)} in {zippath}.''')
-            if new_name.exists():
-                if not overwrite:
+        self.emit(Stage.EXTRACT_START)
+        writing = False
+        try:
+            with zipfile.ZipFile(zippath, 'r') as zip_ref:
+                files = [f for f in zip_ref.namelist() if f.endswith(file_format)]
+                if len(files) == 0:
                     self.status = Status.ERROR
-                    raise FileExistsError(
-                        f'''File at: {str(new_name)} already exists,
-                        choose overwrite=True to replace.''')
-                new_name.unlink()
-            zip_ref.extract(files[0], Path(zippath).parent)
-            (Path(zippath).parent / Path(files[0]).name).rename(new_name)
-            self.file_chain.append(new_name)
+                    raise FileNotFoundError(
+                        f'No {file_format} file found in {zippath}.')
+                if len(files) != 1:
+                    self.status = Status.ERROR
+                    raise FileNotFoundError(
+                        f'''Expected one {file_format} file,
+                        found {len(files)} in {zippath}.''')
+                if new_name.exists():
+                    if not overwrite:
+                        self.status = Status.ERROR
+                        raise FileExistsError(
+                            f'''File at: {str(new_name)} already exists,
+                            choose overwrite=True to replace.''')
+                    new_name.unlink()
+                digest = None
+                writing = True
+                if stream:
+                    # ZipExtFile raises BadZipFile if the CRC does not match, at the end of the read.
+                    with zip_ref.open(files[0]) as source, open(new_name, 'wb') as target:
+                        if index is None:
+                            shutil.copyfileobj(source, target, EXTRACT_CHUNK_SIZE)
+                        else:
+                            digest = hashlib.sha256()
+                            while chunk := source.read(EXTRACT_CHUNK_SIZE):
+                                target.write(chunk)
+                                digest.update(chunk)
+                else:
+                    Path(zip_ref.extract(files[0], Path(zippath).parent)).rename(new_name)
+                self.file_chain.append(new_name)
+        except zipfile.BadZipFile:
+            # the zip (or its member) is corrupt, removed so the request can be sent again.
+            if writing:
+                new_name.unlink(missing_ok=True)
+            self.dispose_zip(zippath, ZipAction.DELETE)
+            self.status = Status.ERROR
+            raise
+        if index is not None:
+            index.add(new_name.resolve(), self.request, digest and digest.hexdigest(), file_format)
+        if converter is not None:
+            converter.convert(new_name)
+        self.emit(Stage.EXTRACT_END, new_name.stat().st_size)
+        self.dispose_zip(zippath, zip_action)
         return new_name
 
+    def dispose_zip(self, zippath: str, zip_action: ZipAction = ZipAction.KEEP) -> None|Path:
+        '''Deletes or archives an extracted zip, updating the file chain, returns its new path.'''
+        zippath = Path(zippath)
+        chain = [Path(f) for f in self.file_chain]
+        if zip_action == ZipAction.DELETE:
+            zippath.unlink()
+            if zippath in chain:
+                self.file_chain.pop(chain.index(zippath))
+            return None
+        if zip_action == ZipAction.ARCHIVE:
+            archive = zippath.parent / 'zip'
+            archive.mkdir(exist_ok=True)
+            archived = Path(shutil.move(zippath, archive / zippath.name))
+            if zippath in chain:
+                self.file_chain[chain.index(zippath)] = archived
+            return archived
+        return zippath
+
 def build_CMIP6Requests(location: tuple[int, int, int, int], # pylint: disable=invalid-name
                         variables: list[cmip6.Variables],
                         timesteps: list[cmip6.TemporalResolutions],
                         models: list[cmip6.Models],
                         experiments: list[cmip6.Experiments],
                         years: None|tuple[str,...] = None,
+                        availability: None|Availability = None,
+                        drop_unavailable: bool = True,
                         ) -> list[CMIP6Request]:
     '''
     Builds a list of CMIP6 requests for a single location.
@@ -201,6 +571,9 @@ def build_CMIP6Requests(location: tuple[int, int, int, int], # pylint: disable=i
         [2] Month and day (when applicable) request parameters are set to defaults,
             i.e., all months and days.
         [3] There are many possible error states, most are not checked until the request is made.
+        [4] If an availability matrix is provided, combinations the CDS is known not to hold
+            are dropped, or kept and flagged (available=False) if drop_unavailable is False,
+            download_requests skips flagged requests.
     '''
     if len(variables) != len(timesteps):
         raise ValueError('Variables and timesteps must have the same length.')
@@ -210,27 +583,277 @@ def build_CMIP6Requests(location: tuple[int, int, int, int], # pylint: disable=i
         for model in models:
             for ssp in experiments:
                 requests.append(CMIP6Request(model, ssp, years, location, var, ts))
+    if availability is not None:
+        for r in requests:
+            r.available = availability.status(r.request)
+        unavailable = [r for r in requests if r.available is False]
+        if unavailable:
+            print(f'''Note: {len(unavailable)} of {len(requests)} requests are not available on the CDS
+                  ({'dropped' if drop_unavailable else 'flagged'}): {', '.join(
+                      f'{r.model.value}/{r.experiment.value}/{r.variable.value}/{r.time_step.value}'
+                      for r in unavailable)}''')
+        if drop_unavailable:
+            requests = [r for r in requests if r.available is not False]
     return requests
 
+def submit_and_fetch(request: CMIP6Request, directory: str, manifest: Manifest, key: str,
+                     entry: None|dict[str, any], overwrite: bool, file_format: str,
+                     cache: None|ResponseCache, provider: None|ClientProvider,
+                     index: None|FileIndex, converter: None|ZarrConverter) -> None:
+    '''Re-attaches a request to its running job (or submits it), then waits and fetches it.'''
+    running = (Status.QUEUED.value, Status.RUNNING.value, Status.COMPLETED.value)
+    if entry and entry['job_id'] and entry['status'] in running:
+        if request.attach(entry['job_id'], provider) is not None and request.poll() == Status.ERROR:
+            request.job = None # the job has expired, or failed, submit it again.
+    if request.job is None:
+        request.submit(provider)
+        manifest.record(key, job_id=request.job_id, status=request.status.value,
+                        submitted=time.time())
+    if request.job is not None:
+        request.wait()
+        manifest.record(key, status=request.status.value,
+                        completed=time.time() if request.status == Status.COMPLETED else None)
+    if request.status == Status.COMPLETED:
+        request.fetch(directory, overwrite=overwrite, file_format=file_format, cache=cache,
+                      index=index, converter=converter)
+
+def download_with_manifest(request: CMIP6Request, directory: str, manifest: Manifest,
+                           overwrite: bool = False,
+                           file_format: str = cmip6.FileFormats.NETCDF.value,
+                           cache: None|ResponseCache = None,
+                           provider: None|ClientProvider = None,
+                           zip_action: ZipAction = ZipAction.KEEP,
+                           index: None|FileIndex = None,
+                           converter: None|ZarrConverter = None,
+                           events: None|Events = None) -> str:
+    '''
+    Downloads a request through submit(), wait() and fetch(), recording each step in a manifest.
+
+    Note:
+        [1] Requests the manifest records as completed (with their files on disk) are skipped.
+        [2] Requests with a job still on the CDS are re-attached to it, not resubmitted.
+        [3] A zip transferred by an interrupted run is unzipped rather than fetched again.
+        [4] Errors (e.g. an existing file, without overwrite) are recorded in the manifest,
+            and returned as 'Error: ...', rather than raised.
+    '''
+    request.events = events or request.events
+    key = request_key(request.request, cmip6.DATASET, file_format)
+    paths = manifest.completed(key)
+    if paths and all(Path(p).exists() for p in paths):
+        request.file_chain = [Path(p) for p in paths]
+        request.status = Status.SUCCESS
+        request.source = Source.MANIFEST
+        return paths[-1]
+
+    entry = manifest.get(key)
+    if entry is None:
+        manifest.record(key, payload=request_payload(request.request, cmip6.DATASET, file_format),
+                        status=Status.UNPROCESSED.value)
+    zippath = Path(directory) / request.create_or_name_file('', cmip6.FileFormats.ZIP.value)
+    try:
+        if entry and not overwrite and zippath.exists():
+            request.file_chain.append(zippath)
+            request.status = Status.DOWNLOADED
+            request.unzip_file(zippath, zippath.stem, file_format, overwrite=True, index=index,
+                               converter=converter)
+            request.status = Status.SUCCESS
+        else:
+            # before a job is submitted for it.
+            request.validate_path(directory, '', overwrite, file_format)
+            if cache is not None and request.serve_from_cache(zippath, cache, file_format):
+                request.file_chain.append(zippath)
+                request.extract(zippath, file_format, overwrite, index=index,
+                                converter=converter, cache=cache)
+            else:
+                submit_and_fetch(request, directory, manifest, key, entry, overwrite,
+                                 file_format, cache, provider, index, converter)
+    except Exception as e: # pylint: disable=broad-except
+        request.status = Status.ERROR
+        request.error = e
+
+    if request.status == Status.SUCCESS:
+        size = zippath.stat().st_size if zippath.exists() else None
+        request.dispose_zip(zippath, zip_action)
+        manifest.record(key, status=request.status.value, finished=time.time(),
+                        bytes=size, paths=request.file_chain, error=None)
+        return str(request.file_chain[-1])
+    manifest.record(key, status=request.status.value, error=str(request.error))
+    return f'Error: {request.error}'
+
 def download_requests(requests: list[CMIP6Request],
                       base_directory: str, overwrite: bool = False,
-                      file_format: str = cmip6.FileFormats.NETCDF.value) -> list[str]:
+                      file_format: str = cmip6.FileFormats.NETCDF.value,
+                      max_workers: int = 1,
+                      cache: None|ResponseCache = None,
+                      dry_run: bool = False,
+                      manifest: None|Manifest = None,
+                      provider: None|ClientProvider = None,
+                      zip_action: ZipAction = ZipAction.KEEP,
+                      index: None|FileIndex = None,
+                      converter: None|ZarrConverter = None,
+                      availability: None|Availability = None,
+                      events: None|Events = None,
+                      scheduler=None,
+                      retry: None|Retry = None) -> list[str]:
     '''
-    Bath process a list of CMIP6 requests.
-    
+    Batch process a list of CMIP6 requests.
+    Returns the downloaded file paths ('' for requests that failed).
+
     Note:
         [1] Downloaded files are given default names.
         [2] Default directory structure is created (in base directory).
+        [3] max_workers > 1 submits requests concurrently from a pool of threads,
+            at most max_workers (capped at MAX_WORKERS) requests are in flight at once.
+        [4] If a cache is provided, requests already in it, or covered by a larger
+            response in it, are not sent to the CDS (see: CMIP6Request.source).
+        [5] dry_run=True prints an estimated plan (see: estimate.plan_requests),
+            and returns the paths the batch would write, without contacting the CDS.
+        [6] If a manifest is provided, progress is recorded in it (see: download_with_manifest),
+            so a rerun of the batch skips completed requests and re-attaches to running jobs.
+        [7] All requests share the provider's CDS clients and pooled HTTP session
+            (default: client.default_provider()).
+        [8] zip_action keeps, deletes or archives each zip once it is extracted.
+        [9] If an index is provided, extracted files are recorded in it, and (unless overwrite)
+            requests whose data an indexed file already holds are skipped (see: FileIndex.covering).
+        [10] If a converter is provided, each extracted file is appended to its Zarr store.
+        [11] Requests flagged unavailable (see: build_CMIP6Requests) are not sent. If an
+            availability matrix is provided, successes and failures meaning the CDS does not
+            hold the data are recorded in it, and it is saved at the end of the batch.
+        [12] If an Events emitter is provided, each request's stages are emitted to it
+            (finishing with done or error), and its summary is printed at the end of the batch.
+        [13] If a scheduler.Scheduler is provided, it submits the requests instead of max_workers
+            threads: in priority order, with an adaptive limit on the jobs in flight
+            (a manifest is not supported).
+        [14] If a Retry is provided, requests failing for transient reasons or throttling
+            are sent again after a jittered backoff, within its budget, invalid requests
+            and local errors are not, and a summary of the retries is printed.
+        [15] Errors (e.g. an existing file, without overwrite) are recorded on each request,
+            not raised. Requests sharing a file path with an earlier request of the batch
+            (file names do not record the area) are not sent.
     '''
-    success_count = 0
+    if max_workers < 1:
+        raise ValueError(f'max_workers must be at least 1, not {max_workers}.')
+    if scheduler is not None and manifest is not None:
+        raise ValueError('A manifest cannot be used with a scheduler.')
+    if max_workers > MAX_WORKERS:
+        print(f'Note: max_workers={max_workers} exceeds the CDS limit, using {MAX_WORKERS}.')
+        max_workers = MAX_WORKERS
+    if dry_run:
+        print(plan_requests(requests, max_workers))
+        return [str(Path(base_directory, 'cmip6', r.variable.value, r.time_step.value,
+                         f'{r.name_file()}{file_format}')) for r in requests]
     print(f'Downloading {len(requests)} requests to: {base_directory}')
-    for i, r in enumerate(requests):
-        r.download(r.create_directories(base_directory),
-                   overwrite=overwrite, file_format=file_format)
-        print(f'''    {[i]} {r.status}: {r.file_chain[-1].name}''')
-        if r.status == Status.SUCCESS:
-            success_count += 1
+    # directories are created up front so worker threads never race on mkdir.
+    directories = [r.create_directories(base_directory) for r in requests]
+    # file names do not record the area, so e.g. two locations of a model share a target.
+    claimed: dict[Path, int] = {}
+    duplicates = {i: claimed.setdefault(Path(d) / r.name_file(), i)
+                  for i, (r, d) in enumerate(zip(requests, directories))}
+    starts = [0.0] * len(requests)
+    durations = [0.0] * len(requests)
+
+    def local(i: int) -> bool:
+        # settles requests that are not sent to the CDS, returns False for the others.
+        starts[i] = time.perf_counter()
+        r = requests[i]
+        r.events = events or r.events
+        held = index.covering(r.request, file_format) if index and not overwrite else []
+        if r.available is False:
+            r.status = Status.ERROR
+            r.error = ValueError(f'{r.name_file()} {r.variable.value} {r.time_step.value} '
+                                 'is not available on the CDS.')
+        elif duplicates[i] != i:
+            r.status = Status.ERROR
+            r.error = ValueError(f'{r.name_file()} has the same file path as request '
+                                 f'[{duplicates[i]}], download other areas to other directories.')
+        elif held:
+            r.file_chain = [index.base / held[0]['path']]
+            r.status = Status.SUCCESS
+            r.source = Source.INDEX
+        else:
+            return False
+        return True
+
+    def process(i: int) -> None:
+        r = requests[i]
+        attempt, remote = 1, not local(i)
+        while remote:
+            began = time.perf_counter()
+            try:
+                if manifest is None:
+                    r.download(directories[i], overwrite=overwrite, file_format=file_format,
+                               cache=cache, provider=provider, zip_action=zip_action,
+                               index=index, converter=converter, events=events)
+                else:
+                    download_with_manifest(r, directories[i], manifest, overwrite, file_format,
+                                           cache, provider, zip_action, index, converter, events)
+            except Exception as e: # pylint: disable=broad-except
+                # e.g. an existing file, recorded so the rest of the batch carries on.
+                r.status = Status.ERROR
+                r.error = e
+            if retry is None:
+                break
+            if r.status == Status.SUCCESS:
+                retry.succeeded(attempt)
+                break
+            delay = retry.delay(r.error, attempt, time.perf_counter() - began)
+            if delay is None:
+                break
+            print(f'    {[i]} {r.failure.value} failure, attempt {attempt} '
+                  f'retried in {delay:.1f}s: {r.error}')
+            time.sleep(delay)
+            r.reset()
+            attempt += 1
+        finish(i)
+
+    def finish(i: int) -> None:
+        r = requests[i]
+        durations[i] = time.perf_counter() - starts[i]
+        r.emit(Stage.DONE if r.status == Status.SUCCESS else Stage.ERROR)
+        if availability is not None and r.available is not False:
+            if r.status == Status.SUCCESS:
+                availability.record(r.request, True)
+            elif r.status == Status.ERROR and is_unavailable_error(r.error):
+                availability.record(r.request, False)
+        source = f' ({r.source.value})' if r.source else ''
+        print(f'''    {[i]} {r.status}{source}: {Path(r.file_chain[-1]).name if r.file_chain else ''}''')
+
+    start = time.perf_counter()
+    if scheduler is not None:
+        remote = []
+        for i in range(len(requests)):
+            if local(i):
+                finish(i)
+            else:
+                remote.append(i)
+        scheduler.run(requests, directories, remote, finish, overwrite, file_format, cache,
+                      provider, zip_action, index, converter, retry)
+        print(scheduler)
+    elif max_workers == 1:
+        for i in range(len(requests)):
+            process(i)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(process, range(len(requests))))
+    elapsed = time.perf_counter() - start
+    if availability is not None:
+        availability.save()
+
+    success_count = sum(1 for r in requests if r.status == Status.SUCCESS)
     print(f'Successfully processed {success_count} of {len(requests)} requests.')
+    if cache is not None:
+        served = [i for i, r in enumerate(requests) if r.source in (Source.CACHE, Source.SUBSET)]
+        print(f'''Cache: {len(served)} requests satisfied locally ({cache.hits} hits,
+              {cache.subset_hits} subset), {len(requests) - len(served)} sent to the CDS.''')
+    if elapsed > 0:
+        # the sum of per-request times is what the serial path would have taken.
+        print(f'''Elapsed {elapsed:.1f}s ({len(requests) / elapsed:.2f} requests/s),
+              {sum(durations) / elapsed:.1f}x the serial estimate of {sum(durations):.1f}s.''')
+    if retry is not None:
+        print(retry)
+    if events is not None:
+        print(events.summary)
+    return [str(r.file_chain[-1]) if r.file_chain else '' for r in requests]
 
 @dataclass
 class CMIP6Experiment:
@@ -0,0 +1,148 @@
+'''
+Classifies request failures, and retries the transient ones with jittered exponential backoff
+within a per-batch budget.
+'''
+import random
+import zipfile
+import threading
+from enum import Enum
+
+import requests
+
+from climate_data.copernicus.availability import is_unavailable_error
+
+MAX_ATTEMPTS = 4
+'''Attempts per request, including the first.'''
+RETRY_BUDGET = 50
+'''Retries a batch may spend across all of its requests.'''
+BASE_DELAY = 5.0
+'''Seconds before the first retry of a transient failure, doubles with each attempt.'''
+QUOTA_DELAY = 60.0
+'''Seconds before the first retry of a request the CDS throttled, doubles with each attempt.'''
+MAX_DELAY = 600.0
+
+THROTTLE_CODES: tuple[int, ...] = (429, 500, 502, 503, 504)
+'''HTTP status codes meaning the CDS is overloaded, or limiting the user.'''
+THROTTLE_ERRORS: tuple[str, ...] = ('too many', 'rate limit', 'throttl', 'quota',
+                                    'temporarily unavailable', 'service unavailable',
+                                    'internal server error', 'bad gateway', 'gateway timeout',
+                                    'could not connect')
+'''Lower case fragments of errors meaning the CDS is overloaded, or limiting the user.'''
+INVALID_CODES: tuple[int, ...] = (400, 401, 403, 404, 422)
+'''HTTP status codes meaning a request is wrong, and will fail again.'''
+INVALID_ERRORS: tuple[str, ...] = ('required terms', 'licence', 'license', 'unauthori',
+                                   'forbidden', 'bad request', 'not valid', 'invalid')
+'''Lower case fragments of errors meaning a request is wrong (see also: UNAVAILABLE_ERRORS).'''
+
+class Failure(Enum):
+    '''Kind of request failure.'''
+    TRANSIENT = 'transient'     # network, server or job failures, retried.
+    QUOTA = 'quota'             # throttled by the CDS, retried after a longer wait.
+    INVALID = 'invalid'         # the request is wrong, or its data does not exist, not retried.
+    LOCAL = 'local'             # local file system errors, not retried.
+
+def status_code(error: Exception) -> None|int:
+    '''Returns the HTTP status code of a requests error, if it has one.'''
+    return getattr(getattr(error, 'response', None), 'status_code', None)
+
+def is_throttled(error: None|Exception) -> bool:
+    '''Returns True if a request error means the CDS is throttling requests, or overloaded.'''
+    if error is None:
+        return False
+    if status_code(error) in THROTTLE_CODES:
+        return True
+    return any(e in str(error).lower() for e in THROTTLE_ERRORS)
+
+def classify(error: Exception) -> Failure:
+    '''
+    Returns the kind of a request failure.
+
+    Note:
+        Errors not recognised are treated as transient, so they are retried (within the budget).
+    '''
+    if isinstance(error, (requests.ConnectionError, requests.Timeout,
+                          requests.exceptions.ChunkedEncodingError, ConnectionError,
+                          TimeoutError, zipfile.BadZipFile)):
+        return Failure.QUOTA if is_throttled(error) else Failure.TRANSIENT
+    if status_code(error) in INVALID_CODES:
+        return Failure.INVALID
+    if is_throttled(error):
+        return Failure.QUOTA
+    if isinstance(error, (FileExistsError, FileNotFoundError, PermissionError,
+                          IsADirectoryError, NotADirectoryError)):
+        return Failure.LOCAL
+    if (isinstance(error, OSError) and error.errno is not None
+            and not isinstance(error, requests.RequestException)):
+        return Failure.LOCAL # e.g. a full disk.
+    message = str(error).lower()
+    if (isinstance(error, (ValueError, TypeError, KeyError)) or is_unavailable_error(error)
+            or any(e in message for e in INVALID_ERRORS)):
+        return Failure.INVALID
+    return Failure.TRANSIENT
+
+class Retry:
+    '''
+    Decides whether, and when, failed requests are retried, and accounts for the retries
+    of a batch (pass a new Retry to each batch, its budget spans the batch).
+
+    Note:
+        [1] Transient and quota failures are retried up to max_attempts times per request,
+            and budget times across the batch; invalid requests and local errors fail fast.
+        [2] The wait doubles with each attempt (from base_delay, or quota_delay when throttled),
+            up to max_delay, and is jittered between half and all of it.
+        [3] wasted counts the seconds spent in failed attempts and waiting to retry.
+    '''
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, budget: int = RETRY_BUDGET,
+                 base_delay: float = BASE_DELAY, quota_delay: float = QUOTA_DELAY,
+                 max_delay: float = MAX_DELAY, seed: None|int = None):
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.base_delays = {Failure.TRANSIENT: base_delay, Failure.QUOTA: quota_delay}
+        self.max_delay = max_delay
+        self.retries = 0
+        self.failures = {f: 0 for f in Failure}
+        self.recovered = 0
+        self.given_up = 0
+        self.wasted = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, error: Exception, attempt: int, elapsed: float = 0.0) -> None|float:
+        '''
+        Records a failed attempt (the first is attempt 1) that took elapsed seconds,
+        returns the seconds to wait before retrying it, or None if it is not retried.
+        '''
+        failure = classify(error)
+        with self._lock:
+            self.failures[failure] += 1
+            self.wasted += elapsed
+            if (failure not in self.base_delays or attempt >= self.max_attempts
+                    or self.retries >= self.budget):
+                self.given_up += 1
+                return None
+            self.retries += 1
+            delay = min(self.base_delays[failure] * 2 ** (attempt - 1), self.max_delay)
+            delay = self._random.uniform(delay / 2, delay)
+            self.wasted += delay
+            return delay
+
+    def succeeded(self, attempt: int) -> None:
+        '''Records a request that succeeded, on its attempt (the first is attempt 1).'''
+        if attempt > 1:
+            with self._lock:
+                self.recovered += 1
+
+    def report(self) -> dict[str, any]:
+        '''Returns the retries, failures by kind, requests recovered and given up, and seconds wasted.'''
+        with self._lock:
+            return {'retries': self.retries, 'budget': self.budget,
+                    'failures': {f.value: n for f, n in self.failures.items()},
+                    'recovered': self.recovered, 'given_up': self.given_up,
+                    'wasted': self.wasted}
+
+    def __str__(self) -> str:
+        report = self.report()
+        failures = ', '.join(f'{n} {f}' for f, n in report['failures'].items() if n)
+        return (f'Retries: {report["retries"]} of {report["budget"]} '
+                f'(failures: {failures or "none"}), {report["recovered"]} requests recovered, '
+                f'{report["given_up"]} given up, {report["wasted"]:.1f}s wasted.')
@@ -0,0 +1,242 @@
+'''
+Schedules a batch of CMIP6 requests on the CDS: pending requests wait in a priority queue,
+at most a (self adjusting) number of jobs are in flight, and results are transferred
+by a separate pool of workers, so jobs are submitted as soon as others finish on the server.
+'''
+import time
+import heapq
+import random
+import threading
+from enum import Enum
+from pathlib import Path
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import climate_data.copernicus.cmip6 as cmip6
+from climate_data.copernicus.cache import ResponseCache
+from climate_data.copernicus.client import ClientProvider
+from climate_data.copernicus.convert import ZarrConverter
+from climate_data.copernicus.estimate import estimate_bytes
+from climate_data.copernicus.index import FileIndex
+from climate_data.copernicus.request import (CMIP6Request, MAX_POLL_INTERVAL, MAX_WORKERS,
+                                             POLL_INTERVAL, Status, ZipAction)
+from climate_data.copernicus.retry import Retry, is_throttled
+
+MAX_TRANSFERS = 4
+'''Default number of results transferred (and unzipped) at once.'''
+BACKOFF_SECONDS = 5.0
+'''Initial wait before submitting again after the CDS throttles a request, doubles each time.'''
+MAX_BACKOFF_SECONDS = 300.0
+MAX_THROTTLES = 8
+'''Times a request may be throttled before it is recorded as an error.'''
+
+class Order(Enum):
+    '''Order pending requests are submitted in, after their priority.'''
+    SMALLEST_FIRST = 'smallest_first'  # by estimated size (see: estimate.estimate_bytes).
+    LARGEST_FIRST = 'largest_first'
+    AS_GIVEN = 'as_given'
+
+class Scheduler:
+    '''
+    Runs requests through submit(), poll() and fetch(): lower priority values
+    (see: CMIP6Request.priority) are submitted first, then requests in the given order.
+
+    Note:
+        [1] At most limit jobs are in flight, limit starts at max_in_flight. It is halved each
+            time the CDS throttles a request (or answers with a 5xx), and grows by one
+            after limit jobs in a row complete, back up to max_in_flight.
+        [2] Throttled requests go back in the queue, and nothing is submitted for a jittered,
+            doubling backoff; after max_throttles a request is recorded as an error.
+        [3] Completed jobs are transferred and unzipped by max_transfers workers,
+            the job's slot is freed as soon as it completes on the server.
+        [4] Passed to download_requests, which checks the availability, index and manifest first.
+        [5] Failed requests are retried if download_requests is passed a retry.Retry.
+        [6] Each job is polled every poll_interval at first, the interval grows by half
+            each poll it is still queued or running, up to max_poll_interval.
+    '''
+    def __init__(self, max_in_flight: int = MAX_WORKERS, max_transfers: int = MAX_TRANSFERS,
+                 order: Order = Order.SMALLEST_FIRST, poll_interval: float = POLL_INTERVAL,
+                 max_poll_interval: float = MAX_POLL_INTERVAL,
+                 backoff: float = BACKOFF_SECONDS, max_backoff: float = MAX_BACKOFF_SECONDS,
+                 max_throttles: int = MAX_THROTTLES):
+        if max_in_flight < 1 or max_transfers < 1:
+            raise ValueError('max_in_flight and max_transfers must be at least 1.')
+        self.max_in_flight = max_in_flight
+        self.max_transfers = max_transfers
+        self.order = order
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_throttles = max_throttles
+        self.limit = max_in_flight
+        self.backoff = backoff
+        self.resume_at = 0.0
+        self.completed_in_row = 0
+        self.submitted = 0
+        self.polls = 0
+        self.throttled = 0
+        self.peak_in_flight = 0
+        self.lowest_limit = max_in_flight
+
+    def key(self, request: CMIP6Request) -> tuple[float, float]:
+        '''Returns a request's place in the queue, lowest first.'''
+        size = 0 if self.order == Order.AS_GIVEN else estimate_bytes(request)
+        return (request.priority, -size if self.order == Order.LARGEST_FIRST else size)
+
+    def throttle(self) -> None:
+        '''Halves the in-flight limit and waits a jittered backoff before the next submission.'''
+        self.throttled += 1
+        self.completed_in_row = 0
+        self.limit = max(1, self.limit // 2)
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+        self.resume_at = time.monotonic() + random.uniform(self.backoff / 2, self.backoff)
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+        print(f'Note: CDS throttled a request, {self.limit} jobs in flight at most, '
+              f'next submission in up to {self.backoff / 2:.1f}s.')
+
+    def complete(self) -> None:
+        '''Grows the in-flight limit after limit jobs in a row complete.'''
+        self.backoff = self.initial_backoff
+        self.completed_in_row += 1
+        if self.completed_in_row >= self.limit and self.limit < self.max_in_flight:
+            self.limit += 1
+            self.completed_in_row = 0
+
+    def run(self, requests: list[CMIP6Request], directories: list[str],
+            indices: None|list[int] = None,
+            finished: None|Callable[[int], None] = None,
+            overwrite: bool = False,
+            file_format: str = cmip6.FileFormats.NETCDF.value,
+            cache: None|ResponseCache = None,
+            provider: None|ClientProvider = None,
+            zip_action: ZipAction = ZipAction.KEEP,
+            index: None|FileIndex = None,
+            converter: None|ZarrConverter = None,
+            retry: None|Retry = None) -> None:
+        '''
+        Downloads requests (those at indices, default: all) into their directories,
+        calling finished(i) as each one succeeds or fails.
+
+        Note:
+            If a Retry is provided, failed requests it retries wait out its delay,
+            then go back in the queue.
+        '''
+        indices = list(range(len(requests))) if indices is None else indices
+        finished = finished or (lambda i: None)
+        queue = [(*self.key(requests[i]), n, i) for n, i in enumerate(indices)]
+        heapq.heapify(queue)
+        throttles = dict.fromkeys(indices, 0)
+        attempts = dict.fromkeys(indices, 1)
+        started = dict.fromkeys(indices, time.monotonic())
+        in_flight: list[int] = []
+        next_poll: dict[int, tuple[float, float]] = {} # index: (time, interval) of its next poll.
+        waiting: list[tuple[float, int]] = [] # (time retried, index), from any thread.
+        lock = threading.Lock()
+
+        def done(i: int) -> None:
+            r = requests[i]
+            delay = None
+            if r.status == Status.SUCCESS:
+                if retry is not None:
+                    retry.succeeded(attempts[i])
+            elif retry is not None:
+                delay = retry.delay(r.error, attempts[i], time.monotonic() - started[i])
+            if delay is None:
+                finished(i)
+                return
+            attempts[i] += 1
+            r.reset()
+            with lock:
+                waiting.append((time.monotonic() + delay, i))
+
+        def transfer(i: int, zippath: None|Path) -> None:
+            # zippath is the cached response served, None to fetch the job's result.
+            r = requests[i]
+            try:
+                if zippath is not None:
+                    r.file_chain.append(zippath)
+                    r.extract(zippath, file_format, overwrite, zip_action, index, converter,
+                              cache)
+                else:
+                    r.fetch(directories[i], overwrite=overwrite, file_format=file_format,
+                            cache=cache, zip_action=zip_action, index=index,
+                            converter=converter)
+            except Exception as e: # pylint: disable=broad-except
+                r.status = Status.ERROR
+                r.error = e
+            done(i)
+
+        def throttled(i: int) -> None:
+            throttles[i] += 1
+            if throttles[i] > self.max_throttles:
+                finished(i)
+                return
+            requests[i].reset()
+            heapq.heappush(queue, (*self.key(requests[i]), -throttles[i], i))
+            self.throttle()
+
+        transfers = []
+        with ThreadPoolExecutor(max_workers=self.max_transfers) as pool:
+            while True:
+                # checked before the waiting list, which a finishing transfer may add to.
+                transferring = any(not f.done() for f in transfers)
+                with lock:
+                    now = time.monotonic()
+                    for retried, i in [w for w in waiting if w[0] <= now]:
+                        waiting.remove((retried, i))
+                        heapq.heappush(queue, (*self.key(requests[i]), -attempts[i], i))
+                    if not (queue or in_flight or waiting or transferring):
+                        break
+                while queue and len(in_flight) < self.limit and time.monotonic() >= self.resume_at:
+                    *_, i = heapq.heappop(queue)
+                    r = requests[i]
+                    started[i] = time.monotonic()
+                    try:
+                        # checked before a job is submitted whose result could not be saved.
+                        zippath = r.validate_path(directories[i], '', overwrite, file_format)
+                        if cache is not None and r.serve_from_cache(zippath, cache, file_format):
+                            transfers.append(pool.submit(transfer, i, zippath))
+                            continue
+                    except Exception as e: # pylint: disable=broad-except
+                        r.status = Status.ERROR
+                        r.error = e
+                        done(i)
+                        continue
+                    self.submitted += 1
+                    if r.submit(provider) is None:
+                        if is_throttled(r.error):
+                            throttled(i)
+                        else:
+                            done(i)
+                        continue
+                    in_flight.append(i)
+                    next_poll[i] = (time.monotonic(), self.poll_interval)
+                    self.peak_in_flight = max(self.peak_in_flight, len(in_flight))
+                for i in list(in_flight):
+                    polled, interval = next_poll[i]
+                    if time.monotonic() < polled:
+                        continue
+                    r = requests[i]
+                    previous = r.status
+                    status = r.poll()
+                    self.polls += 1
+                    next_poll[i] = (time.monotonic() + interval,
+                                    min(interval * 1.5, self.max_poll_interval))
+                    if status == Status.ERROR and is_throttled(r.error):
+                        # the poll, not the job, was throttled.
+                        r.status, r.error = previous, None
+                        self.throttle()
+                    elif status == Status.COMPLETED:
+                        in_flight.remove(i)
+                        self.complete()
+                        transfers.append(pool.submit(transfer, i, None))
+                    elif status == Status.ERROR:
+                        in_flight.remove(i)
+                        done(i)
+                time.sleep(self.poll_interval)
+
+    def __str__(self) -> str:
+        return (f'Scheduler: {self.submitted} submissions, {self.throttled} throttled, '
+                f'{self.peak_in_flight} jobs in flight at most, limit {self.limit} '
+                f'(lowest {self.lowest_limit}) of {self.max_in_flight}.')
@@ -0,0 +1,156 @@
+'''
+Local subsetting and stitching of downloaded CMIP6 NetCDF files.
+'''
+import zipfile
+import tempfile
+from pathlib import Path
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+
+def coordinate_name(ds: xr.Dataset, *names: str) -> str:
+    '''Returns the first of names that is a coordinate of the dataset.'''
+    for name in names:
+        if name in ds.coords or name in ds.dims:
+            return name
+    raise KeyError(f'None of the coordinates: {names} found in dataset.')
+
+def select(ds: xr.Dataset,
+           location: None|tuple[float, float, float, float] = None, # [N, W, S, E]
+           years: None|tuple[str,...] = None,
+           months: None|tuple[str,...] = None,
+           days: None|tuple[str,...] = None) -> xr.Dataset:
+    '''
+    Returns the dataset cut to a bounding box and a selection of years, months and days.
+    
+    Note:
+        [1] Grid cells are kept if their centers fall inside the bounding box (edges included).
+        [2] Dataset longitudes may be -180 to 180 or 0 to 360, bounding boxes are -180 to 180
+            (W > E selects a box crossing the antimeridian).
+    '''
+    if location is not None:
+        n, w, s, e = location
+        lat = coordinate_name(ds, 'lat', 'latitude')
+        lon = coordinate_name(ds, 'lon', 'longitude')
+        values = ds[lat].values
+        ds = ds.isel({lat: np.flatnonzero((values >= s) & (values <= n))})
+        values = ds[lon].values
+        values = np.where(values > 180, values - 360, values) # compare in -180 to 180.
+        mask = (values >= w) & (values <= e) if w <= e else (values >= w) | (values <= e)
+        ds = ds.isel({lon: np.flatnonzero(mask)})
+    time = ds['time']
+    mask = np.ones(time.size, dtype=bool)
+    for part, selection in (('year', years), ('month', months), ('day', days)):
+        if selection is not None:
+            mask &= np.isin(getattr(time.dt, part).values, [int(i) for i in selection])
+    if not mask.all():
+        ds = ds.isel(time=np.flatnonzero(mask))
+    return ds
+
+def subset_file(source: str, target: str,
+                location: None|tuple[float, float, float, float] = None,
+                years: None|tuple[str,...] = None,
+                months: None|tuple[str,...] = None,
+                days: None|tuple[str,...] = None) -> str:
+    '''Writes a subset (see: select) of the source NetCDF file to target.'''
+    with xr.open_dataset(source) as ds:
+        select(ds, location, years, months, days).to_netcdf(target)
+    return str(target)
+
+def subset_zip(source: str, target: str, request: dict[str, any],
+               file_format: str = cmip6.FileFormats.NETCDF.value) -> str:
+    '''
+    Writes a zip, like a CDS response, holding the subset of a CDS response zip
+    selected by a CDS request payload (i.e. its area, year, month and day).
+    '''
+    with tempfile.TemporaryDirectory(dir=Path(target).parent) as tmp:
+        with zipfile.ZipFile(source, 'r') as zip_ref:
+            members = [f for f in zip_ref.namelist() if f.endswith(file_format)]
+            if len(members) != 1:
+                raise FileNotFoundError(
+                    f'Expected one {file_format} file, found {len(members)} in {source}.')
+            extracted = zip_ref.extract(members[0], tmp)
+        subset = Path(tmp) / f'{Path(target).stem}{file_format}'
+        subset_file(extracted, subset, request.get('area'), request.get('year'),
+                    request.get('month'), request.get('day'))
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) as zip_ref:
+            zip_ref.write(subset, subset.name)
+    return str(target)
+
+def grid(path: str) -> tuple[np.ndarray, np.ndarray]:
+    '''Returns the latitudes and longitudes (-180 to 180) of a NetCDF file's grid cell centers.'''
+    with xr.open_dataset(path, decode_times=False) as ds:
+        lat = ds[coordinate_name(ds, 'lat', 'latitude')].values
+        lon = ds[coordinate_name(ds, 'lon', 'longitude')].values
+    return lat, np.where(lon > 180, lon - 360, lon)
+
+def has_extent(path: str, location: tuple[float, float, float, float]) -> bool:
+    '''
+    Returns True if a NetCDF file's grid is the one a request for a bounding box [N, W, S, E]
+    returns, i.e. its cell centers are inside the box, within a cell of each edge.
+
+    Note:
+        Boxes crossing the antimeridian (W > E) are not matched.
+    '''
+    n, w, s, e = location
+    lat, lon = grid(path)
+    if lat.size == 0 or lon.size == 0 or w > e:
+        return False
+    def spacing(values: np.ndarray) -> float:
+        return float(np.abs(np.diff(np.sort(values))).max()) if values.size > 1 else np.inf
+    dlat, dlon = spacing(lat), spacing(lon)
+    return bool(s <= lat.min() < s + dlat and n - dlat < lat.max() <= n
+                and w <= lon.min() < w + dlon and e - dlon < lon.max() <= e)
+
+def has_unlimited_time(path: str) -> bool:
+    '''Returns True if a NetCDF file's time dimension is unlimited, so it can be appended to.'''
+    with netCDF4.Dataset(path, 'r') as ds:
+        return 'time' in ds.dimensions and ds.dimensions['time'].isunlimited()
+
+def append_time(target: str, source: str) -> None:
+    '''
+    Appends the time steps of the source NetCDF file to the target, in place.
+    
+    Note:
+        [1] The target's time dimension must be unlimited.
+        [2] Times (and time bounds) are converted to the target's units and calendar.
+        [3] Variables without a time dimension are assumed to match and are not written.
+    '''
+    with netCDF4.Dataset(target, 'a') as out, netCDF4.Dataset(source, 'r') as src:
+        if not out.dimensions['time'].isunlimited():
+            raise ValueError(f'Time dimension of {target} is not unlimited.')
+        start = len(out.dimensions['time'])
+        count = len(src.dimensions['time'])
+        time_names = {'time', getattr(src.variables['time'], 'bounds', 'time')}
+        units = out.variables['time'].units
+        cal = getattr(out.variables['time'], 'calendar', 'standard')
+        src_units = src.variables['time'].units
+        src_cal = getattr(src.variables['time'], 'calendar', cal)
+        for name, var in src.variables.items():
+            if 'time' not in var.dimensions or name not in out.variables:
+                continue
+            values = var[:]
+            if name in time_names and (src_units, src_cal) != (units, cal):
+                # time bounds share the units of time (CF conventions).
+                values = netCDF4.date2num(netCDF4.num2date(values, src_units, src_cal),
+                                          units, cal)
+            index = [slice(None)] * var.ndim
+            index[var.dimensions.index('time')] = slice(start, start + count)
+            out.variables[name][tuple(index)] = values
+
+def concat_time(sources: list[str], target: str) -> str:
+    '''
+    Stitches NetCDF files along time into target, in the order given.
+
+    Note:
+        The first file is rewritten with an unlimited time dimension,
+        the others are appended one at a time, so only one file is in memory at once.
+    '''
+    with xr.open_dataset(sources[0]) as ds:
+        ds.to_netcdf(target, unlimited_dims=['time'])
+    for source in sources[1:]:
+        append_time(target, source)
+    return str(target)
@@ -0,0 +1,121 @@
+'''
+Resumable transfer of CDS results.
+
+Results are written to a .part file, resumed with HTTP Range requests
+after a dropped connection (or a restart, if the result URL is still the same),
+and renamed into place only once their size is verified.
+'''
+import os
+import json
+import time
+from pathlib import Path
+
+import requests
+
+CHUNK_SIZE = 2**20
+'''Bytes written per read from the HTTP stream.'''
+MAX_TRIES = 5
+'''Connection attempts per transfer, resumed from the last byte written.'''
+RETRY_SECONDS = 1.0
+'''Initial wait between attempts, doubles after each failed attempt.'''
+
+def part_path(target: str) -> Path:
+    '''Returns the path a transfer is written to until it is complete.'''
+    return Path(f'{target}.part')
+
+def meta_path(target: str) -> Path:
+    '''Returns the path recording the url (and size) of a partial transfer.'''
+    return Path(f'{target}.part.json')
+
+def remove_partial(target: str) -> None:
+    '''Removes any partial transfer to target.'''
+    part_path(target).unlink(missing_ok=True)
+    meta_path(target).unlink(missing_ok=True)
+
+def result_location(job) -> tuple[str, None|int]:
+    '''Returns the result URL and size (bytes, if known) of a completed CDS job handle.'''
+    if hasattr(job, 'get_results'): # ecmwf.datastores Remote
+        job = job.get_results()
+    try:
+        size = job.content_length
+    except (KeyError, TypeError, ValueError):
+        size = None
+    return job.location, size
+
+def download_url(url: str, target: str, size: None|int = None,
+                 session: None|requests.Session = None,
+                 chunk_size: int = CHUNK_SIZE, max_tries: int = MAX_TRIES,
+                 timeout: float = 60) -> str:
+    '''
+    Downloads url to target through a .part file.
+
+    Note:
+        [1] An existing .part file is resumed if it was started from the same url,
+            otherwise it is restarted.
+        [2] Dropped connections are resumed from the last byte written, up to max_tries times.
+        [3] The .part file is renamed to target only if its size matches size
+            (or the Content-Length of the response, when size is not provided).
+    '''
+    session = session or requests.Session()
+    part, meta = part_path(target), meta_path(target)
+    if part.exists():
+        try:
+            previous = json.loads(meta.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            previous = {}
+        if previous.get('url') != url or (size and previous.get('size') not in (None, size)):
+            remove_partial(target)
+    meta.write_text(json.dumps({'url': url, 'size': size}), encoding='utf-8')
+
+    tries, wait = 0, RETRY_SECONDS
+    while True:
+        offset = part.stat().st_size if part.exists() else 0
+        if size is not None and offset >= size:
+            break
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+                if offset and r.status_code == 416: # nothing left to send.
+                    break
+                r.raise_for_status()
+                if offset and r.status_code != 206: # range ignored, start over.
+                    offset = 0
+                if size is None and 'Content-Length' in r.headers:
+                    size = offset + int(r.headers['Content-Length'])
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+            if size is None or part.stat().st_size >= size:
+                break
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            print(f'Transfer of {url} interrupted at {part.stat().st_size if part.exists() else 0} '
+                  f'bytes: {e}')
+        tries += 1
+        if tries >= max_tries:
+            raise ConnectionError(
+                f'Transfer of {url} incomplete after {tries} attempts, '
+                f'{part.stat().st_size if part.exists() else 0} of {size} bytes kept in {part}.')
+        time.sleep(wait)
+        wait *= 2
+
+    written = part.stat().st_size
+    if size is not None and written != size:
+        raise IOError(f'Transfer of {url} wrote {written} bytes, expected {size}.')
+    os.replace(part, target)
+    meta.unlink(missing_ok=True)
+    return str(target)
+
+def download_result(job, target: str, session: None|requests.Session = None) -> str:
+    '''
+    Downloads the result of a completed CDS job handle to target (see: download_url).
+    Handles that do not expose a result URL fall back on their own download method,
+    through the .part file.
+    '''
+    try:
+        url, size = result_location(job)
+    except AttributeError:
+        job.download(str(part_path(target)))
+        os.replace(part_path(target), target)
+        return str(target)
+    return download_url(url, target, size, session or getattr(job, 'session', None))
@@ -4,6 +4,8 @@ under public domain terms
 '''
 import math
 
+import numpy as np
+
 country_bounding_boxes = {
     'AF': ('Afghanistan', (60.5284298033, 29.318572496, 75.1580277851, 38.4862816432)),
     'AO': ('Angola', (11.6400960629, -17.9306364885, 24.0799052263, -4.43802336998)),
@@ -182,16 +184,125 @@ country_bounding_boxes = {
 
 COUNTRIES = {v[0]: v[1] for _, v in country_bounding_boxes.items()}
 
+GRID_DEGREES = 10
+'''Cell size of the uniform grid used by the CountryIndex.'''
+
+class CountryIndex:
+    '''
+    Spatial index (uniform grid) over country bounding boxes, with case insensitive
+    name and ISO code lookups.
+
+    Note:
+        [1] Boxes are W, S, E, N (as in country_bounding_boxes), query regions are N, W, S, E
+            (as in CDS requests), W > E selects a region crossing the antimeridian.
+        [2] Queries only test the countries in the grid cells they touch,
+            batch point queries are vectorized per grid cell.
+        [3] Countries are returned by name (the keys of COUNTRIES).
+    '''
+    def __init__(self, boxes: None|dict[str, tuple[str, tuple[float, float, float, float]]] = None,
+                 cell_size: float = GRID_DEGREES):
+        boxes = country_bounding_boxes if boxes is None else boxes
+        self.codes = np.array(list(boxes))
+        self.names = np.array([name for name, _ in boxes.values()])
+        self.boxes = np.array([box for _, box in boxes.values()], dtype=float) # W, S, E, N
+        self.cell_size = cell_size
+        self.columns = math.ceil(360 / cell_size)
+        self.rows = math.ceil(180 / cell_size)
+        self._keys = {name.casefold(): i for i, name in enumerate(self.names)}
+        self._keys.update({code.casefold(): i for i, code in enumerate(self.codes)})
+        cells: dict[int, list[int]] = {}
+        for i, (w, s, e, n) in enumerate(self.boxes):
+            for row in range(self._row(s), self._row(n) + 1):
+                for column in range(self._column(w), self._column(e) + 1):
+                    cells.setdefault(row * self.columns + column, []).append(i)
+        self.cells = {k: np.array(v) for k, v in cells.items()}
+
+    def _row(self, lat):
+        '''Returns the grid row of latitudes.'''
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_size), 0, self.rows - 1).astype(int)
+
+    def _column(self, lon):
+        '''Returns the grid column of (-180 to 180) longitudes.'''
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell_size), 0, self.columns - 1).astype(int)
+
+    def _candidates(self, w: float, s: float, e: float, n: float) -> np.ndarray:
+        '''Returns the indices of countries in the grid cells a W < E box touches.'''
+        found = [self.cells[row * self.columns + column]
+                 for row in range(self._row(s), self._row(n) + 1)
+                 for column in range(self._column(w), self._column(e) + 1)
+                 if row * self.columns + column in self.cells]
+        return np.unique(np.concatenate(found)) if found else np.array([], dtype=int)
+
+    def lookup(self, country: str) -> str:
+        '''Returns the name of a country from its name or ISO code, in any case.'''
+        try:
+            return str(self.names[self._keys[country.strip().casefold()]])
+        except KeyError:
+            raise KeyError(f'Unknown country name or ISO code: {country}.') from None
+
+    def bounds(self, country: str) -> tuple[float, float, float, float]:
+        '''Returns the W, S, E, N bounding box of a country from its name or ISO code.'''
+        return COUNTRIES[self.lookup(country)]
+
+    def intersecting(self, location: tuple[float, float, float, float]) -> list[str]:
+        '''Returns the countries whose bounding box intersects an N, W, S, E region.'''
+        n, w, s, e = location
+        parts = [(w, e)] if w <= e else [(w, 180.0), (-180.0, e)]
+        found = set()
+        for west, east in parts:
+            candidates = self._candidates(west, s, east, n)
+            b = self.boxes[candidates]
+            hit = (b[:, 0] <= east) & (b[:, 2] >= west) & (b[:, 1] <= n) & (b[:, 3] >= s)
+            found.update(candidates[hit].tolist())
+        return [str(self.names[i]) for i in sorted(found)]
+
+    def within(self, location: tuple[float, float, float, float]) -> list[str]:
+        '''Returns the countries whose bounding box lies entirely inside an N, W, S, E region.'''
+        n, w, s, e = location
+        parts = [(w, e)] if w <= e else [(w, 180.0), (-180.0, e)]
+        found = set()
+        for west, east in parts:
+            candidates = self._candidates(west, s, east, n)
+            b = self.boxes[candidates]
+            inside = (b[:, 0] >= west) & (b[:, 2] <= east) & (b[:, 1] >= s) & (b[:, 3] <= n)
+            found.update(candidates[inside].tolist())
+        return [str(self.names[i]) for i in sorted(found)]
+
+    def at(self, lat: float, lon: float) -> list[str]:
+        '''Returns the countries whose bounding box contains a point.'''
+        return self.at_points([lat], [lon])[0]
+
+    def at_points(self, lats: list[float], lons: list[float]) -> list[list[str]]:
+        '''Returns the countries whose bounding box contains each point (e.g. stations).'''
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        lons = np.where(lons > 180, lons - 360, lons)
+        cells = self._row(lats) * self.columns + self._column(lons)
+        result: list[list[str]] = [[] for _ in range(lats.size)]
+        for cell in np.unique(cells):
+            if cell not in self.cells:
+                continue
+            points = np.flatnonzero(cells == cell)
+            candidates = self.cells[cell]
+            b = self.boxes[candidates]
+            inside = ((lons[points, None] >= b[None, :, 0]) & (lons[points, None] <= b[None, :, 2]) &
+                      (lats[points, None] >= b[None, :, 1]) & (lats[points, None] <= b[None, :, 3]))
+            for point, hits in zip(points, inside):
+                result[point] = [str(n) for n in self.names[candidates[hits]]]
+        return result
+
+INDEX = CountryIndex()
+'''Index over country_bounding_boxes, built once at import.'''
+
 # must return N, W, S, E for cds_request
 # with W < E and S < N
 def get_country_bounding_box(country: str) -> tuple[int, int, int, int]:
     '''
-    Returns N, W, S, E boundary box coordinates for country.
+    Returns N, W, S, E boundary box coordinates for country (a name or ISO code, in any case).
     
     Recieves W, S, E, N integer boundary coordinates of country,
     slightly expands boundary box by rounding coordinates to integer values.
     '''
-    wsen = [__expand(i, coord) for i, coord in enumerate(COUNTRIES[country])]
+    wsen = [__expand(i, coord) for i, coord in enumerate(INDEX.bounds(country))]
     if wsen[0] > wsen[2]: # W > E
         raise ValueError(f'Invalid country boundary box for {country}: W > E')
     if wsen[1] > wsen[3]: # S > N
@@ -0,0 +1,170 @@
+'''Local stand-ins for the Copernicus CDS API used by the tests (see also: fake_server).'''
+
+import time
+import http.server
+import threading
+import contextlib
+
+from climate_data.copernicus.client import ClientProvider, set_default_provider
+from climate_data.copernicus.fake_server import write_zip
+
+class FakeJob:
+    '''
+    Stands in for the (legacy) cdsapi.api.Result job handle.
+
+    Each update() advances the server state one step through states,
+    the last step only once the job has run for duration seconds.
+    '''
+    def __init__(self, request: dict[str, any], request_id: str,
+                 states: tuple[str, ...] = ('queued', 'running', 'completed'),
+                 netcdf: bool = False, duration: float = 0.0):
+        self.request = request
+        self.netcdf = netcdf
+        self.states = list(states)
+        self.reply = {'request_id': request_id, 'state': self.states.pop(0)}
+        self.finishes = time.monotonic() + duration
+        self.updates = 0
+
+    def update(self) -> None:
+        '''Advances to the next server state.'''
+        self.updates += 1
+        if len(self.states) == 1 and time.monotonic() < self.finishes:
+            return
+        if self.states:
+            self.reply['state'] = self.states.pop(0)
+
+    def download(self, target: str) -> str:
+        '''Writes the result to target.'''
+        return write_zip(target, self.request, self.netcdf)
+
+class FakeClient:
+    '''
+    Stands in for cdsapi.Client.
+    
+    retrieve(...) sleeps for latency seconds (the CDS queue),
+    then writes a zip holding a single .nc member to the target path.
+    Without a target (i.e. wait_until_complete=False) a FakeJob is returned.
+    With netcdf=True the .nc member is a valid NetCDF file (see: fake_server.synthetic_dataset).
+    Jobs run for duration seconds before they complete (see: FakeJob).
+    Requests for the models in unavailable fail as the CDS does for data it does not hold,
+    get_collection(...).constraints returns the constraints provided.
+    '''
+    def __init__(self, latency: float = 0.0, fail: bool = False,
+                 states: tuple[str, ...] = ('queued', 'running', 'completed'),
+                 netcdf: bool = False, unavailable: tuple[str, ...] = (),
+                 constraints: None|list[dict[str, list[str]]] = None,
+                 duration: float = 0.0):
+        self.latency = latency
+        self.duration = duration
+        self.fail = fail
+        self.unavailable = unavailable
+        self.constraints = constraints or []
+        self.netcdf = netcdf
+        self.states = states
+        self.calls: list[dict[str, any]] = []
+        self.jobs: dict[str, FakeJob] = {}
+        self.client = self # like ecmwf.datastores LegacyClient, see: get_remote.
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs) -> 'FakeClient':
+        '''Allows the instance to replace the cdsapi.Client class.'''
+        return self
+
+    def get_remote(self, request_id: str) -> FakeJob:
+        '''Returns the handle of a job submitted earlier.'''
+        if request_id not in self.jobs:
+            raise RuntimeError(f'Request {request_id} not found.')
+        return self.jobs[request_id]
+
+    def get_collection(self, collection_id: str) -> 'FakeClient':
+        '''Returns a stand in for an ecmwf.datastores Collection (see: constraints).'''
+        return self
+
+    def retrieve(self, name: str, request: dict[str, any], target: None|str = None):
+        '''Mimics a CDS retrieve, returns a FakeJob if no target is provided.'''
+        with self._lock:
+            self.calls.append(dict(request, dataset=name))
+            request_id = f'job-{len(self.calls)}'
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if self.fail:
+                raise RuntimeError('The request you have submitted is not valid.')
+            if request['model'] in self.unavailable:
+                raise RuntimeError('No data available for the requested model.')
+            if target is None:
+                self.jobs[request_id] = FakeJob(request, request_id, self.states, self.netcdf,
+                                                self.duration)
+                return self.jobs[request_id]
+            return write_zip(target, request, self.netcdf)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+@contextlib.contextmanager
+def fake_cds(client: 'FakeClient'):
+    '''Makes the default client provider hand out the fake client, within the context.'''
+    previous = set_default_provider(ClientProvider(factory=client))
+    try:
+        yield client
+    finally:
+        set_default_provider(previous)
+
+class FlakyFileServer:
+    '''
+    Local HTTP server for a single payload, supporting Range requests.
+
+    The first drops responses are cut off after drop_after bytes,
+    like a connection dropped partway through a transfer.
+    '''
+    def __init__(self, payload: bytes, drops: int = 0, drop_after: int = 0,
+                 ranges: bool = True):
+        self.payload = payload
+        self.drops = drops
+        self.drop_after = drop_after
+        self.ranges = ranges
+        self.range_requests: list[str] = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            '''Serves the payload.'''
+            def do_GET(self): # pylint: disable=invalid-name
+                '''Serves all, or a range, of the payload.'''
+                start = 0
+                header = self.headers.get('Range')
+                if header and server.ranges:
+                    server.range_requests.append(header)
+                    start = int(header.split('=')[1].split('-')[0])
+                    self.send_response(206)
+                    self.send_header('Content-Range',
+                                     f'bytes {start}-{len(server.payload) - 1}/{len(server.payload)}')
+                else:
+                    self.send_response(200)
+                body = server.payload[start:]
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if server.drops > 0:
+                    server.drops -= 1
+                    self.wfile.write(body[:server.drop_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, *args): # pylint: disable=arguments-differ
+                '''Silences request logging.'''
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/result.zip'
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'FlakyFileServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,82 @@
+'''Tests the aggregation module.'''
+
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from climate_data.aggregation import MaskCache, aggregate, aggregate_file, country_weights
+from climate_data.countries import COUNTRIES
+
+def global_dataset(step: float = 1.0, lon360: bool = False) -> xr.Dataset:
+    '''Builds a global monthly field equal to latitude plus the month number.'''
+    lat = np.arange(90 - step / 2, -90, -step) # north to south, like many models.
+    lon = np.arange(step / 2, 360, step) if lon360 else np.arange(-180 + step / 2, 180, step)
+    time = pd.date_range('2000-01-01', periods=3, freq='MS')
+    data = lat[None, :, None] + np.arange(3)[:, None, None] + 0 * lon[None, None, :]
+    return xr.Dataset({'tas': (('time', 'lat', 'lon'), data)},
+                      coords={'time': time, 'lat': lat, 'lon': lon})
+
+class TestAggregation(unittest.TestCase):
+    '''Tests the aggregation functions and MaskCache class.'''
+    def test_weights(self):
+        '''Tests weights are the spherical area of the bounding box.'''
+        ds = global_dataset(0.5)
+        weights = country_weights('Laos', ds['lat'].values, ds['lon'].values)
+        w, s, e, n = COUNTRIES['Laos']
+        area = np.radians(e - w) * (np.sin(np.radians(n)) - np.sin(np.radians(s)))
+        self.assertAlmostEqual(weights.sum(), area)
+        self.assertEqual(weights.shape, (360, 720))
+
+    def test_aggregate(self):
+        '''Tests the weighted mean, on -180 to 180 and 0 to 360 grids.'''
+        ds = global_dataset()
+        result = aggregate(ds, ['Laos', 'Chile'])
+        self.assertEqual(result.dims, ('time', 'country'))
+        lat = np.linspace(COUNTRIES['Laos'][1], COUNTRIES['Laos'][3], 10001)
+        expected = np.average(lat, weights=np.cos(np.radians(lat)))
+        self.assertAlmostEqual(float(result.sel(country='Laos')[0]), expected, places=1)
+        self.assertAlmostEqual(float(result.sel(country='Laos')[2]), expected + 2, places=1)
+        shifted = aggregate(global_dataset(lon360=True), ['Laos', 'Chile'])
+        np.testing.assert_allclose(shifted.values, result.values)
+
+    def test_missing_values(self):
+        '''Tests missing cells are skipped.'''
+        ds = global_dataset()
+        ds['tas'][:, ds['lat'] > 18] = np.nan
+        result = aggregate(ds, ['Laos'])
+        self.assertLess(float(result[0, 0]), 18)
+
+    def test_cache(self):
+        '''Tests weights are built once per grid and reloaded from disk.'''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'tas.nc'
+            global_dataset().to_netcdf(path)
+            cache = MaskCache(Path(tmp) / 'masks')
+            first = aggregate_file(path, ['Laos', 'Chile'], cache=cache)
+            aggregate_file(path, ['Laos'], cache=cache)
+            self.assertEqual((cache.misses, cache.hits), (2, 1))
+            reloaded = MaskCache(Path(tmp) / 'masks')
+            second = aggregate_file(path, ['Laos', 'Chile'], cache=reloaded, target=Path(tmp) / 'out.nc')
+            self.assertEqual((reloaded.misses, reloaded.hits), (0, 2))
+            np.testing.assert_allclose(first.values, second.values)
+            self.assertEqual(len(list((Path(tmp) / 'masks').glob('*.npz'))), 2)
+            aggregate(global_dataset(2.0), ['Laos'], cache=reloaded)
+            self.assertEqual(reloaded.misses, 1)
+            aggregate_file(path, ['laos', 'CHILE'], cache=reloaded)
+            self.assertEqual((reloaded.misses, reloaded.hits), (1, 4))
+            self.assertEqual(len(list((Path(tmp) / 'masks').glob('*.npz'))), 3)
+
+    def test_cache_threads(self):
+        '''Tests concurrent lookups count each one once.'''
+        lat, lon = np.arange(-89.5, 90), np.arange(-179.5, 180)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = MaskCache(tmp)
+            with ThreadPoolExecutor(8) as pool:
+                list(pool.map(lambda c: cache.weights(c, lat, lon), ['Laos', 'laos'] * 50))
+            self.assertEqual(cache.hits + cache.misses, 100)
+            self.assertEqual(len(list(Path(tmp).glob('*.npz'))), 1)
@@ -0,0 +1,83 @@
+'''Tests the copernicus availability module.'''
+
+import tempfile
+import unittest
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.availability import Availability, is_unavailable_error
+from climate_data.copernicus.client import ClientProvider
+
+from tests.fakes import FakeClient, fake_cds
+
+CONSTRAINTS = [
+    {'model': ['access_cm2', 'cesm2'], 'experiment': ['historical', 'ssp585'],
+     'variable': ['tas', 'pr'], 'temporal_resolution': ['monthly', 'daily']},
+    {'model': ['miroc6'], 'experiment': ['historical'], 'variable': ['tas'],
+     'temporal_resolution': ['monthly']},
+]
+
+def build(availability: Availability, drop: bool = True) -> list[cds.CMIP6Request]:
+    '''Builds 2 models x 2 variables of monthly historical requests.'''
+    return cds.build_CMIP6Requests(
+        (23, 100, 13, 108), [cmip6.Variables.TEMP, cmip6.Variables.EVAP],
+        [cmip6.TemporalResolutions.MONTHLY] * 2, [cmip6.Models.CESM2, cmip6.Models.MIROC6],
+        [cmip6.Experiments.HISTORICAL], years=cmip6.HISTORY_YEARS[0:2],
+        availability=availability, drop_unavailable=drop)
+
+class TestAvailability(unittest.TestCase):
+    '''Tests the Availability class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_refresh(self):
+        '''Tests constraints are downloaded, stored and reloaded.'''
+        availability = Availability(self.base)
+        request = cds.CMIP6Request(model=cmip6.Models.MIROC6).request
+        self.assertIsNone(availability.status(request))
+        provider = ClientProvider(factory=FakeClient(constraints=CONSTRAINTS))
+        self.assertEqual(availability.refresh(provider), 17)
+        reloaded = Availability(self.base)
+        self.assertTrue(reloaded.status(request))
+        self.assertFalse(reloaded.status(cds.CMIP6Request(model=cmip6.Models.NESM3).request))
+
+    def test_build_filters(self):
+        '''Tests unavailable combinations are dropped, or flagged and skipped.'''
+        availability = Availability(self.base)
+        availability.set_constraints(CONSTRAINTS)
+        requests = build(availability)
+        self.assertEqual([(r.model, r.variable) for r in requests],
+                         [(cmip6.Models.CESM2, cmip6.Variables.TEMP),
+                          (cmip6.Models.MIROC6, cmip6.Variables.TEMP)])
+        flagged = build(availability, drop=False)
+        self.assertEqual([r.available for r in flagged], [True, True, False, False])
+        client = FakeClient()
+        with fake_cds(client):
+            cds.download_requests(flagged, self.base)
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual([r.status for r in flagged],
+                         [cds.Status.SUCCESS] * 2 + [cds.Status.ERROR] * 2)
+
+    def test_failures_are_recorded(self):
+        '''Tests failures meaning the data does not exist are recorded, transient ones are not.'''
+        availability = Availability(self.base)
+        with fake_cds(FakeClient(unavailable=('miroc6',))):
+            cds.download_requests(build(availability), self.base, availability=availability)
+        reloaded = Availability(self.base)
+        self.assertEqual(reloaded.observed[('cesm2', 'historical', 'tas', 'monthly')], True)
+        self.assertEqual(reloaded.observed[('miroc6', 'historical', 'tas', 'monthly')], False)
+        self.assertEqual(len(build(reloaded)), 2)
+        self.assertFalse(is_unavailable_error(ConnectionError('Connection reset by peer')))
+        self.assertFalse(is_unavailable_error(RuntimeError('The request is not valid.')))
+        self.assertTrue(is_unavailable_error(RuntimeError('There is no data matching your request.')))
+
+    def test_invalid_requests_not_recorded(self):
+        '''Tests generic invalid request errors do not mark a combination unavailable.'''
+        availability = Availability(self.base)
+        with fake_cds(FakeClient(fail=True)):
+            cds.download_requests(build(availability), self.base, availability=availability)
+        self.assertEqual(Availability(self.base).observed, {})
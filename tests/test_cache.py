@@ -0,0 +1,109 @@
+'''Tests the copernicus cache module.'''
+
+import time
+import tempfile
+import unittest
+from pathlib import Path
+
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import (
+    ResponseCache, Source, covers, request_key, request_payload)
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_subset import monthly_dataset, write_zip
+
+class TestRequestKey(unittest.TestCase):
+    '''Tests the request_key function.'''
+    def test_canonical(self):
+        '''Tests key order and tuple vs list do not change the key.'''
+        a = request_key({'year': ('1850', '1851'), 'model': 'cesm2'}, 'ds', '.nc')
+        b = request_key({'model': 'cesm2', 'year': ['1850', '1851']}, 'ds', '.nc')
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, request_key({'model': 'cesm2'}, 'ds', '.nc'))
+        self.assertNotEqual(a, request_key({'model': 'cesm2', 'year': ['1850', '1851']},
+                                           'ds', '.grib'))
+
+class TestResponseCache(unittest.TestCase):
+    '''Tests the ResponseCache class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name: str, size: int) -> Path:
+        '''Writes a file of size bytes.'''
+        path = self.root / name
+        path.write_bytes(b'x' * size)
+        return path
+
+    def test_get_put(self):
+        '''Tests hits and misses are counted and hits are copied to the target.'''
+        cache = ResponseCache(self.root / 'cache')
+        self.assertFalse(cache.get('a', self.root / 'out.zip'))
+        cache.put('a', self.write('a.zip', 10))
+        self.assertTrue(cache.get('a', self.root / 'out.zip'))
+        self.assertEqual((self.root / 'out.zip').read_bytes(), b'x' * 10)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        '''Tests the least recently used entries are evicted over the size limit.'''
+        cache = ResponseCache(self.root / 'cache', max_bytes=30)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, self.write(f'{key}.zip', 10))
+            time.sleep(0.02)
+        cache.get('a', self.root / 'a_out.zip')
+        time.sleep(0.02)
+        cache.put('d', self.write('d.zip', 10))
+        self.assertFalse(cache.path('b').exists())
+        self.assertTrue(all(cache.path(k).exists() for k in ('a', 'c', 'd')))
+        self.assertLessEqual(cache.size, 30)
+
+class TestCachedDownload(unittest.TestCase):
+    '''Tests CMIP6Request.download with a cache.'''
+    def test_repeat_download(self):
+        '''Tests a repeated request is served from the cache.'''
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(Path(tmp) / 'cache')
+            client = FakeClient()
+            with fake_cds(client):
+                for _ in range(2):
+                    request = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:2])
+                    path = request.download(request.create_directories(tmp),
+                                            overwrite=True, cache=cache)
+                    self.assertEqual(request.status, cds.Status.SUCCESS)
+                    self.assertTrue(Path(path).exists())
+            self.assertEqual(len(client.calls), 1)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+class TestSupersetCache(unittest.TestCase):
+    '''Tests requests covered by a larger cached response are cut locally.'''
+    def test_superset(self):
+        '''Tests a sub-box and subset of years is served without the CDS.'''
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ResponseCache(Path(tmp) / 'cache')
+            big = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:4], location=(29, 90, 0, 120))
+            payload = request_payload(big.request, cmip6.DATASET, '.nc')
+            source = write_zip(monthly_dataset(), Path(tmp) / 'big.zip')
+            cache.put(request_key(big.request, cmip6.DATASET, '.nc'), source, payload)
+
+            small = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[1:3], location=(23, 100, 13, 108))
+            outside = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[1:3], location=(40, 100, 13, 108))
+            self.assertTrue(covers(payload, request_payload(small.request, cmip6.DATASET, '.nc')))
+            self.assertFalse(covers(payload, request_payload(outside.request, cmip6.DATASET, '.nc')))
+
+            client = FakeClient(fail=True)
+            with fake_cds(client):
+                path = small.download(small.create_directories(tmp), cache=cache)
+            self.assertEqual(client.calls, [])
+            self.assertEqual(small.source, Source.SUBSET)
+            self.assertEqual(small.status, cds.Status.SUCCESS)
+            with xr.open_dataset(path) as ds:
+                self.assertEqual(dict(ds.sizes), {'time': 24, 'lat': 10, 'lon': 8})
+            self.assertEqual(cache.subset_hits, 1)
+            # the subset is cached as an exact entry too.
+            self.assertTrue(cache.path(request_key(small.request, cmip6.DATASET, '.nc')).exists())
@@ -0,0 +1,83 @@
+'''Tests the copernicus catalog module.'''
+
+import tempfile
+import unittest
+import importlib.util
+from pathlib import Path
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.catalog import Catalog, parse_path
+from climate_data.copernicus.fake_server import synthetic_dataset
+
+def write_files(base: str) -> None:
+    '''Writes two models x one experiment, the first in two files along time.'''
+    for model, years in ((cmip6.Models.ACCESS_CM2, cmip6.HISTORY_YEARS[0:2]),
+                         (cmip6.Models.ACCESS_CM2, cmip6.HISTORY_YEARS[2:4]),
+                         (cmip6.Models.CESM2, cmip6.HISTORY_YEARS[0:4])):
+        request = cds.CMIP6Request(model=model, years=years, location=(2, 100, 0, 103))
+        directory = request.create_directories(base)
+        synthetic_dataset(request.request).to_netcdf(
+            Path(directory) / f'{request.name_file()}.nc')
+    (Path(directory) / 'zip').mkdir()
+    (Path(directory) / 'notes.txt').write_text('not a data file')
+
+class TestCatalog(unittest.TestCase):
+    '''Tests the Catalog class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        write_files(self.tmp.name)
+        self.catalog = Catalog(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_path(self):
+        '''Tests model names with underscores are parsed.'''
+        entry = parse_path(Path('cmip6/tas/monthly/mpi_esm1_2_hr_ssp585_201501-210012.nc'))
+        self.assertEqual((entry.variable, entry.time_step, entry.model, entry.experiment),
+                         ('tas', 'monthly', 'mpi_esm1_2_hr', 'ssp585'))
+        self.assertIsNone(parse_path(Path('cmip6/tas/monthly/notes.nc')))
+
+    def test_search(self):
+        '''Tests entries are selected by enum members or values.'''
+        self.assertEqual(len(self.catalog.entries), 3)
+        self.assertEqual(len(self.catalog.search(models=cmip6.Models.ACCESS_CM2)), 2)
+        self.assertEqual(len(self.catalog.search(variables='tas', models=['cesm2'])), 1)
+        self.assertEqual(self.catalog.search(experiments=cmip6.Experiments.SSP5_85), [])
+
+    @unittest.skipUnless(importlib.util.find_spec('dask'), 'requires dask')
+    def test_open(self):
+        '''Tests a selection opens lazily, one node per model and experiment.'''
+        tree = self.catalog.open(cmip6.Variables.TEMP)
+        self.assertEqual(sorted(tree.children), ['access_cm2', 'cesm2'])
+        ds = tree['access_cm2/historical'].to_dataset()
+        self.assertEqual(ds.sizes['time'], 48)
+        self.assertIsNotNone(ds['tas'].chunks)
+        self.assertEqual(float(ds['tas'].isel(time=0).mean().compute()),
+                         float(synthetic_dataset(cds.CMIP6Request(
+                             years=cmip6.HISTORY_YEARS[0:2],
+                             location=(2, 100, 0, 103)).request)['tas'].isel(time=0).mean()))
+        with self.assertRaises(FileNotFoundError):
+            self.catalog.open(cmip6.Variables.PRECIP)
+
+    @unittest.skipUnless(importlib.util.find_spec('dask'), 'requires dask')
+    def test_open_overlapping(self):
+        '''Tests files held by another file are skipped, and overlapping time steps kept once.'''
+        for years in (cmip6.HISTORY_YEARS[0:4], cmip6.HISTORY_YEARS[3:6]):
+            request = cds.CMIP6Request(years=years, location=(2, 100, 0, 103))
+            synthetic_dataset(request.request).to_netcdf(
+                Path(request.create_directories(self.tmp.name)) / f'{request.name_file()}.nc')
+        self.catalog.refresh()
+        ds = self.catalog.open_dataset('tas', 'monthly', 'access_cm2', 'historical')
+        self.assertEqual(ds.sizes['time'], 72)
+        self.assertTrue(ds.indexes['time'].is_monotonic_increasing)
+
+    def test_other_areas(self):
+        '''Tests files of another area are not concatenated under the first file's grid.'''
+        request = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[4:6], location=(12, 100, 10, 103))
+        synthetic_dataset(request.request).to_netcdf(
+            Path(request.create_directories(self.tmp.name)) / f'{request.name_file()}.nc')
+        self.catalog.refresh()
+        with self.assertRaises(ValueError):
+            self.catalog.open_dataset('tas', 'monthly', 'access_cm2', 'historical')
@@ -1,8 +1,196 @@
-'''Tests the cds_request module.'''
+'''Tests the copernicus request module.'''
 
+import zipfile
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
-import climate_data.cds_request as cds
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.manifest import Manifest
+from climate_data.copernicus.scheduler import Scheduler
 
-class TestCDSRequest(unittest.TestCase):
-    pass
+from tests.fakes import FakeClient, fake_cds
+
+def small_requests(n: int) -> list[cds.CMIP6Request]:
+    '''Builds n distinct two year monthly requests.'''
+    models = list(cmip6.Models)[:n]
+    return cds.build_CMIP6Requests(
+        location=(23, 100, 13, 108),
+        variables=[cmip6.Variables.TEMP],
+        timesteps=[cmip6.TemporalResolutions.MONTHLY],
+        models=models,
+        experiments=[cmip6.Experiments.HISTORICAL],
+        years=cmip6.HISTORY_YEARS[0:2])
+
+class TestDownloadRequests(unittest.TestCase):
+    '''Tests the download_requests function.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_serial(self):
+        '''Tests the serial path downloads and unzips every request.'''
+        requests = small_requests(3)
+        with fake_cds(FakeClient()):
+            paths = cds.download_requests(requests, self.base)
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertTrue(all(Path(p).exists() and p.endswith('.nc') for p in paths))
+
+    def test_concurrent(self):
+        '''Tests the concurrent path is bounded by max_workers and beats the serial path.'''
+        client = FakeClient(latency=0.2)
+        requests = small_requests(8)
+        with fake_cds(client):
+            paths = cds.download_requests(requests, self.base, max_workers=4)
+        self.assertEqual(client.max_in_flight, 4)
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertEqual(len(set(paths)), 8)
+        self.assertTrue(all(len(r.file_chain) == 2 for r in requests))
+
+    def test_errors_are_recorded(self):
+        '''Tests failed requests are recorded per request without stopping the batch.'''
+        requests = small_requests(2)
+        with fake_cds(FakeClient(fail=True)):
+            paths = cds.download_requests(requests, self.base, max_workers=2)
+        self.assertEqual(paths, ['', ''])
+        self.assertTrue(all(r.status == cds.Status.ERROR for r in requests))
+
+    def test_existing_files(self):
+        '''Tests an existing file is recorded as an error, and the rest of the batch completes.'''
+        for max_workers in (1, 2):
+            with self.subTest(max_workers=max_workers), tempfile.TemporaryDirectory() as base, \
+                    fake_cds(FakeClient()):
+                cds.download_requests(small_requests(1), base)
+                requests = small_requests(4)
+                paths = cds.download_requests(requests, base, max_workers=max_workers)
+                self.assertIsInstance(requests[0].error, FileExistsError)
+                self.assertEqual(paths[0], '')
+                self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests[1:]))
+
+    def test_deleted_zips(self):
+        '''Tests a rerun is not sent when the zip was deleted but its extracted file exists.'''
+        for kwargs in ({}, {'scheduler': Scheduler(poll_interval=0.02)}, {'manifest': None}):
+            with self.subTest(kwargs=kwargs), tempfile.TemporaryDirectory() as base:
+                client = FakeClient()
+                with fake_cds(client):
+                    cds.download_requests(small_requests(2), base,
+                                          zip_action=cds.ZipAction.DELETE)
+                    if 'manifest' in kwargs: # a new manifest, without the earlier run.
+                        kwargs['manifest'] = Manifest(base)
+                    requests = small_requests(2)
+                    paths = cds.download_requests(requests, base, **kwargs)
+                self.assertEqual(len(client.calls), 2)
+                self.assertEqual(paths, ['', ''])
+                self.assertTrue(all(isinstance(r.error, FileExistsError) for r in requests))
+
+    def test_duplicate_targets(self):
+        '''Tests requests for the same file path over other areas are not sent.'''
+        client = FakeClient()
+        requests = small_requests(1) + [cds.CMIP6Request(
+            years=cmip6.HISTORY_YEARS[0:2], location=(10, 0, 0, 10))]
+        with fake_cds(client):
+            paths = cds.download_requests(requests, self.base, max_workers=2)
+        self.assertEqual(len(client.calls), 1)
+        self.assertTrue(Path(paths[0]).exists())
+        self.assertEqual(paths[1], '')
+        self.assertIn('same file path', str(requests[1].error))
+
+    def test_invalid_max_workers(self):
+        '''Tests max_workers must be positive.'''
+        with self.assertRaises(ValueError):
+            cds.download_requests(small_requests(1), self.base, max_workers=0)
+
+class TestLifecycle(unittest.TestCase):
+    '''Tests the submit, poll, wait and fetch request lifecycle.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.request = small_requests(1)[0]
+        self.directory = self.request.create_directories(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_submit_poll_fetch(self):
+        '''Tests a request moves through the server states and is fetched.'''
+        with fake_cds(FakeClient()):
+            job = self.request.submit()
+        self.assertIsNotNone(job)
+        self.assertEqual(self.request.job_id, 'job-1')
+        self.assertEqual(self.request.status, cds.Status.QUEUED)
+        self.assertEqual(self.request.poll(), cds.Status.RUNNING)
+        with self.assertRaises(RuntimeError):
+            self.request.fetch(self.directory)
+        self.assertEqual(self.request.poll(), cds.Status.COMPLETED)
+        path = self.request.fetch(self.directory)
+        self.assertEqual(self.request.status, cds.Status.SUCCESS)
+        self.assertTrue(Path(path).exists())
+        self.assertEqual(len(self.request.file_chain), 2)
+        self.assertIsNone(self.request.job)
+
+    def test_wait(self):
+        '''Tests wait returns once the job has completed or failed.'''
+        with mock.patch.object(cds, 'POLL_INTERVAL', 0.0):
+            with fake_cds(FakeClient()):
+                self.request.submit()
+            self.assertEqual(self.request.wait(), cds.Status.COMPLETED)
+            failing = small_requests(1)[0]
+            with fake_cds(FakeClient(states=('queued', 'failed'))):
+                failing.submit()
+            self.assertEqual(failing.wait(), cds.Status.ERROR)
+            self.assertIsNotNone(failing.error)
+
+    def test_submit_error(self):
+        '''Tests a rejected submission is recorded as an error.'''
+        with fake_cds(FakeClient(fail=True)):
+            self.assertIsNone(self.request.submit())
+        self.assertEqual(self.request.status, cds.Status.ERROR)
+        with self.assertRaises(RuntimeError):
+            self.request.poll()
+
+class TestUnzip(unittest.TestCase):
+    '''Tests CMIP6Request.unzip_file.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.request = small_requests(1)[0]
+        self.request.status = cds.Status.DOWNLOADED
+        self.zippath = Path(self.tmp.name) / 'result.zip'
+        self.payload = bytes(range(256)) * 1024
+        with zipfile.ZipFile(self.zippath, 'w', zipfile.ZIP_STORED) as zip_ref:
+            zip_ref.writestr('data/tas.nc', self.payload)
+        self.request.file_chain.append(self.zippath)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stream(self):
+        '''Tests the streamed and extract-and-rename paths write the same file.'''
+        streamed = self.request.unzip_file(self.zippath, 'streamed')
+        extracted = self.request.unzip_file(self.zippath, 'extracted', stream=False)
+        self.assertEqual(Path(streamed).read_bytes(), self.payload)
+        self.assertEqual(Path(extracted).read_bytes(), self.payload)
+
+    def test_crc(self):
+        '''Tests a corrupt member is detected and not left behind.'''
+        data = bytearray(self.zippath.read_bytes())
+        offset = data.index(self.payload[:256])
+        data[offset] ^= 0xFF
+        self.zippath.write_bytes(bytes(data))
+        with self.assertRaises(zipfile.BadZipFile):
+            self.request.unzip_file(self.zippath, 'corrupt')
+        self.assertFalse((self.zippath.parent / 'corrupt.nc').exists())
+        self.assertEqual(self.request.status, cds.Status.ERROR)
+
+    def test_zip_actions(self):
+        '''Tests the zip is deleted or archived, and the file chain follows it.'''
+        self.request.unzip_file(self.zippath, 'archived', zip_action=cds.ZipAction.ARCHIVE)
+        archived = self.zippath.parent / 'zip' / 'result.zip'
+        self.assertTrue(archived.exists())
+        self.assertEqual(self.request.file_chain[0], archived)
+        self.request.unzip_file(archived, 'deleted', zip_action=cds.ZipAction.DELETE)
+        self.assertFalse(archived.exists())
+        self.assertEqual([p.name for p in self.request.file_chain], ['archived.nc', 'deleted.nc'])
@@ -0,0 +1,45 @@
+'''Tests the copernicus chunking module.'''
+
+import tempfile
+import unittest
+
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.chunking import download_chunked, plan_chunks
+from climate_data.copernicus.estimate import estimate_bytes
+
+from tests.fakes import FakeClient, fake_cds
+
+def daily_request(years: tuple[str,...]) -> cds.CMIP6Request:
+    '''Builds a daily request over a 2 x 3 degree box.'''
+    return cds.CMIP6Request(years=years, location=(2, 100, 0, 103),
+                            time_step=cmip6.TemporalResolutions.DAILY, days=cmip6.DAYS)
+
+class TestChunking(unittest.TestCase):
+    '''Tests plan_chunks and download_chunked.'''
+    def test_plan_chunks(self):
+        '''Tests requests are split into consecutive year blocks under the size limit.'''
+        request = daily_request(cmip6.HISTORY_YEARS)
+        chunks = plan_chunks(request, max_bytes=estimate_bytes(request) // 10)
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual(sum((c.years for c in chunks), ()), request.years)
+        self.assertTrue(all(c.time_step == request.time_step for c in chunks))
+        self.assertEqual(plan_chunks(request), [request])
+
+    def test_download_chunked(self):
+        '''Tests blocks are downloaded and stitched into the name_file() output.'''
+        request = daily_request(cmip6.HISTORY_YEARS[0:5])
+        client = FakeClient(netcdf=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            with fake_cds(client):
+                path = download_chunked(request, request.create_directories(tmp),
+                                        max_years=2, max_workers=3)
+            self.assertEqual(len(client.calls), 3)
+            self.assertEqual(request.status, cds.Status.SUCCESS)
+            self.assertTrue(path.endswith(f'{request.name_file()}.nc'))
+            with xr.open_dataset(path) as ds:
+                self.assertEqual(ds.sizes['time'], 5 * 365 + 1) # 1852 is a leap year.
+                self.assertTrue(ds.indexes['time'].is_monotonic_increasing)
+                self.assertEqual(ds.time.encoding['units'], 'days since 1850-01-01')
@@ -0,0 +1,41 @@
+'''Tests the copernicus client module.'''
+
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cdsapi
+
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.client import ClientProvider
+
+from tests.fakes import FakeClient
+from tests.test_cds_request import small_requests
+
+class TestClientProvider(unittest.TestCase):
+    '''Tests the ClientProvider class.'''
+    def test_shared_session(self):
+        '''Tests real cdsapi clients are built once, on the pooled session.'''
+        provider = ClientProvider(url='http://127.0.0.1:1/api', key='1:abc', quiet=True)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(pool.map(lambda _: provider.get(), range(32)))
+        self.assertTrue(all(c is clients[0] for c in clients))
+        self.assertIsInstance(clients[0], cdsapi.api.Client)
+        self.assertIs(clients[0].session, provider.session)
+        self.assertIs(provider.get(wait_until_complete=False).session, provider.session)
+        self.assertFalse(provider.get(wait_until_complete=False).wait_until_complete)
+        self.assertEqual(provider.created, 2)
+
+    def test_injected_provider(self):
+        '''Tests a batch shares the injected provider's client.'''
+        calls = []
+        def factory(**kwargs):
+            calls.append(kwargs)
+            return FakeClient()
+        provider = ClientProvider(factory=factory)
+        requests = small_requests(6)
+        with tempfile.TemporaryDirectory() as tmp:
+            cds.download_requests(requests, tmp, max_workers=3, provider=provider)
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertEqual(provider.created, 1)
+        self.assertIs(calls[0]['session'], provider.session)
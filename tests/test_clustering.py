@@ -0,0 +1,50 @@
+'''Tests the copernicus clustering module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.clustering import download_clustered, plan_clusters
+from climate_data.countries import get_country_bounding_box
+
+from tests.fakes import FakeClient, fake_cds
+
+LOCATIONS = {name: get_country_bounding_box(name)
+             for name in ('Laos', 'Vietnam', 'Cambodia', 'Thailand', 'Chile')}
+
+class TestClustering(unittest.TestCase):
+    '''Tests the plan_clusters and download_clustered functions.'''
+    def test_plan(self):
+        '''Tests neighbouring boxes are merged, distant ones and oversized merges are not.'''
+        template = cds.CMIP6Request(time_step=cmip6.TemporalResolutions.DAILY)
+        plan = plan_clusters(LOCATIONS, template, count=2)
+        self.assertEqual(sorted(sorted(c.names) for c in plan.clusters),
+                         [['Cambodia', 'Laos', 'Thailand', 'Vietnam'], ['Chile']])
+        self.assertEqual((plan.naive_requests, plan.requests), (10, 4))
+        self.assertLess(plan.seconds, plan.naive_seconds)
+        self.assertIn('60% fewer', str(plan))
+        capped = plan_clusters(LOCATIONS, template, max_bytes=plan.clusters[0].bytes // 4)
+        self.assertGreater(len(capped.clusters), 2)
+
+    def test_download(self):
+        '''Tests merged requests are downloaded once and cut into per location files.'''
+        client = FakeClient(netcdf=True)
+        locations = {k: v for k, v in LOCATIONS.items() if k != 'Chile'}
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(client):
+            results = download_clustered(
+                locations, tmp, [cmip6.Variables.TEMP], [cmip6.TemporalResolutions.MONTHLY],
+                [cmip6.Models.ACCESS_CM2], [cmip6.Experiments.HISTORICAL],
+                years=cmip6.HISTORY_YEARS[0:2])
+            self.assertEqual(len(client.calls), 1)
+            self.assertEqual(sorted(results), sorted(locations))
+            n, w, s, e = LOCATIONS['Laos']
+            with xr.open_dataset(results['Laos'][0]) as ds:
+                self.assertTrue(((ds['lat'] >= s) & (ds['lat'] <= n)).all())
+                self.assertTrue(((ds['lon'] >= w) & (ds['lon'] <= e)).all())
+                self.assertEqual(ds.sizes['time'], 24)
+            self.assertEqual(Path(results['Laos'][0]).relative_to(tmp).parts[:2], ('Laos', 'cmip6'))
+            self.assertEqual(list((Path(tmp) / 'clusters').rglob('*.nc')), [])
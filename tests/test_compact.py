@@ -0,0 +1,103 @@
+'''Tests the copernicus compact module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.availability import Availability
+from climate_data.copernicus.compact import (CompactRequest, download_compact, from_mask,
+                                             iter_CMIP6Requests, to_mask)
+
+from tests.fakes import FakeClient, fake_cds
+
+LOCATION = (23, 100, 13, 108)
+MODELS = [cmip6.Models.ACCESS_CM2, cmip6.Models.CESM2, cmip6.Models.MIROC6]
+
+class TestCompact(unittest.TestCase):
+    '''Tests CompactRequest, iter_CMIP6Requests and download_compact.'''
+    def test_masks(self):
+        '''Tests selections round trip through bitmasks.'''
+        self.assertEqual(to_mask(('01', '03'), 1), 0b101)
+        self.assertEqual(from_mask(0b101, 1), ('01', '03'))
+        years = cmip6.HISTORY_YEARS[3:7] + cmip6.HISTORY_YEARS[100:101]
+        self.assertEqual(from_mask(to_mask(years, 1850), 1850, 4), years)
+        self.assertIs(to_mask(cmip6.HISTORY_YEARS, 1850), to_mask(cmip6.HISTORY_YEARS, 1850))
+
+    def test_request(self):
+        '''Tests compact requests expand to the CMIP6Request they stand for.'''
+        kwargs = {'model': cmip6.Models.CESM2, 'experiment': cmip6.Experiments.SSP5_85,
+                  'years': cmip6.PROJECTION_YEARS[5:9], 'location': LOCATION,
+                  'time_step': cmip6.TemporalResolutions.DAILY,
+                  'months': cmip6.MONTHS[5:8], 'days': cmip6.DAYS[0:10]}
+        compact, full = CompactRequest(**kwargs), cds.CMIP6Request(**kwargs)
+        self.assertEqual(compact.request, full.request)
+        self.assertEqual(compact.name_file(), full.name_file())
+        self.assertEqual(compact.expand().request, full.request)
+        self.assertFalse(hasattr(compact, '__dict__'))
+        self.assertEqual(CompactRequest().years, cmip6.HISTORY_YEARS)
+        self.assertIsNone(CompactRequest().days)
+        with self.assertRaises(ValueError):
+            CompactRequest(years=('2050',))
+        with self.assertRaises(ValueError):
+            CompactRequest(days=cmip6.DAYS)
+
+    def test_iter(self):
+        '''Tests requests are yielded lazily, matching build_CMIP6Requests.'''
+        consumed = []
+        def locations():
+            for location in (LOCATION, (10, 0, 0, 10)):
+                consumed.append(location)
+                yield location
+        requests = iter_CMIP6Requests(locations(), [cmip6.Variables.TEMP],
+                                      [cmip6.TemporalResolutions.MONTHLY], MODELS,
+                                      [cmip6.Experiments.HISTORICAL])
+        first = next(requests)
+        self.assertEqual(consumed, [LOCATION])
+        built = cds.build_CMIP6Requests(LOCATION, [cmip6.Variables.TEMP],
+                                        [cmip6.TemporalResolutions.MONTHLY], MODELS,
+                                        [cmip6.Experiments.HISTORICAL])
+        self.assertEqual([r.request for r in [first, *requests]][:3], [r.request for r in built])
+        self.assertEqual(len(consumed), 2)
+
+    def test_availability(self):
+        '''Tests combinations known not to be held are skipped.'''
+        with tempfile.TemporaryDirectory() as tmp:
+            availability = Availability(tmp)
+            availability.set_constraints([{'model': ['cesm2'], 'experiment': ['historical']}])
+            requests = list(iter_CMIP6Requests([LOCATION], [cmip6.Variables.TEMP],
+                                               [cmip6.TemporalResolutions.MONTHLY], MODELS,
+                                               [cmip6.Experiments.HISTORICAL],
+                                               availability=availability, compact=False))
+        self.assertEqual([r.model for r in requests], [cmip6.Models.CESM2])
+
+    def test_download(self):
+        '''Tests compact requests are expanded and downloaded a batch at a time.'''
+        client = FakeClient()
+        requests = iter_CMIP6Requests([LOCATION], [cmip6.Variables.TEMP],
+                                      [cmip6.TemporalResolutions.MONTHLY], MODELS,
+                                      [cmip6.Experiments.HISTORICAL],
+                                      years=cmip6.HISTORY_YEARS[0:2])
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(client):
+            paths = download_compact(requests, tmp, batch_size=2)
+        self.assertEqual(len(client.calls), 3)
+        self.assertTrue(all(paths))
+        self.assertTrue(paths[2].endswith('miroc6_historical_185001-185112.nc'))
+
+    def test_download_locations(self):
+        '''Tests each location of a sweep is written to its own directory.'''
+        client = FakeClient()
+        requests = iter_CMIP6Requests([LOCATION, (10, 0, 0, 10)], [cmip6.Variables.TEMP],
+                                      [cmip6.TemporalResolutions.MONTHLY], MODELS[:1],
+                                      [cmip6.Experiments.HISTORICAL],
+                                      years=cmip6.HISTORY_YEARS[0:2])
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(client):
+            paths = download_compact(requests, tmp)
+            self.assertEqual(len(client.calls), 2)
+            self.assertTrue(all(Path(p).exists() for p in paths))
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertIn('area_10_0_0_10', paths[1])
+
+if __name__ == '__main__':
+    unittest.main()
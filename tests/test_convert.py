@@ -0,0 +1,94 @@
+'''Tests the copernicus convert module.'''
+
+import tempfile
+import unittest
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.catalog import Catalog
+from climate_data.copernicus.convert import ZarrConverter, open_store, series
+from climate_data.copernicus.fake_server import synthetic_dataset
+
+from tests.fakes import FakeClient, fake_cds
+
+@unittest.skipUnless(importlib.util.find_spec('zarr'), 'requires zarr')
+class TestZarrConverter(unittest.TestCase):
+    '''Tests the ZarrConverter class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        self.converter = ZarrConverter(Path(self.base) / 'zarr', chunks={'lat': 4, 'lon': 4})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, years: tuple[str,...]) -> tuple[Path, xr.Dataset]:
+        '''Writes a NetCDF file in the download layout.'''
+        request = cds.CMIP6Request(years=years, location=(10, 0, 0, 10))
+        directory = request.create_directories(self.base)
+        ds = synthetic_dataset(request.request)
+        ds.to_netcdf(Path(directory) / f'{request.name_file()}.nc')
+        return Path(directory) / f'{request.name_file()}.nc', ds
+
+    def test_chunks(self):
+        '''Tests stores are chunked along the whole time axis and small tiles, and compressed.'''
+        path, ds = self.write(cmip6.HISTORY_YEARS[0:2])
+        store = self.converter.convert(path)
+        self.assertEqual(store.name, 'access_cm2_historical.zarr')
+        with open_store(store) as converted:
+            self.assertEqual(converted['tas'].encoding['chunks'], (1980, 4, 4))
+            self.assertEqual(len(converted['tas'].encoding['compressors']), 1)
+            np.testing.assert_array_equal(converted['tas'].values, ds['tas'].values)
+        np.testing.assert_array_equal(series(store, 'tas', 5.5, 3.5).values,
+                                      ds['tas'].sel(lat=5.5, lon=3.5).values)
+
+    def test_incremental_append(self):
+        '''Tests files are appended along time, skipping time steps already stored.'''
+        for years in (cmip6.HISTORY_YEARS[0:2], cmip6.HISTORY_YEARS[2:4], cmip6.HISTORY_YEARS[1:3]):
+            path, _ = self.write(years)
+        stores = self.converter.convert_catalog(Catalog(self.base))
+        self.assertEqual(len(stores), 1)
+        stores = self.converter.convert_catalog(Catalog(self.base))
+        with open_store(stores[0]) as converted:
+            self.assertEqual(converted.sizes['time'], 48)
+            self.assertEqual(converted['time'].values[-1].year, 1853)
+        other = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[4:5], location=(20, 0, 0, 10))
+        synthetic_dataset(other.request).to_netcdf(path.parent / f'{other.name_file()}.nc')
+        with self.assertRaises(ValueError):
+            self.converter.convert(path.parent / f'{other.name_file()}.nc')
+
+    def test_out_of_order(self):
+        '''Tests earlier files are merged in by time, not dropped.'''
+        later, _ = self.write(cmip6.HISTORY_YEARS[2:4])
+        earlier, _ = self.write(cmip6.HISTORY_YEARS[0:2])
+        store = self.converter.convert(later)
+        self.converter.convert(earlier)
+        self.converter.convert(earlier)
+        with open_store(store) as converted:
+            self.assertEqual(converted.sizes['time'], 48)
+            self.assertEqual([t.year for t in converted['time'].values[[0, -1]]], [1850, 1853])
+            self.assertTrue((np.diff([t.toordinal() for t in converted['time'].values]) > 0).all())
+            self.assertEqual(converted['tas'].encoding['chunks'], (1980, 4, 4))
+
+    def test_concurrent(self):
+        '''Tests threads converting into the same store do not lose time steps.'''
+        paths = [self.write(cmip6.HISTORY_YEARS[i:i + 1])[0] for i in range(6)]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            stores = list(pool.map(self.converter.convert, reversed(paths)))
+        with open_store(stores[0]) as converted:
+            self.assertEqual(converted.sizes['time'], 72)
+
+    def test_download_pipeline(self):
+        '''Tests download_requests converts each extracted file.'''
+        requests = [cds.CMIP6Request(years=years, location=(10, 0, 0, 10))
+                    for years in (cmip6.HISTORY_YEARS[0:2], cmip6.HISTORY_YEARS[2:4])]
+        with fake_cds(FakeClient(netcdf=True)):
+            cds.download_requests(requests, self.base, converter=self.converter)
+        with open_store(self.converter.directory / 'tas/monthly/access_cm2_historical.zarr') as ds:
+            self.assertEqual(ds.sizes['time'], 48)
@@ -2,11 +2,50 @@
 
 import unittest
 
-from climate_data.countries import get_country_bounding_box
+import numpy as np
+
+from climate_data.countries import COUNTRIES, INDEX, get_country_bounding_box
+
+def brute_force(lat: float, lon: float) -> list[str]:
+    '''Returns the countries whose box contains a point, by checking every country.'''
+    return sorted(name for name, (w, s, e, n) in COUNTRIES.items()
+                  if w <= lon <= e and s <= lat <= n)
 
 class TestCountries(unittest.TestCase):
     '''Tests the countries module.'''	
     def test_get_country_bounding_box(self):
         '''Tests the get_country_bounding_box function.'''	
         bbox = get_country_bounding_box("Laos")
-        self.assertEqual(bbox, [100, 13, 108, 23])
+        self.assertEqual(bbox, (23, 100, 13, 108))
+        self.assertEqual(get_country_bounding_box("laos"), bbox)
+        self.assertEqual(get_country_bounding_box("LA"), bbox)
+
+class TestCountryIndex(unittest.TestCase):
+    '''Tests the CountryIndex class.'''
+    def test_lookup(self):
+        '''Tests case insensitive name and ISO code lookups.'''
+        self.assertEqual(INDEX.lookup('VIETNAM'), 'Vietnam')
+        self.assertEqual(INDEX.lookup('vn'), 'Vietnam')
+        self.assertEqual(INDEX.lookup(' bosnia and herz. '), 'Bosnia and Herz.')
+        with self.assertRaises(KeyError):
+            INDEX.lookup('Atlantis')
+
+    def test_points(self):
+        '''Tests batch point queries match a brute force search.'''
+        rng = np.random.default_rng(0)
+        lats, lons = rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000)
+        results = INDEX.at_points(lats, lons)
+        for lat, lon, found in zip(lats, lons, results):
+            self.assertEqual(sorted(found), brute_force(lat, lon))
+        self.assertIn('Laos', INDEX.at(18.0, 103.0))
+        self.assertEqual(INDEX.at(18.0, 103.0 + 360), INDEX.at(18.0, 103.0))
+
+    def test_boxes(self):
+        '''Tests box intersection and containment queries, across the antimeridian too.'''
+        region = (23, 100, 13, 108)
+        self.assertIn('Laos', INDEX.intersecting(region))
+        self.assertIn('Vietnam', INDEX.intersecting(region))
+        self.assertEqual(INDEX.within((24, 100, 8, 110)), ['Cambodia', 'Laos', 'Vietnam'])
+        self.assertIn('Vanuatu', INDEX.within((0, 160, -25, -170)))
+        self.assertIn('Fiji', INDEX.intersecting((-17, 179, -18, -179)))
+        self.assertNotIn('Laos', INDEX.intersecting((-17, 179, -18, -179)))
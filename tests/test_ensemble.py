@@ -0,0 +1,105 @@
+'''Tests the copernicus ensemble module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.catalog import Catalog
+from climate_data.copernicus.ensemble import Histogram, RunningStats, ensemble_statistics
+from climate_data.copernicus.fake_server import synthetic_dataset
+
+MODELS = (cmip6.Models.ACCESS_CM2, cmip6.Models.CESM2, cmip6.Models.MIROC6, cmip6.Models.NESM3)
+
+def write_ensemble(base: str) -> dict[str, xr.Dataset]:
+    '''Writes random monthly data for four models, one on a 0 to 360 longitude grid.'''
+    rng = np.random.default_rng(0)
+    members = {}
+    for i, model in enumerate(MODELS):
+        request = cds.CMIP6Request(model=model, years=cmip6.HISTORY_YEARS[0:2],
+                                   location=(4, -2, 0, 3))
+        ds = synthetic_dataset(request.request)
+        ds['tas'].values = rng.normal(280 + i, 5, ds['tas'].shape).astype('float32')
+        members[model.value] = ds
+        if model == cmip6.Models.NESM3:
+            ds = ds.assign_coords(lon=ds['lon'] % 360)
+        if model == cmip6.Models.MIROC6: # a year short.
+            ds = ds.isel(time=slice(12, None))
+        directory = request.create_directories(base)
+        ds.to_netcdf(Path(directory) / f'{request.name_file()}.nc')
+    return members
+
+class TestRunningStats(unittest.TestCase):
+    '''Tests the RunningStats and Histogram classes.'''
+    def test_merge(self):
+        '''Tests merged partial statistics match numpy over the whole stream.'''
+        values = np.random.default_rng(1).normal(0, 3, (20, 5, 6))
+        values[3, 0, 0] = np.nan
+        left, right = RunningStats((5, 6)), RunningStats((5, 6))
+        for v in values[:7]:
+            left.update(v)
+        for v in values[7:]:
+            right.update(v)
+        stats = left.merge(right)
+        np.testing.assert_allclose(stats.mean, np.nanmean(values, axis=0))
+        np.testing.assert_allclose(stats.variance(), np.nanvar(values, axis=0, ddof=1))
+        np.testing.assert_array_equal(stats.minimum, np.nanmin(values, axis=0))
+        self.assertEqual(stats.count[0, 0], 19)
+
+    def test_quantiles(self):
+        '''Tests histogram quantiles are within a bin width of numpy's.'''
+        values = np.random.default_rng(2).normal(0, 1, (500, 3, 4))
+        low, high = values.min(axis=0), values.max(axis=0)
+        histogram = Histogram(low, high, bins=256)
+        for v in values[:250]:
+            histogram.update(v)
+        other = Histogram(low, high, bins=256)
+        for v in values[250:]:
+            other.update(v)
+        histogram.merge(other)
+        for q in (0.05, 0.5, 0.95):
+            np.testing.assert_allclose(histogram.quantile(q), np.quantile(values, q, axis=0),
+                                       atol=((high - low) / 256).max())
+
+class TestEnsembleStatistics(unittest.TestCase):
+    '''Tests the ensemble_statistics function.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.members = write_ensemble(self.tmp.name)
+        self.catalog = Catalog(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_statistics(self):
+        '''Tests statistics match numpy across models, in blocks and in worker processes.'''
+        stacked = np.stack([ds['tas'].values for ds in self.members.values()])
+        stacked[2, :12] = np.nan # the short model.
+        serial = ensemble_statistics(self.catalog, cmip6.Variables.TEMP,
+                                     cmip6.Experiments.HISTORICAL, time_block=5, bins=512)
+        np.testing.assert_allclose(serial['mean'].values, np.nanmean(stacked, axis=0), rtol=1e-6)
+        np.testing.assert_allclose(serial['std'].values, np.nanstd(stacked, axis=0, ddof=1),
+                                   rtol=1e-5)
+        self.assertEqual(int(serial['count'][0, 0, 0]), 3)
+        self.assertEqual(int(serial['count'][-1, 0, 0]), 4)
+        width = (np.nanmax(stacked, axis=0) - np.nanmin(stacked, axis=0)) / 512
+        np.testing.assert_array_less(
+            np.abs(serial['quantiles'].sel(quantile=0.5).values -
+                   np.nanquantile(stacked, 0.5, axis=0)), width + 1e-6)
+        target = Path(self.tmp.name) / 'ensemble.nc'
+        parallel = ensemble_statistics(self.catalog, cmip6.Variables.TEMP,
+                                       cmip6.Experiments.HISTORICAL, time_block=7, bins=512,
+                                       max_workers=2, target=target)
+        np.testing.assert_allclose(parallel['mean'].values, serial['mean'].values, rtol=1e-6)
+        self.assertEqual(parallel.sizes['time'], 24)
+        parallel.close()
+
+    def test_missing(self):
+        '''Tests a selection without files raises.'''
+        with self.assertRaises(FileNotFoundError):
+            ensemble_statistics(self.catalog, cmip6.Variables.PRECIP,
+                                cmip6.Experiments.HISTORICAL)
@@ -0,0 +1,47 @@
+'''Tests the copernicus estimate module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.estimate import (
+    estimate_bytes, grid_cells, plan_requests, timesteps)
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_chunking import daily_request
+
+class TestEstimate(unittest.TestCase):
+    '''Tests the estimate module.'''
+    def test_estimate_bytes(self):
+        '''Tests grid cells, time steps and bytes of a request.'''
+        request = daily_request(cmip6.HISTORY_YEARS[0:2])
+        self.assertEqual(grid_cells(request.location), 6)
+        self.assertEqual(timesteps(request), 730)
+        self.assertEqual(estimate_bytes(request, (1.0, 1.0)), 6 * 730 * 4)
+        # ACCESS_CM2 is on a 1.25 x 1.875 degree grid.
+        self.assertEqual(estimate_bytes(request), 4 * 730 * 4)
+        monthly = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:2])
+        self.assertEqual(timesteps(monthly), 24)
+
+    def test_plan(self):
+        '''Tests batch totals and the largest requests.'''
+        small = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:2])
+        large = daily_request(cmip6.HISTORY_YEARS)
+        plan = plan_requests([small, large], max_workers=2)
+        self.assertEqual(plan.total_bytes, estimate_bytes(small) + estimate_bytes(large))
+        self.assertEqual(plan.largest(1)[0].request, large)
+        self.assertGreaterEqual(plan.total_seconds, plan.largest(1)[0].seconds)
+        self.assertIn('2 requests', str(plan))
+
+    def test_dry_run(self):
+        '''Tests a dry run neither contacts the CDS nor creates directories.'''
+        client = FakeClient()
+        with tempfile.TemporaryDirectory() as tmp:
+            with fake_cds(client):
+                paths = cds.download_requests([daily_request(cmip6.HISTORY_YEARS)], tmp,
+                                              dry_run=True)
+            self.assertEqual(client.calls, [])
+            self.assertEqual(list(Path(tmp).iterdir()), [])
+        self.assertTrue(paths[0].endswith('access_cm2_historical_18500101-20141231.nc'))
@@ -0,0 +1,154 @@
+'''Tests the copernicus extend module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import Source
+from climate_data.copernicus.extend import (download_extended, download_extended_requests,
+                                            find_extendable, missing_years)
+from climate_data.copernicus.index import FileIndex
+
+from tests.fakes import FakeClient, fake_cds
+
+def monthly_request(years: tuple[str,...]) -> cds.CMIP6Request:
+    '''Builds a monthly request over a 2 x 3 degree box.'''
+    return cds.CMIP6Request(years=years, location=(2, 100, 0, 103))
+
+class TestExtend(unittest.TestCase):
+    '''Tests find_extendable, missing_years and download_extended.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.client = FakeClient(netcdf=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def download(self, years: tuple[str,...]) -> tuple[cds.CMIP6Request, str]:
+        '''Downloads a request, returns it and its directory.'''
+        request = monthly_request(years)
+        directory = request.create_directories(self.tmp.name)
+        with fake_cds(self.client):
+            request.download(directory)
+        return request, directory
+
+    def test_missing_years(self):
+        '''Tests only the years before and after an existing file are missing.'''
+        years = cmip6.HISTORY_YEARS
+        request = monthly_request(years[0:6])
+        self.assertEqual(missing_years(request, 1852, 1853), (years[0:2], years[4:6]))
+        self.assertEqual(missing_years(request, 1850, 1860), ((), ()))
+
+    def test_find_extendable(self):
+        '''Tests files are found by name, and must overlap or adjoin the request.'''
+        _, directory = self.download(cmip6.HISTORY_YEARS[0:2])
+        path, first, last = find_extendable(monthly_request(cmip6.HISTORY_YEARS[2:4]), directory)
+        self.assertEqual((path.name, first, last), ('access_cm2_historical_185001-185112.nc',
+                                                    1850, 1851))
+        self.assertIsNone(find_extendable(monthly_request(cmip6.HISTORY_YEARS[3:5]), directory))
+        daily = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:3], location=(2, 100, 0, 103),
+                                 time_step=cmip6.TemporalResolutions.DAILY, days=cmip6.DAYS)
+        self.assertIsNone(find_extendable(daily, directory))
+
+    def test_extend_after(self):
+        '''Tests only the later years are requested, then appended in place once time is unlimited.'''
+        _, directory = self.download(cmip6.HISTORY_YEARS[0:2])
+        request = monthly_request(cmip6.HISTORY_YEARS[0:4])
+        with fake_cds(self.client):
+            path = download_extended(request, directory)
+        self.assertEqual(self.client.calls[-1]['year'], cmip6.HISTORY_YEARS[2:4])
+        self.assertEqual(request.source, Source.EXTENDED)
+        self.assertEqual(Path(path).name, 'access_cm2_historical_185001-185312.nc')
+        self.assertFalse((Path(directory) / 'access_cm2_historical_185001-185112.nc').exists())
+        self.assertEqual(Path(request.file_chain[0]).suffix, '.zip')
+        with xr.open_dataset(path) as ds:
+            self.assertEqual(ds.sizes['time'], 48)
+            self.assertTrue(ds.indexes['time'].is_monotonic_increasing)
+
+        request = monthly_request(cmip6.HISTORY_YEARS[0:5])
+        with fake_cds(self.client):
+            path = download_extended(request, directory)
+        self.assertEqual(self.client.calls[-1]['year'], cmip6.HISTORY_YEARS[4:5])
+        self.assertEqual(request.years, cmip6.HISTORY_YEARS[0:5])
+        with xr.open_dataset(path) as ds:
+            self.assertEqual(ds.sizes['time'], 60)
+            self.assertEqual(int(ds.indexes['time'][-1].year), 1854)
+        self.assertEqual(list(Path(directory).glob('*.nc')), [Path(path)])
+
+    def test_extend_before(self):
+        '''Tests earlier years are stitched in front, and covered requests are not sent.'''
+        _, directory = self.download(cmip6.HISTORY_YEARS[2:4])
+        request = monthly_request(cmip6.HISTORY_YEARS[0:3])
+        with fake_cds(self.client):
+            path = download_extended(request, directory)
+        self.assertEqual(self.client.calls[-1]['year'], cmip6.HISTORY_YEARS[0:2])
+        self.assertEqual(request.years, cmip6.HISTORY_YEARS[0:4])
+        with xr.open_dataset(path) as ds:
+            self.assertEqual(ds.sizes['time'], 48)
+            self.assertTrue(ds.indexes['time'].is_monotonic_increasing)
+
+        calls = len(self.client.calls)
+        request = monthly_request(cmip6.HISTORY_YEARS[1:3])
+        with fake_cds(self.client):
+            self.assertEqual(download_extended(request, directory), path)
+        self.assertEqual(len(self.client.calls), calls)
+        self.assertEqual(request.source, Source.INDEX)
+
+    def test_failed_gap(self):
+        '''Tests a failed block leaves the existing file unchanged.'''
+        first, directory = self.download(cmip6.HISTORY_YEARS[0:2])
+        request = monthly_request(cmip6.HISTORY_YEARS[0:4])
+        with fake_cds(FakeClient(netcdf=True, fail=True)):
+            self.assertTrue(download_extended(request, directory).startswith('Error'))
+        self.assertEqual(request.status, cds.Status.ERROR)
+        self.assertTrue(Path(first.file_chain[-1]).exists())
+
+    def test_other_extent(self):
+        '''Tests a file of another bbox in the directory is not extended.'''
+        first, directory = self.download(cmip6.HISTORY_YEARS[0:2])
+        request = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:4], location=(12, 110, 10, 113))
+        self.assertIsNone(find_extendable(request, directory))
+        with fake_cds(self.client):
+            path = download_extended(request, directory)
+        self.assertEqual(self.client.calls[-1]['year'], cmip6.HISTORY_YEARS[0:4])
+        self.assertNotEqual(request.source, Source.EXTENDED)
+        self.assertTrue(Path(first.file_chain[-1]).exists())
+        with xr.open_dataset(path) as ds:
+            self.assertEqual(float(ds['lat'].min()), 10.5)
+
+    def test_model_prefix(self):
+        '''Tests a file of a model whose name extends the request's model is not extended.'''
+        other = cds.CMIP6Request(cmip6.Models.CESM2_WACCM, years=cmip6.HISTORY_YEARS[0:2],
+                                 location=(2, 100, 0, 103))
+        directory = other.create_directories(self.tmp.name)
+        with fake_cds(self.client):
+            other.download(directory)
+        request = cds.CMIP6Request(cmip6.Models.CESM2, years=cmip6.HISTORY_YEARS[0:4],
+                                   location=(2, 100, 0, 103))
+        self.assertIsNone(find_extendable(request, directory))
+        with fake_cds(self.client):
+            download_extended(request, directory)
+        self.assertEqual(self.client.calls[-1]['year'], cmip6.HISTORY_YEARS[0:4])
+        self.assertTrue(Path(other.file_chain[-1]).exists())
+
+    def test_extend_with_index(self):
+        '''Tests the index finds the file by bbox, and its entry is replaced.'''
+        with FileIndex(self.tmp.name) as index:
+            request = monthly_request(cmip6.HISTORY_YEARS[0:2])
+            with fake_cds(self.client):
+                download_extended_requests([request], self.tmp.name, index=index)
+                other = cds.CMIP6Request(years=cmip6.HISTORY_YEARS[0:4], location=(3, 100, 0, 103))
+                self.assertIsNone(find_extendable(other, '', index))
+                request = monthly_request(cmip6.HISTORY_YEARS[0:4])
+                paths = download_extended_requests([request], self.tmp.name, index=index)
+            self.assertEqual(index.summary()['files'], 1)
+            entry = index.get(paths[0])
+            self.assertEqual((entry['first_year'], entry['last_year']), (1850, 1853))
+            self.assertEqual(len(index.covering(request.request)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+'''Tests the local CDS API stand-in, through cdsapi's own client.'''
+
+import time
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+import climate_data.copernicus.transfer as transfer
+from climate_data.copernicus.fake_server import FakeCDSServer
+
+from tests.test_cds_request import small_requests
+
+class TestFakeCDSServer(unittest.TestCase):
+    '''Tests the FakeCDSServer class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        patcher = mock.patch.object(transfer, 'RETRY_SECONDS', 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_download(self):
+        '''Tests a request is submitted, polled, transferred and unzipped into a valid NetCDF file.'''
+        request = small_requests(1)[0]
+        with FakeCDSServer(latency=0.2) as server:
+            path = request.download(request.create_directories(self.base),
+                                    provider=server.provider())
+        self.assertEqual(request.status, cds.Status.SUCCESS)
+        with xr.open_dataset(path) as ds:
+            self.assertEqual(ds.sizes['time'], 24)
+            self.assertEqual(ds.sizes['lat'], 10)
+        self.assertTrue(zipfile.is_zipfile(request.file_chain[0]))
+        self.assertEqual(server.bytes_sent, Path(request.file_chain[0]).stat().st_size)
+
+    def test_failure_rate(self):
+        '''Tests failed jobs are reported with the server's message and reason.'''
+        request = small_requests(1)[0]
+        with FakeCDSServer(failure_rate=1.0) as server:
+            result = request.download(request.create_directories(self.base),
+                                      provider=server.provider())
+        self.assertEqual(request.status, cds.Status.ERROR)
+        self.assertIn('Simulated server error', result)
+
+    def test_dropped_transfer_is_resumed(self):
+        '''Tests a transfer cut off by the server is retried, and the result unzips.'''
+        request = small_requests(1)[0]
+        with FakeCDSServer(drop_rate=1.0) as server:
+            request.download(request.create_directories(self.base), provider=server.provider())
+        self.assertEqual(request.status, cds.Status.SUCCESS)
+        self.assertEqual(server.dropped, 1)
+        # the cut off half is sent again when nothing of it reached the .part file.
+        self.assertGreater(server.bytes_sent, Path(request.file_chain[0]).stat().st_size)
+
+    def test_bandwidth(self):
+        '''Tests transfers are throttled to the server bandwidth.'''
+        payload = bytes(2**18)
+        request = small_requests(1)[0]
+        with FakeCDSServer(bandwidth=2**20, payload=payload) as server:
+            job = server.provider().get(wait_until_complete=False).retrieve(
+                cmip6.DATASET, request.request)
+            job.update()
+            target = Path(self.base) / 'result.zip'
+            start = time.perf_counter()
+            transfer.download_result(job, target)
+            elapsed = time.perf_counter() - start
+        self.assertEqual(target.read_bytes(), payload)
+        self.assertGreaterEqual(elapsed, 0.25)
+
+    def test_quota(self):
+        '''Tests at most max_active jobs run at once, and extra submissions are rejected.'''
+        with FakeCDSServer(latency=0.3, max_active=2) as server:
+            requests = small_requests(4)
+            cds.download_requests(requests, self.base, max_workers=4, provider=server.provider())
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertEqual(server.peak_active, 2)
+        with FakeCDSServer(latency=5.0, max_queued=1) as server:
+            client = server.provider(retry_max=1).get(wait_until_complete=False)
+            job = client.retrieve(cmip6.DATASET, small_requests(1)[0].request)
+            self.assertEqual(job.reply['state'], 'running')
+            with self.assertRaises(Exception):
+                client.retrieve(cmip6.DATASET, small_requests(2)[1].request)
+        self.assertEqual(server.rejected, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+'''Tests the copernicus index module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+from dataclasses import replace
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import Source
+from climate_data.copernicus.index import FileIndex, checksum
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_cds_request import small_requests
+
+class TestFileIndex(unittest.TestCase):
+    '''Tests the FileIndex class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_download_updates_index(self):
+        '''Tests extracted files are indexed with their bbox, years, size and checksum.'''
+        with fake_cds(FakeClient()), FileIndex(self.base) as index:
+            paths = cds.download_requests(small_requests(2), self.base, index=index)
+            entry = index.get(paths[0])
+            self.assertEqual(index.summary()['files'], 2)
+        self.assertEqual((entry['model'], entry['experiment'], entry['variable']),
+                         ('access_cm2', 'historical', 'tas'))
+        self.assertEqual((entry['north'], entry['west'], entry['south'], entry['east']),
+                         (23, 100, 13, 108))
+        self.assertEqual((entry['first_year'], entry['last_year']), (1850, 1851))
+        self.assertEqual(entry['size'], Path(paths[0]).stat().st_size)
+        self.assertEqual(entry['checksum'], checksum(paths[0]))
+        self.assertEqual(entry['path'], 'cmip6/tas/monthly/access_cm2_historical_185001-185112.nc')
+
+    def test_coverage(self):
+        '''Tests covered requests are skipped and missing requests are reported.'''
+        client = FakeClient()
+        with fake_cds(client), FileIndex(self.base) as index:
+            cds.download_requests(small_requests(2), self.base, index=index)
+            inner = replace(small_requests(1)[0], location=(20, 101, 15, 105),
+                            years=cmip6.HISTORY_YEARS[1:2])
+            outer = replace(inner, location=(30, 90, 0, 110))
+            self.assertEqual(index.missing(small_requests(3) + [inner, outer]),
+                             [small_requests(3)[2], outer])
+            requests = [inner] + small_requests(3)
+            cds.download_requests(requests, self.base, index=index)
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual([r.source for r in requests],
+                         [Source.INDEX, Source.INDEX, Source.INDEX, Source.REMOTE])
+        self.assertTrue(str(requests[0].file_chain[-1]).endswith('access_cm2_historical_185001-185112.nc'))
+
+    def test_rebuild(self):
+        '''Tests rebuild adds unindexed files and drops deleted ones.'''
+        with fake_cds(FakeClient()):
+            paths = cds.download_requests(small_requests(2), self.base)
+        with FileIndex(self.base) as index:
+            self.assertEqual(index.rebuild(), 2)
+            self.assertTrue(index.exists(paths[1]))
+            self.assertIsNone(index.get(paths[1])['north'])
+            Path(paths[1]).unlink()
+            self.assertEqual(index.rebuild(), 1)
+            self.assertFalse(index.exists(paths[1]))
+            self.assertEqual(len(index.search(model=cmip6.Models.ACCESS_CM2)), 1)
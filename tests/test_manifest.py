@@ -0,0 +1,102 @@
+'''Tests the copernicus manifest module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import Source, request_key
+from climate_data.copernicus.manifest import Manifest
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_cds_request import small_requests
+
+class TestManifest(unittest.TestCase):
+    '''Tests the Manifest class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        patcher = mock.patch.object(cds, 'POLL_INTERVAL', 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record(self):
+        '''Tests entries are inserted, updated and persisted.'''
+        with Manifest(self.base) as manifest:
+            manifest.record('a', payload={'model': 'cesm2'}, status='queued', job_id='job-1')
+            manifest.record('a', status='success', paths=['x.zip', 'x.nc'])
+        with Manifest(self.base) as manifest:
+            entry = manifest.get('a')
+            self.assertEqual(entry['job_id'], 'job-1')
+            self.assertEqual(entry['payload'], {'model': 'cesm2'})
+            self.assertEqual(manifest.completed('a'), ['x.zip', 'x.nc'])
+            self.assertIsNone(manifest.get('b'))
+            self.assertEqual(manifest.summary(), {'success': 1})
+            with self.assertRaises(ValueError):
+                manifest.record('a', colour='red')
+
+    def test_rerun_skips_completed(self):
+        '''Tests a rerun of a batch skips requests completed by the first run.'''
+        client = FakeClient()
+        with fake_cds(client):
+            with Manifest(self.base) as manifest:
+                cds.download_requests(small_requests(3), self.base, manifest=manifest)
+            self.assertEqual(len(client.calls), 3)
+            requests = small_requests(4)
+            with Manifest(self.base) as manifest:
+                paths = cds.download_requests(requests, self.base, manifest=manifest)
+                self.assertEqual(manifest.summary(), {'success': 4})
+                entry = manifest.get(request_key(requests[0].request, cmip6.DATASET, '.nc'))
+        self.assertEqual(len(client.calls), 4)
+        self.assertEqual([r.source for r in requests], [Source.MANIFEST] * 3 + [Source.REMOTE])
+        self.assertTrue(all(Path(p).exists() for p in paths))
+        self.assertEqual(entry['job_id'], 'job-1')
+        self.assertGreater(entry['bytes'], 0)
+        self.assertLessEqual(entry['submitted'], entry['completed'])
+        self.assertLessEqual(entry['completed'], entry['finished'])
+
+    def test_reattach_running_job(self):
+        '''Tests a rerun re-attaches to a job left running on the CDS.'''
+        client = FakeClient(states=('queued', 'running', 'running', 'completed'))
+        request = small_requests(1)[0]
+        with fake_cds(client):
+            with Manifest(self.base) as manifest:
+                key = request_key(request.request, cmip6.DATASET, '.nc')
+                request.submit()
+                manifest.record(key, job_id=request.job_id, status=request.status.value)
+            rerun = small_requests(1)[0]
+            with Manifest(self.base) as manifest:
+                cds.download_requests([rerun], self.base, manifest=manifest)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(rerun.status, cds.Status.SUCCESS)
+        self.assertEqual(rerun.job_id, 'job-1')
+
+    def test_failed_request(self):
+        '''Tests failures are recorded with their error.'''
+        request = small_requests(1)[0]
+        with fake_cds(FakeClient(fail=True)):
+            with Manifest(self.base) as manifest:
+                cds.download_requests([request], self.base, manifest=manifest)
+                entry = manifest.get(request_key(request.request, cmip6.DATASET, '.nc'))
+        self.assertEqual(entry['status'], 'error')
+        self.assertIn('not valid', entry['error'])
+
+    def test_existing_file(self):
+        '''Tests an existing zip with no manifest entry is recorded as an error, not submitted.'''
+        client = FakeClient()
+        with fake_cds(client):
+            cds.download_requests(small_requests(1), self.base)
+            request = small_requests(1)[0]
+            with Manifest(self.base) as manifest:
+                paths = cds.download_requests([request], self.base, manifest=manifest)
+                entry = manifest.get(request_key(request.request, cmip6.DATASET, '.nc'))
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(paths, [''])
+        self.assertIsInstance(request.error, FileExistsError)
+        self.assertEqual(entry['status'], 'error')
+        self.assertIn('already exists', entry['error'])
@@ -0,0 +1,115 @@
+'''Tests the copernicus merging module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import xarray as xr
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import Source
+from climate_data.copernicus.merging import download_merged, plan_merges
+
+from tests.fakes import FakeClient, fake_cds
+
+YEARS = cmip6.HISTORY_YEARS
+BOX = (20, 100, 10, 110)
+
+def request(years: tuple[str,...], location: tuple[int, int, int, int] = BOX,
+            model: cmip6.Models = cmip6.Models.ACCESS_CM2) -> cds.CMIP6Request:
+    '''Builds a monthly request.'''
+    return cds.CMIP6Request(model, years=years, location=location)
+
+class TestMerging(unittest.TestCase):
+    '''Tests the plan_merges and download_merged functions.'''
+    def test_plan(self):
+        '''Tests overlapping, adjacent, duplicate and nested requests merge, disjoint ones do not.'''
+        requests = [request(YEARS[0:3]), request(YEARS[2:5]), request(YEARS[5:6]),
+                    request(YEARS[0:3]), request(YEARS[10:12]),
+                    request(YEARS[0:6], (15, 102, 12, 105)),
+                    request(YEARS[0:3], model=cmip6.Models.CESM2)]
+        plan = plan_merges(requests)
+        self.assertEqual([m.members for m in plan.merges], [[0, 1, 2, 3, 5], [4], [6]])
+        self.assertEqual(plan.merges[0].request.years, YEARS[0:6])
+        self.assertEqual(plan.merges[0].request.location, BOX)
+        self.assertEqual((plan.naive_requests, plan.requests), (7, 3))
+        self.assertLess(plan.bytes, plan.naive_bytes)
+        self.assertIn('4 jobs saved', str(plan))
+
+    def test_plan_limits(self):
+        '''Tests merges that would download unrequested data, or exceed max_bytes, are not made.'''
+        plan = plan_merges([request(YEARS[0:2], (20, 100, 10, 105)),
+                            request(YEARS[4:6], (20, 100, 10, 105)),
+                            request(YEARS[0:2], (20, 108, 10, 112))])
+        self.assertEqual(plan.requests, 3)
+        capped = plan_merges([request(YEARS[0:2]), request(YEARS[2:4])],
+                             max_bytes=plan.merges[0].bytes)
+        self.assertEqual(capped.requests, 2)
+
+    def test_download(self):
+        '''Tests merged requests are downloaded once, and cut into each request's file.'''
+        client = FakeClient(netcdf=True)
+        requests = [request(YEARS[0:2]), request(YEARS[1:4]), request(YEARS[0:2]),
+                    request(YEARS[0:4], (15, 102, 12, 105)),
+                    request(YEARS[0:2], model=cmip6.Models.CESM2)]
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(client):
+            paths = download_merged(requests, tmp)
+            self.assertEqual(len(client.calls), 2)
+            self.assertTrue(Path(paths[4]).exists())
+            self.assertEqual(client.calls[0]['year'], YEARS[0:4])
+            self.assertTrue(all(r.source == Source.MERGED for r in requests))
+            self.assertEqual(paths[0], paths[2])
+            self.assertTrue(paths[1].endswith('access_cm2_historical_185101-185312.nc'))
+            with xr.open_dataset(paths[1]) as ds:
+                self.assertEqual(ds.sizes['time'], 36)
+                self.assertEqual((ds.sizes['lat'], ds.sizes['lon']), (10, 10))
+            with xr.open_dataset(paths[3]) as ds:
+                self.assertEqual(ds.sizes['time'], 48)
+                self.assertEqual((ds.sizes['lat'], ds.sizes['lon']), (3, 3))
+            self.assertEqual(list((Path(tmp) / 'merged').rglob('*.nc')), [])
+
+    def test_covering_first(self):
+        '''Tests a request the merged file covers does not take it from the requests cut after it.'''
+        client = FakeClient(netcdf=True)
+        requests = [request(YEARS[0:4]), request(YEARS[0:2])]
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(client):
+            paths = download_merged(requests, tmp)
+            self.assertEqual(len(client.calls), 1)
+            self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+            with xr.open_dataset(paths[1]) as ds:
+                self.assertEqual(ds.sizes['time'], 24)
+            self.assertEqual(list((Path(tmp) / 'merged').rglob('*.nc')), [])
+
+            requests = [request(YEARS[0:2]), request(YEARS[2:4])]
+            paths = download_merged(requests, tmp)
+        self.assertEqual(paths[0], '')
+        self.assertIsInstance(requests[0].error, FileExistsError)
+        self.assertTrue(paths[1].endswith('access_cm2_historical_185201-185312.nc'))
+
+    def test_nested_areas(self):
+        '''Tests requests over nested areas are each cut to their own area, in their own directory.'''
+        client = FakeClient(netcdf=True)
+        requests = [request(YEARS[0:2], (4, 100, 0, 104)), request(YEARS[0:2], (2, 100, 0, 102))]
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(client):
+            paths = download_merged(requests, tmp)
+            self.assertEqual(len(client.calls), 1)
+            self.assertNotEqual(paths[0], paths[1])
+            self.assertIn('area_2_100_0_102', paths[1])
+            for path, (n, w, s, e) in zip(paths, (r.location for r in requests)):
+                with xr.open_dataset(path) as ds:
+                    self.assertEqual((float(ds['lat'].min()), float(ds['lat'].max())),
+                                     (s + 0.5, n - 0.5))
+                    self.assertEqual((float(ds['lon'].min()), float(ds['lon'].max())),
+                                     (w + 0.5, e - 0.5))
+
+    def test_failure(self):
+        '''Tests the requests of a failed merge are recorded as errors.'''
+        requests = [request(YEARS[0:2]), request(YEARS[1:3])]
+        with tempfile.TemporaryDirectory() as tmp, fake_cds(FakeClient(fail=True)):
+            self.assertEqual(download_merged(requests, tmp), ['', ''])
+        self.assertTrue(all(r.status == cds.Status.ERROR for r in requests))
+        self.assertIsNotNone(requests[1].error)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+'''Tests the copernicus metrics module.'''
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.fake_server import FakeCDSServer
+from climate_data.copernicus.metrics import Event, Events, JsonLinesSink, Stage, Summary
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_cds_request import small_requests
+
+class TestSummary(unittest.TestCase):
+    '''Tests the Summary class.'''
+    def test_report(self):
+        '''Tests stage percentiles, skipped stages and batch throughput.'''
+        summary = Summary()
+        for i in range(10):
+            start = 10.0 * i
+            for stage, offset, size in ((Stage.SUBMIT, 0, 0), (Stage.QUEUED, 1, 0),
+                                        (Stage.COMPLETED, 1 + i, 0),
+                                        (Stage.TRANSFER_START, 1 + i, 0),
+                                        (Stage.TRANSFER_END, 2 + i, 2**20)):
+                summary(Event(f'r{i}', stage, start + offset, size))
+        report = summary.report()
+        self.assertEqual(report['requests'], 10)
+        self.assertNotIn('queue', report['stages']) # no running events.
+        self.assertEqual(report['stages']['server']['p50'], 4.5)
+        self.assertAlmostEqual(report['stages']['server']['p95'], 8.55)
+        self.assertEqual(report['stages']['transfer']['count'], 10)
+        self.assertEqual(report['bytes'], 10 * 2**20)
+        self.assertEqual(report['elapsed'], 101.0)
+        self.assertAlmostEqual(report['mb_per_s'], 10 / 101)
+        self.assertIn('server: p50 4.50s', str(summary))
+
+class TestJsonLinesSink(unittest.TestCase):
+    '''Tests the JsonLinesSink class.'''
+    def test_lines(self):
+        '''Tests each event is written as a JSON line, and batches are appended.'''
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'events.jsonl'
+            for _ in range(2):
+                with JsonLinesSink(path) as sink:
+                    Events(sink).emit('r', Stage.TRANSFER_END, 42)
+            lines = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['stage'], 'transfer_end')
+        self.assertEqual(lines[0]['bytes'], 42)
+
+class TestRequestEvents(unittest.TestCase):
+    '''Tests the events emitted by requests.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+        patcher = mock.patch.object(cds, 'POLL_INTERVAL', 0.05)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_download_requests(self):
+        '''Tests every stage is emitted in order, through the CDS client, for each request.'''
+        received = []
+        events = Events(received.append)
+        requests = small_requests(2)
+        with FakeCDSServer(latency=0.3) as server:
+            cds.download_requests(requests, self.base, max_workers=2,
+                                  provider=server.provider(), events=events)
+        stages = [e.stage for e in received if e.request == requests[0].label()]
+        self.assertEqual(stages, [Stage.SUBMIT, Stage.QUEUED, Stage.RUNNING, Stage.COMPLETED,
+                                  Stage.TRANSFER_START, Stage.TRANSFER_END,
+                                  Stage.EXTRACT_START, Stage.EXTRACT_END, Stage.DONE])
+        report = events.summary.report()
+        self.assertEqual(report['requests'], 2)
+        self.assertGreaterEqual(report['stages']['total']['p50'], 0.3)
+        self.assertIn('run', report['stages'])
+        self.assertEqual(report['bytes'], sum(Path(r.file_chain[0]).stat().st_size
+                                              for r in requests))
+
+    def test_errors(self):
+        '''Tests a failed request finishes with an error event.'''
+        events = Events()
+        requests = small_requests(1)
+        with fake_cds(FakeClient(fail=True)):
+            cds.download_requests(requests, self.base, events=events)
+        self.assertEqual(list(events.summary.events[requests[0].label()]),
+                         [Stage.SUBMIT, Stage.ERROR])
+
+    def test_locations(self):
+        '''Tests requests that differ only by area are summarised separately.'''
+        events = Events()
+        requests = [cds.CMIP6Request(location=location) for location in ((2, 100, 0, 102),
+                                                                          (12, 100, 10, 102))]
+        with fake_cds(FakeClient()):
+            for i, r in enumerate(requests):
+                directory = Path(self.base) / str(i)
+                directory.mkdir()
+                r.download(str(directory), events=events)
+        self.assertNotEqual(requests[0].label(), requests[1].label())
+        self.assertEqual(events.summary.report()['requests'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+'''Tests the copernicus retry module.'''
+
+import errno
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+import requests as http
+
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import ResponseCache
+from climate_data.copernicus.fake_server import FakeCDSServer
+from climate_data.copernicus.retry import Failure, Retry, classify
+from climate_data.copernicus.scheduler import Scheduler
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_cds_request import small_requests
+
+def http_error(code: int) -> http.HTTPError:
+    '''Builds a requests error with a status code.'''
+    response = http.Response()
+    response.status_code = code
+    return http.HTTPError(f'{code} error', response=response)
+
+class TestClassify(unittest.TestCase):
+    '''Tests the classify function.'''
+    def test_kinds(self):
+        '''Tests network, quota, invalid request and local errors are told apart.'''
+        cases = {
+            Failure.TRANSIENT: [http.ConnectionError('reset'), http.ReadTimeout('slow'),
+                                ConnectionError('Transfer incomplete'), zipfile.BadZipFile('crc'),
+                                Exception('The job has failed. Simulated server error.'),
+                                RuntimeError('CDS job job-1 is failed.')],
+            Failure.QUOTA: [http_error(429), http_error(503), Exception('Could not connect'),
+                            RuntimeError('Too many queued requests.')],
+            Failure.INVALID: [http_error(400), http_error(404),
+                              RuntimeError('The request you have submitted is not valid.'),
+                              RuntimeError('No data available for the requested model.'),
+                              ValueError('Unknown CDS job state: x.')],
+            Failure.LOCAL: [FileExistsError('exists'), PermissionError('denied'),
+                            OSError(errno.ENOSPC, 'No space left on device')]}
+        for failure, errors in cases.items():
+            for error in errors:
+                self.assertEqual(classify(error), failure, repr(error))
+
+class TestRetry(unittest.TestCase):
+    '''Tests the Retry class.'''
+    def test_delays(self):
+        '''Tests delays double, are jittered, and stop after max_attempts.'''
+        retry = Retry(max_attempts=3, base_delay=1.0, quota_delay=10.0, seed=0)
+        first = retry.delay(http.ConnectionError(), 1, elapsed=2.0)
+        second = retry.delay(http.ConnectionError(), 2)
+        self.assertTrue(0.5 <= first <= 1.0)
+        self.assertTrue(1.0 <= second <= 2.0)
+        self.assertIsNone(retry.delay(http.ConnectionError(), 3))
+        self.assertTrue(5.0 <= retry.delay(http_error(429), 1) <= 10.0)
+        self.assertEqual(retry.retries, 3)
+        self.assertEqual(retry.given_up, 1)
+        self.assertGreater(retry.wasted, 2.0 + first + second)
+
+    def test_fail_fast_and_budget(self):
+        '''Tests invalid and local errors are not retried, and the budget caps retries.'''
+        retry = Retry(budget=2, base_delay=0.0)
+        self.assertIsNone(retry.delay(ValueError('bad'), 1))
+        self.assertIsNone(retry.delay(FileExistsError('exists'), 1))
+        self.assertIsNotNone(retry.delay(http.ConnectionError(), 1))
+        self.assertIsNotNone(retry.delay(http.ConnectionError(), 1))
+        self.assertIsNone(retry.delay(http.ConnectionError(), 1))
+        report = retry.report()
+        self.assertEqual(report['failures'], {'transient': 3, 'quota': 0, 'invalid': 1, 'local': 1})
+        self.assertEqual(report['given_up'], 3)
+
+class TestDownloadRetries(unittest.TestCase):
+    '''Tests retries of download_requests.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_transient_failures(self):
+        '''Tests failed jobs are retried until they succeed, serially and scheduled.'''
+        for scheduler in (None, Scheduler(poll_interval=0.02)):
+            with self.subTest(scheduler=scheduler), tempfile.TemporaryDirectory() as base:
+                requests = small_requests(4)
+                retry = Retry(max_attempts=8, base_delay=0.01, seed=0)
+                with FakeCDSServer(failure_rate=0.5, seed=1) as server:
+                    cds.download_requests(requests, base, max_workers=2, retry=retry,
+                                          scheduler=scheduler, provider=server.provider())
+                self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+                self.assertGreater(retry.recovered, 0)
+                self.assertEqual(retry.retries, retry.failures[Failure.TRANSIENT])
+                self.assertEqual(server.submitted, 4 + retry.retries)
+
+    def test_corrupt_results(self):
+        '''Tests corrupt zips are recorded as transient failures, removed, and retried.'''
+        for scheduler in (None, Scheduler(poll_interval=0.02)):
+            with self.subTest(scheduler=scheduler), tempfile.TemporaryDirectory() as base:
+                requests = small_requests(2)
+                retry = Retry(max_attempts=2, base_delay=0.01)
+                with FakeCDSServer(payload=b'not a zip' * 100) as server:
+                    paths = cds.download_requests(requests, base, max_workers=2, retry=retry,
+                                                  scheduler=scheduler, provider=server.provider())
+                self.assertEqual(paths, ['', ''])
+                self.assertTrue(all(isinstance(r.error, zipfile.BadZipFile) for r in requests))
+                self.assertEqual(retry.failures[Failure.TRANSIENT], 4)
+                self.assertEqual(server.submitted, 4)
+                self.assertEqual(list(Path(base).rglob('*.zip')), [])
+
+    def test_corrupt_results_not_cached(self):
+        '''Tests corrupt zips are removed from the cache, so each retry is sent to the CDS.'''
+        for scheduler in (None, Scheduler(poll_interval=0.02)):
+            with self.subTest(scheduler=scheduler), tempfile.TemporaryDirectory() as base:
+                cache = ResponseCache(Path(base) / 'cache')
+                requests = small_requests(2)
+                retry = Retry(max_attempts=2, base_delay=0.01)
+                with FakeCDSServer(payload=b'not a zip' * 100) as server:
+                    cds.download_requests(requests, base, max_workers=2, retry=retry, cache=cache,
+                                          scheduler=scheduler, provider=server.provider())
+                self.assertEqual(server.submitted, 4)
+                self.assertEqual(cache.hits, 0)
+                self.assertEqual(list((Path(base) / 'cache').glob('*.zip')), [])
+
+    def test_invalid_requests_fail_fast(self):
+        '''Tests invalid requests are not retried.'''
+        requests = small_requests(2)
+        retry = Retry(base_delay=0.01)
+        client = FakeClient(fail=True)
+        with fake_cds(client):
+            paths = cds.download_requests(requests, self.base, retry=retry)
+        self.assertEqual(paths, ['', ''])
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(retry.retries, 0)
+        self.assertEqual(requests[0].failure, Failure.INVALID)
+
+if __name__ == '__main__':
+    unittest.main()
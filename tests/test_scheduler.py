@@ -0,0 +1,137 @@
+'''Tests the copernicus scheduler module.'''
+
+import tempfile
+import unittest
+from pathlib import Path
+
+import requests as http
+
+import climate_data.copernicus.cmip6 as cmip6
+import climate_data.copernicus.request as cds
+from climate_data.copernicus.cache import ResponseCache, Source
+from climate_data.copernicus.fake_server import FakeCDSServer
+from climate_data.copernicus.manifest import Manifest
+from climate_data.copernicus.scheduler import Order, Scheduler, is_throttled
+
+from tests.fakes import FakeClient, fake_cds
+from tests.test_cds_request import small_requests
+
+def sized_requests() -> list[cds.CMIP6Request]:
+    '''Builds three requests (of distinct models), of 4, 1 and 9 one degree cells.'''
+    return [cds.CMIP6Request(model, years=cmip6.HISTORY_YEARS[0:2], location=location)
+            for model, location in zip((cmip6.Models.E3SM_1_0, cmip6.Models.E3SM_1_1,
+                                        cmip6.Models.E3SM_1_1_ECA),
+                                       ((2, 0, 0, 2), (1, 0, 0, 1), (3, 0, 0, 3)))]
+
+class TestIsThrottled(unittest.TestCase):
+    '''Tests the is_throttled function.'''
+    def test_errors(self):
+        '''Tests quota and server errors are told apart from invalid requests.'''
+        response = http.Response()
+        response.status_code = 503
+        self.assertTrue(is_throttled(http.HTTPError(response=response)))
+        self.assertTrue(is_throttled(Exception('Could not connect')))
+        self.assertTrue(is_throttled(RuntimeError('429 Client Error: Too Many Requests')))
+        self.assertFalse(is_throttled(RuntimeError('The request you have submitted is not valid.')))
+        self.assertFalse(is_throttled(None))
+
+class TestScheduler(unittest.TestCase):
+    '''Tests the Scheduler class.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_order(self):
+        '''Tests requests are submitted by priority, then smallest first.'''
+        client = FakeClient()
+        requests = sized_requests()
+        requests[2].priority = -1
+        with fake_cds(client):
+            cds.download_requests(requests, self.base,
+                                  scheduler=Scheduler(max_in_flight=1, poll_interval=0.01))
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertEqual([c['area'] for c in client.calls],
+                         [(3, 0, 0, 3), (1, 0, 0, 1), (2, 0, 0, 2)])
+        client.calls.clear()
+        with fake_cds(client):
+            Scheduler(1, order=Order.LARGEST_FIRST, poll_interval=0.01).run(
+                sized_requests(), [self.base] * 3)
+        self.assertEqual([c['area'] for c in client.calls],
+                         [(3, 0, 0, 3), (2, 0, 0, 2), (1, 0, 0, 1)])
+
+    def test_quota(self):
+        '''Tests the in-flight limit adapts to the server quota, and every request succeeds.'''
+        requests = small_requests(6)
+        scheduler = Scheduler(max_in_flight=4, poll_interval=0.05, backoff=0.1)
+        with FakeCDSServer(latency=0.2, max_queued=2) as server:
+            cds.download_requests(requests, self.base, provider=server.provider(retry_max=1),
+                                  scheduler=scheduler)
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertGreater(server.rejected, 0)
+        self.assertEqual(scheduler.throttled, server.rejected)
+        self.assertLessEqual(scheduler.lowest_limit, 2)
+        self.assertEqual(server.peak_active, 2)
+        self.assertEqual(scheduler.submitted, 6 + server.rejected)
+
+    def test_poll_backoff(self):
+        '''Tests each job is polled less often the longer it runs, up to max_poll_interval.'''
+        client = FakeClient(duration=0.5)
+        requests = small_requests(2)
+        scheduler = Scheduler(poll_interval=0.01, max_poll_interval=0.1)
+        with fake_cds(client):
+            cds.download_requests(requests, self.base, scheduler=scheduler)
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        updates = [job.updates for job in client.jobs.values()]
+        self.assertEqual(sum(updates), scheduler.polls)
+        self.assertTrue(all(5 < n < 15 for n in updates)) # not ~50 at a fixed interval.
+
+    def test_gives_up(self):
+        '''Tests a request throttled more than max_throttles times is recorded as an error.'''
+        requests = small_requests(1)
+        scheduler = Scheduler(poll_interval=0.01, backoff=0.01, max_throttles=2)
+        with FakeCDSServer(max_queued=0) as server:
+            paths = cds.download_requests(requests, self.base, scheduler=scheduler,
+                                          provider=server.provider(retry_max=1))
+        self.assertEqual(paths, [''])
+        self.assertEqual(requests[0].status, cds.Status.ERROR)
+        self.assertEqual(server.rejected, 3)
+
+    def test_cache(self):
+        '''Tests cache hits are served without a CDS job, and unzipped.'''
+        client = FakeClient()
+        with tempfile.TemporaryDirectory() as other, fake_cds(client):
+            cache = ResponseCache(Path(other) / 'cache')
+            cds.download_requests(small_requests(2), other, cache=cache)
+            requests = small_requests(2)
+            paths = cds.download_requests(requests, self.base, cache=cache,
+                                          scheduler=Scheduler(poll_interval=0.01))
+        self.assertEqual(len(client.calls), 2)
+        self.assertTrue(all(r.status == cds.Status.SUCCESS for r in requests))
+        self.assertTrue(all(r.source == Source.CACHE for r in requests))
+        self.assertTrue(all(Path(p).suffix == '.nc' and Path(p).exists() for p in paths))
+
+    def test_existing_files(self):
+        '''Tests a rerun records existing files as errors, without submitting jobs.'''
+        client = FakeClient()
+        with tempfile.TemporaryDirectory() as other, fake_cds(client):
+            cache = ResponseCache(Path(other) / 'cache')
+            cds.download_requests(small_requests(2), self.base, cache=cache)
+            for cached in (cache, None):
+                requests = small_requests(2)
+                paths = cds.download_requests(requests, self.base, cache=cached,
+                                              scheduler=Scheduler(poll_interval=0.01))
+                self.assertEqual(paths, ['', ''])
+                self.assertTrue(all(isinstance(r.error, FileExistsError) for r in requests))
+        self.assertEqual(len(client.calls), 2)
+
+    def test_manifest(self):
+        '''Tests a manifest is refused.'''
+        with Manifest(self.base) as manifest, self.assertRaises(ValueError):
+            cds.download_requests(small_requests(1), self.base, manifest=manifest,
+                                  scheduler=Scheduler())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+'''Tests the copernicus subset module.'''
+
+import zipfile
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from climate_data.copernicus.subset import select, subset_zip
+
+def monthly_dataset(years: tuple[int, int] = (1850, 1853),
+                    lats: tuple[float, float] = (0.5, 29.5),
+                    lons: tuple[float, float] = (90.5, 119.5)) -> xr.Dataset:
+    '''Builds a small one degree monthly tas dataset.'''
+    time = pd.date_range(f'{years[0]}-01-01', f'{years[1]}-12-31', freq='MS')
+    lat = np.arange(lats[0], lats[1] + 1)
+    lon = np.arange(lons[0], lons[1] + 1)
+    data = np.arange(time.size * lat.size * lon.size, dtype='float32')
+    return xr.Dataset(
+        {'tas': (('time', 'lat', 'lon'), data.reshape(time.size, lat.size, lon.size))},
+        coords={'time': time, 'lat': lat, 'lon': lon})
+
+def write_zip(ds: xr.Dataset, path: Path) -> Path:
+    '''Writes the dataset into a zip, like a CDS response.'''
+    nc = path.with_suffix('.nc')
+    ds.to_netcdf(nc)
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        zip_ref.write(nc, 'tas_data.nc')
+    nc.unlink()
+    return path
+
+class TestSelect(unittest.TestCase):
+    '''Tests the select function.'''
+    def test_location_and_time(self):
+        '''Tests bounding box, year and month selection.'''
+        ds = select(monthly_dataset(), location=(23, 100, 13, 108),
+                    years=('1851', '1852'), months=('01', '07'))
+        self.assertEqual(ds.sizes['lat'], 10)
+        self.assertEqual(ds.sizes['lon'], 8)
+        self.assertEqual(ds.sizes['time'], 4)
+        self.assertEqual(sorted(set(ds.time.dt.year.values)), [1851, 1852])
+
+    def test_0_360_longitudes(self):
+        '''Tests -180 to 180 bounding boxes select from 0 to 360 longitudes.'''
+        ds = monthly_dataset(lons=(0.5, 359.5))
+        cut = select(ds, location=(10, -5, 0, 5))
+        self.assertEqual(cut.sizes['lon'], 10)
+        self.assertTrue(((cut.lon < 5) | (cut.lon > 355)).all())
+
+class TestSubsetZip(unittest.TestCase):
+    '''Tests the subset_zip function.'''
+    def test_subset_zip(self):
+        '''Tests a CDS response zip is cut by a request payload.'''
+        with tempfile.TemporaryDirectory() as tmp:
+            source = write_zip(monthly_dataset(), Path(tmp) / 'big.zip')
+            target = Path(tmp) / 'small.zip'
+            subset_zip(source, target, {'area': (10, 95, 5, 100), 'year': ['1850']})
+            with zipfile.ZipFile(target) as zip_ref:
+                self.assertEqual(zip_ref.namelist(), ['small.nc'])
+                zip_ref.extract('small.nc', tmp)
+            with xr.open_dataset(Path(tmp) / 'small.nc') as ds:
+                self.assertEqual(dict(ds.sizes), {'time': 12, 'lat': 5, 'lon': 5})
@@ -0,0 +1,69 @@
+'''Tests the copernicus transfer module.'''
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import climate_data.copernicus.transfer as transfer
+
+from tests.fakes import FlakyFileServer
+
+PAYLOAD = bytes(range(256)) * 4096 # 1 MB
+
+class TestDownloadUrl(unittest.TestCase):
+    '''Tests the download_url function.'''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.target = Path(self.tmp.name) / 'result.zip'
+        patcher = mock.patch.object(transfer, 'RETRY_SECONDS', 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume_after_drops(self):
+        '''Tests dropped connections are resumed with Range requests.'''
+        with FlakyFileServer(PAYLOAD, drops=2, drop_after=300_000) as server:
+            transfer.download_url(server.url, self.target, len(PAYLOAD), chunk_size=4096)
+        self.assertEqual(self.target.read_bytes(), PAYLOAD)
+        # resumed from the last full chunk written before each drop.
+        self.assertEqual(len(server.range_requests), 2)
+        offsets = [int(r.split('=')[1].rstrip('-')) for r in server.range_requests]
+        self.assertTrue(0 < offsets[0] <= 300_000 < offsets[1] <= 600_000)
+        self.assertFalse(transfer.part_path(self.target).exists())
+        self.assertFalse(transfer.meta_path(self.target).exists())
+
+    def test_resume_existing_part(self):
+        '''Tests a .part file from the same url is resumed, after a restart.'''
+        with FlakyFileServer(PAYLOAD) as server:
+            transfer.part_path(self.target).write_bytes(PAYLOAD[:1000])
+            transfer.meta_path(self.target).write_text(json.dumps({'url': server.url}))
+            transfer.download_url(server.url, self.target, len(PAYLOAD))
+        self.assertEqual(server.range_requests, ['bytes=1000-'])
+        self.assertEqual(self.target.read_bytes(), PAYLOAD)
+
+    def test_stale_part_restarts(self):
+        '''Tests a .part file from a different url is discarded.'''
+        transfer.part_path(self.target).write_bytes(b'x' * 1000)
+        transfer.meta_path(self.target).write_text(json.dumps({'url': 'http://old'}))
+        with FlakyFileServer(PAYLOAD) as server:
+            transfer.download_url(server.url, self.target, len(PAYLOAD))
+        self.assertEqual(server.range_requests, [])
+        self.assertEqual(self.target.read_bytes(), PAYLOAD)
+
+    def test_gives_up(self):
+        '''Tests the partial file is kept, and not renamed, when attempts run out.'''
+        with FlakyFileServer(PAYLOAD, drops=10, drop_after=1000) as server:
+            with self.assertRaises(ConnectionError):
+                transfer.download_url(server.url, self.target, len(PAYLOAD), max_tries=3)
+        self.assertFalse(self.target.exists())
+        self.assertLess(transfer.part_path(self.target).stat().st_size, len(PAYLOAD))
+
+    def test_range_ignored(self):
+        '''Tests a server that ignores Range requests restarts the transfer.'''
+        with FlakyFileServer(PAYLOAD, drops=1, drop_after=1000, ranges=False) as server:
+            transfer.download_url(server.url, self.target, len(PAYLOAD))
+        self.assertEqual(self.target.read_bytes(), PAYLOAD)